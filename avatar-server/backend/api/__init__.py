@@ -1,8 +1,12 @@
 # avatar-server/backend/api/__init__.py
 from .chat import router as chat_router
 from .webrtc import router as webrtc_router
+from .health import router as health_router
+from .metrics import router as metrics_router
 
 __all__ = [
     "chat_router",
-    "webrtc_router"
+    "webrtc_router",
+    "health_router",
+    "metrics_router"
 ]
\ No newline at end of file
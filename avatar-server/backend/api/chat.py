@@ -1,61 +1,115 @@
 # avatar-server/backend/api/chat.py
-from fastapi import APIRouter, HTTPException, Response
-from typing import List, Dict
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse, FileResponse
+from starlette.background import BackgroundTask
+from typing import List, Dict, AsyncIterator, Optional, Tuple
 import os
+import json
+import contextlib
+import time
+import anyio
+from dataclasses import asdict
+from email.utils import formatdate
 from urllib.parse import unquote
 from pathlib import Path
 import httpx  # <-- ЭТОТ ИМПОРТ БЫЛ ДОБАВЛЕН (ОБЯЗАТЕЛЬНО!)
 
 from core.config import settings
-from services import llm, chat_history, tts
-from models.chat import ChatRequest, ChatResponse, ChatMessage
+from core.http_clients import get_tts_client
+from core.metrics import AUDIO_PROXY_BYTES, STAGE_LATENCY, UPSTREAM_ERRORS, track_stage
+from services import llm, chat_history, tts, context
+from services.speech_pipeline import SpeechPipeline
+from services.response_cache import response_cache
+from services.scheduler import get_scheduler, OverloadedError, RequestCancelled
+from models.chat import ChatRequest, ChatResponse, ChatMessage, HistoryPage
 
 router = APIRouter()
 
 @router.post("/api/chat", response_model=ChatResponse)
-async def chat_endpoint(request: ChatRequest):
+async def chat_endpoint(request: ChatRequest, http_request: Request):
     """
     Обрабатывает запрос чата:
-    1. Сохраняет пользовательское сообщение
-    2. Получает ответ от LLM
-    3. Сохраняет ответ
-    4. Генерирует аудио (если возможно)
-    5. Возвращает ответ с историей
+    1. Подбирает контекст (история в пределах бюджета токенов + резюме)
+    2. Сохраняет пользовательское сообщение
+    3. Получает ответ от LLM (через очередь к модели; при перегрузке — 429)
+    4. Сохраняет ответ
+    5. Генерирует аудио (если возможно)
+    6. Возвращает ответ с историей (или только новыми сообщениями,
+       если клиент передал since_ts)
     """
     try:
-        # Сохраняем сообщение пользователя
-        chat_history.save_message(request.session_id, "user", request.message)
-        
-        # Получаем историю чата
-        history = chat_history.get_history(
-            request.session_id, 
-            limit=settings.HISTORY_LIMIT
-        )
+        history, context_messages, summary = await _prepare_context(request)
+        cache_key, cached, embedding = await _lookup_response(request, context_messages, summary)
         
-        # Получаем ответ от LLM
-        assistant_text = await llm.get_llm_response(
-            message=request.message,
-            history=history,
-            system_prompt=request.system_prompt,
-            temperature=request.temperature,
-            model=request.model
-        )
+        # Получаем ответ из кэша ответов или от LLM
+        if cached is not None:
+            user_message = await chat_history.save_message_async(
+                request.session_id, "user", request.message
+            )
+            assistant_text = cached.text
+        else:
+            # Место в очереди занимаем до сохранения вопроса: отклонённый
+            # запрос не оставляет следов в истории
+            async with get_scheduler(request.model).slot(
+                request.session_id,
+                timeout=settings.LLM_QUEUE_TIMEOUT,
+                is_disconnected=http_request.is_disconnected
+            ):
+                user_message = await chat_history.save_message_async(
+                    request.session_id, "user", request.message
+                )
+                with track_stage("llm"):
+                    assistant_text = await llm.get_llm_response(
+                        message=request.message,
+                        history=context_messages,
+                        system_prompt=request.system_prompt,
+                        temperature=request.temperature,
+                        model=request.model,
+                        summary=summary
+                    )
         
         # Сохраняем ответ ассистента
-        chat_history.save_message(request.session_id, "assistant", assistant_text)
+        assistant_message = await chat_history.save_message_async(
+            request.session_id, "assistant", assistant_text
+        )
         
-        # Генерируем аудио (если возможно)
-        audio_url = None
+        # Генерируем аудио (если возможно); для ответа из кэша TTS-сервер
+        # отдаёт уже синтезированный файл из своего кэша
+        audio_url, lipsync = None, None
         if settings.TTS_URL:
-            audio_url = await tts.generate_audio(assistant_text)
+            speech = await tts.generate_speech(
+                assistant_text,
+                request.audio_format,
+                request.audio_sample_rate
+            )
+            if speech:
+                audio_url, lipsync = speech["audio_url"], speech["lipsync"]
         
-        # Формируем ответ
-        return ChatResponse(
-            text=assistant_text,
-            history=[msg.dict() for msg in chat_history.get_history(request.session_id)],
-            audio_url=audio_url
-        )
+        if cache_key is not None:
+            response_cache.store(cache_key, assistant_text, embedding)
         
+        # История для ответа собирается из уже полученной, без повторного запроса
+        with track_stage("history_serialize"):
+            messages = history + [user_message, assistant_message]
+            if request.since_ts is not None:
+                messages = [msg for msg in messages if msg.ts > request.since_ts]
+            else:
+                messages = messages[-settings.HISTORY_LIMIT:]
+            
+            # Формируем ответ
+            return ChatResponse(
+                text=assistant_text,
+                history=[msg.dict() for msg in messages],
+                audio_url=audio_url,
+                lipsync=lipsync,
+                last_ts=assistant_message.ts
+            )
+    
+    except OverloadedError as e:
+        raise _overloaded(e)
+    except RequestCancelled:
+        # Клиент отключился, пока ждал очереди: отвечать некому
+        return _ClientGone()
     except ConnectionError as e:
         raise HTTPException(
             status_code=503, 
@@ -67,65 +121,427 @@ async def chat_endpoint(request: ChatRequest):
             detail=f"Internal server error: {str(e)}"
         )
 
-# Прокси для аудиофайлов с TTS-сервера
-@router.get("/tts-audio/{filename:path}")
-async def proxy_tts_audio(filename: str):
+@router.get("/api/history/{session_id}", response_model=HistoryPage)
+async def history_endpoint(
+    session_id: str,
+    before: Optional[float] = None,
+    limit: int = Query(50, ge=1)
+):
+    """
+    Полная история сессии постранично (для перезагрузки страницы).
+    Страницы идут от новых к старым: next_before передаётся как before.
+    """
+    limit = min(limit, settings.HISTORY_PAGE_MAX)
+    messages = await chat_history.get_history_page_async(session_id, before, limit)
+    next_before = messages[0].ts if len(messages) == limit else None
+    return HistoryPage(messages=messages, next_before=next_before)
+
+async def _prepare_context(
+    request: ChatRequest
+) -> Tuple[List[ChatMessage], List[ChatMessage], Optional[str]]:
+    """
+    Читает историю до сохранения текущего вопроса (он передаётся в промпт
+    отдельно) и подбирает из неё контекст под бюджет токенов.
+    Возвращает (история, контекст для LLM, резюме старой части).
+    """
+    with track_stage("context"):
+        history = await chat_history.get_history_async(
+            request.session_id,
+            limit=max(settings.CONTEXT_MAX_MESSAGES, settings.HISTORY_LIMIT)
+        )
+        context_messages, summary = await context.build_context(
+            request.session_id,
+            request.message,
+            history,
+            request.system_prompt
+        )
+    return history, context_messages, summary
+
+class _ClientGone(Response):
     """
-    Проксирует запросы к аудиофайлам с TTS-сервера с защитой от path traversal
+    Пустой ответ для отключившегося клиента: ничего не отправляет, и
+    сервер просто закрывает запрос без статуса (метрики считают его
+    как cancelled, а не как ошибку клиента)
+    """
+    
+    async def __call__(self, scope, receive, send):
+        return
+
+def _overloaded(error: OverloadedError) -> HTTPException:
+    return HTTPException(
+        status_code=429,
+        detail=str(error),
+        headers={"Retry-After": str(error.retry_after)}
+    )
+
+async def _lookup_response(
+    request: ChatRequest,
+    context_messages: List[ChatMessage],
+    summary: Optional[str]
+):
     """
+    Ищет ответ в кэше, если запрос подходит для кэширования.
+    Возвращает (ключ или None, запись или None, вектор вопроса).
+    """
+    has_context = bool(context_messages or summary)
+    if not response_cache.eligible(request.temperature, has_context):
+        return None, None, None
+    with track_stage("response_cache"):
+        return await response_cache.lookup(
+            request.message,
+            request.system_prompt,
+            request.model,
+            request.temperature,
+            context_messages,
+            summary
+        )
+
+def _sse(event: str, data: dict) -> str:
+    """Форматирует одно событие Server-Sent Events"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def _speech_pipeline(request: ChatRequest) -> SpeechPipeline:
+    return SpeechPipeline(
+        audio_format=request.audio_format,
+        sample_rate=request.audio_sample_rate
+    )
+
+async def _chat_event_stream(request: ChatRequest) -> AsyncIterator[str]:
+    """
+    Генератор событий для потокового чата:
+    - token   — очередной фрагмент ответа LLM
+    - audio   — очередной озвученный сегмент (строго по порядку index)
+    - replace — ответ ушёл в другой язык, клиент должен заменить текст
+                и сбросить уже полученные аудиосегменты
+    - done    — итоговый текст и плейлист аудио
+    - error   — ошибка после начала потока (HTTP-статус уже отправлен)
+    """
+    # Предложения уходят на синтез, пока LLM генерирует следующие
+    speech = _speech_pipeline(request) if settings.TTS_URL else None
+    scheduler = get_scheduler(request.model)
+    slot_started = None
+    
     try:
-        # Декодируем URL-encoded имя файла
-        filename = unquote(filename)
-        
-        # Проверка на безопасность пути (защита от path traversal)
-        if ".." in filename or filename.startswith("/") or filename.startswith("\\"):
-            raise HTTPException(
-                status_code=400, 
-                detail="Invalid filename"
-            )
-        
-        # Проверяем расширение файла
-        if not filename.lower().endswith(('.wav', '.mp3', '.ogg')):
-            raise HTTPException(
-                status_code=400, 
-                detail="Unsupported audio format"
-            )
+        _, context_messages, summary = await _prepare_context(request)
+        cache_key, cached, embedding = await _lookup_response(request, context_messages, summary)
         
-        # Формируем безопасный путь
-        safe_filename = os.path.basename(filename)
-        
-        # Запрос к TTS-серверу
-        async with httpx.AsyncClient(timeout=10) as client:
-            response = await client.get(f"{settings.TTS_URL}/audio/{safe_filename}")
-            
-            # Проверяем статус ответа
-            if response.status_code != 200:
-                raise HTTPException(
-                    status_code=response.status_code,
-                    detail=f"TTS server error: {response.text}"
-                )
+        if cached is not None:
+            # Ответ из кэша отдаётся целиком; озвучка предложений, как правило,
+            # уже лежит в кэше TTS-сервера
+            await chat_history.save_message_async(request.session_id, "user", request.message)
+            await chat_history.save_message_async(request.session_id, "assistant", cached.text)
+            yield _sse("token", {"text": cached.text})
             
-            # Определяем Content-Type на основе расширения
-            content_type = "audio/wav"
-            if safe_filename.lower().endswith(".mp3"):
-                content_type = "audio/mpeg"
-            elif safe_filename.lower().endswith(".ogg"):
-                content_type = "audio/ogg"
+            cached_urls: List[str] = []
+            if speech:
+                speech.feed(cached.text)
+                async for segment in speech.finish():
+                    yield _sse("audio", asdict(segment))
+                    if segment.audio_url:
+                        cached_urls.append(segment.audio_url)
             
-            # Возвращаем аудио с правильным Content-Type
+            yield _sse("done", {"text": cached.text, "audio_urls": cached_urls})
+            return
+        
+        # Ждём место в очереди к модели; при отключении клиента StreamingResponse
+        # отменяет генератор, и ожидание снимается с очереди
+        await scheduler.acquire(request.session_id, timeout=settings.LLM_QUEUE_TIMEOUT)
+        slot_started = time.monotonic()
+        
+        # Сохраняем сообщение пользователя
+        await chat_history.save_message_async(request.session_id, "user", request.message)
+        
+        parts: List[str] = []
+        audio_urls: List[str] = []
+        replacement = None
+        guard = llm.LanguageGuard(request.message)
+        llm_started = time.perf_counter()
+        
+        # aclosing: при break генератор закрывается сразу (вместе с HTTP-потоком
+        # Ollama), а не когда его соберёт сборщик мусора
+        stream = llm.stream_llm_response(
+            message=request.message,
+            history=context_messages,
+            system_prompt=request.system_prompt,
+            temperature=request.temperature,
+            model=request.model,
+            summary=summary
+        )
+        async with contextlib.aclosing(stream):
+            async for token in stream:
+                if not parts:
+                    # Время до первого токена (TTFT) — главная задержка для пользователя
+                    STAGE_LATENCY.labels("llm_first_token").observe(time.perf_counter() - llm_started)
+                parts.append(token)
+                
+                # Проверяем язык по мере накопления текста (каждый токен считается один раз)
+                if settings.FORCE_RUSSIAN:
+                    replacement = guard.feed(token)
+                    if replacement is not None:
+                        # Прерываем генерацию: aclosing закроет поток Ollama сразу
+                        break
+                
+                yield _sse("token", {"text": token})
+                
+                if speech:
+                    speech.feed(token)
+                    for segment in speech.ready():
+                        yield _sse("audio", asdict(segment))
+                        if segment.audio_url:
+                            audio_urls.append(segment.audio_url)
+        
+        # Генерация закончена — слот нужен следующему запросу
+        STAGE_LATENCY.labels("llm").observe(time.perf_counter() - llm_started)
+        scheduler.release(time.monotonic() - slot_started)
+        slot_started = None
+        
+        if replacement is None:
+            # Финальная проверка полного ответа (короткие ответы не доходят
+            # до порога инкрементальной проверки)
+            raw_text = "".join(parts).strip()
+            assistant_text = raw_text
+            if settings.FORCE_RUSSIAN:
+                assistant_text = llm.ensure_russian_response(raw_text, request.message)
+                if assistant_text != raw_text:
+                    replacement = assistant_text
+        else:
+            assistant_text = replacement
+        
+        if replacement is not None:
+            # Озвучиваем только текст замены
+            yield _sse("replace", {"text": replacement})
+            if speech:
+                speech.cancel()
+                speech = _speech_pipeline(request)
+                speech.feed(replacement)
+                audio_urls = []
+        
+        # Сохраняем итоговый ответ ассистента
+        await chat_history.save_message_async(request.session_id, "assistant", assistant_text)
+        
+        if cache_key is not None:
+            response_cache.store(cache_key, assistant_text, embedding)
+        
+        # Дожидаемся оставшихся сегментов
+        if speech:
+            async for segment in speech.finish():
+                yield _sse("audio", asdict(segment))
+                if segment.audio_url:
+                    audio_urls.append(segment.audio_url)
+        
+        yield _sse("done", {"text": assistant_text, "audio_urls": audio_urls})
+    
+    except OverloadedError as e:
+        yield _sse("error", {"status": 429, "detail": str(e), "retry_after": e.retry_after})
+    except ConnectionError as e:
+        yield _sse("error", {"status": 503, "detail": f"Service unavailable: {str(e)}"})
+    except Exception as e:
+        yield _sse("error", {"status": 500, "detail": f"Internal server error: {str(e)}"})
+    finally:
+        if slot_started is not None:
+            scheduler.release(time.monotonic() - slot_started)
+        # Клиент отключился или произошла ошибка — синтез больше не нужен
+        if speech:
+            speech.cancel()
+
+@router.post("/api/chat/stream")
+async def chat_stream_endpoint(request: ChatRequest):
+    """
+    Потоковый вариант /api/chat (Server-Sent Events).
+    
+    Фрагменты ответа пересылаются клиенту сразу по мере генерации,
+    поэтому задержка до первого токена и есть видимая задержка ответа.
+    Переполненная очередь к модели отклоняется до начала потока (429).
+    """
+    try:
+        get_scheduler(request.model).check(request.session_id)
+    except OverloadedError as e:
+        raise _overloaded(e)
+    
+    return StreamingResponse(
+        _chat_event_stream(request),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# Заголовки, которые прокси передаёт TTS-серверу и обратно клиенту
+_UPSTREAM_REQUEST_HEADERS = ("range", "if-range", "if-none-match", "if-modified-since")
+_UPSTREAM_RESPONSE_HEADERS = (
+    "content-length", "content-range", "accept-ranges",
+    "etag", "last-modified", "cache-control"
+)
+_AUDIO_CHUNK_SIZE = 64 * 1024
+
+def _audio_content_type(filename: str) -> str:
+    """Определяет Content-Type на основе расширения"""
+    if filename.lower().endswith(".mp3"):
+        return "audio/mpeg"
+    if filename.lower().endswith(".ogg"):
+        return "audio/ogg"
+    return "audio/wav"
+
+def _parse_range(range_header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Разбирает одиночный диапазон "bytes=start-end"; None — если он некорректен"""
+    unit, _, spec = range_header.partition("=")
+    if unit.strip() != "bytes" or "," in spec:
+        return None
+    start_text, _, end_text = spec.strip().partition("-")
+    try:
+        if start_text:
+            start = int(start_text)
+            end = int(end_text) if end_text else size - 1
+        else:
+            # Суффикс: последние N байт
+            start = max(0, size - int(end_text))
+            end = size - 1
+    except ValueError:
+        return None
+    end = min(end, size - 1)
+    if start > end or start >= size:
+        return None
+    return start, end
+
+async def _iter_file(path: str, start: int, length: int) -> AsyncIterator[bytes]:
+    """Читает файл кусками фиксированного размера (память не зависит от размера файла)"""
+    async with await anyio.open_file(path, "rb") as f:
+        await f.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = await f.read(min(_AUDIO_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+async def _count_bytes(chunks: AsyncIterator[bytes], source: str) -> AsyncIterator[bytes]:
+    """Пропускает поток без изменений, считая отданные байты"""
+    async for chunk in chunks:
+        AUDIO_PROXY_BYTES.labels(source).inc(len(chunk))
+        yield chunk
+
+def _serve_audio_file(path: str, filename: str, request: Request) -> Response:
+    """Отдаёт аудио прямо с общего тома tts-cache с поддержкой 304 и Range"""
+    stat = os.stat(path)
+    etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+    headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(stat.st_mtime, usegmt=True),
+        "Cache-Control": settings.AUDIO_CACHE_CONTROL,
+        "Accept-Ranges": "bytes",
+        "Content-Disposition": f"inline; filename={filename}"
+    }
+    content_type = _audio_content_type(filename)
+    
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+    
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (if_range is None or if_range == etag):
+        byte_range = _parse_range(range_header, stat.st_size)
+        if byte_range is None:
             return Response(
-                content=response.content,
-                media_type=content_type,
-                headers={"Content-Disposition": f"inline; filename={safe_filename}"}
+                status_code=416,
+                headers={"Content-Range": f"bytes */{stat.st_size}"}
             )
-            
+        start, end = byte_range
+        length = end - start + 1
+        headers["Content-Range"] = f"bytes {start}-{end}/{stat.st_size}"
+        headers["Content-Length"] = str(length)
+        return StreamingResponse(
+            _count_bytes(_iter_file(path, start, length), "disk"),
+            status_code=206,
+            media_type=content_type,
+            headers=headers
+        )
+    
+    # Полный файл: FileResponse читает его кусками
+    AUDIO_PROXY_BYTES.labels("disk").inc(stat.st_size)
+    return FileResponse(path, media_type=content_type, headers=headers, stat_result=stat)
+
+# Прокси для аудиофайлов с TTS-сервера
+@router.get("/tts-audio/{filename:path}")
+async def proxy_tts_audio(filename: str, request: Request):
+    """
+    Проксирует запросы к аудиофайлам с TTS-сервера с защитой от path traversal.
+    
+    Тело ответа не буферизуется: байты передаются клиенту по мере получения,
+    Range и условные запросы пробрасываются на TTS-сервер. Если задан
+    TTS_CACHE_DIR (общий том с TTS-сервером), файл отдаётся прямо с диска.
+    """
+    # Декодируем URL-encoded имя файла
+    filename = unquote(filename)
+    
+    # Проверка на безопасность пути (защита от path traversal)
+    if ".." in filename or filename.startswith("/") or filename.startswith("\\"):
+        raise HTTPException(
+            status_code=400, 
+            detail="Invalid filename"
+        )
+    
+    # Проверяем расширение файла
+    if not filename.lower().endswith(('.wav', '.mp3', '.ogg')):
+        raise HTTPException(
+            status_code=400, 
+            detail="Unsupported audio format"
+        )
+    
+    # Формируем безопасный путь
+    safe_filename = os.path.basename(filename)
+    
+    # Файл уже есть на общем томе — обходимся без запроса к TTS-серверу
+    if settings.TTS_CACHE_DIR:
+        local_path = os.path.join(settings.TTS_CACHE_DIR, safe_filename)
+        if os.path.isfile(local_path):
+            return _serve_audio_file(local_path, safe_filename, request)
+    
+    try:
+        # Запрос к TTS-серверу в потоковом режиме
+        client = get_tts_client()
+        upstream_request = client.build_request(
+            "GET",
+            f"/audio/{safe_filename}",
+            headers={
+                name: request.headers[name]
+                for name in _UPSTREAM_REQUEST_HEADERS
+                if name in request.headers
+            },
+            timeout=settings.TTS_AUDIO_TIMEOUT
+        )
+        response = await client.send(upstream_request, stream=True)
     except httpx.RequestError as e:
+        UPSTREAM_ERRORS.labels("tts", "audio_connection").inc()
         raise HTTPException(
             status_code=502,
             detail=f"Failed to connect to TTS server: {str(e)}"
         )
-    except Exception as e:
+    
+    # Проверяем статус ответа
+    if response.status_code not in (200, 206, 304):
+        body = await response.aread()
+        await response.aclose()
         raise HTTPException(
-            status_code=500,
-            detail=f"Failed to proxy audio: {str(e)}"
-        )
\ No newline at end of file
+            status_code=response.status_code,
+            detail=f"TTS server error: {body.decode('utf-8', 'replace')}"
+        )
+    
+    headers = {
+        name: response.headers[name]
+        for name in _UPSTREAM_RESPONSE_HEADERS
+        if name in response.headers
+    }
+    headers.setdefault("cache-control", settings.AUDIO_CACHE_CONTROL)
+    headers["content-disposition"] = f"inline; filename={safe_filename}"
+    
+    if response.status_code == 304:
+        await response.aclose()
+        return Response(status_code=304, headers=headers)
+    
+    # Возвращаем аудио с правильным Content-Type, соединение закрывается после отправки
+    return StreamingResponse(
+        _count_bytes(response.aiter_raw(), "upstream"),
+        status_code=response.status_code,
+        media_type=_audio_content_type(safe_filename),
+        headers=headers,
+        background=BackgroundTask(response.aclose)
+    )
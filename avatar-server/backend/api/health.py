@@ -0,0 +1,19 @@
+# avatar-server/backend/api/health.py
+from fastapi import APIRouter
+
+from services import tts, llm
+from services.response_cache import response_cache
+from services.scheduler import get_scheduler_status
+
+router = APIRouter()
+
+@router.get("/api/health")
+async def health_endpoint():
+    """Состояние бэкенда и зависимых сервисов (без обращения к ним)"""
+    return {
+        "status": "ok",
+        "tts": tts.get_tts_status(),
+        "llm": llm.get_llm_status(),
+        "response_cache": response_cache.stats(),
+        "llm_queues": get_scheduler_status()
+    }
\ No newline at end of file
@@ -0,0 +1,11 @@
+# avatar-server/backend/api/metrics.py
+from fastapi import APIRouter, Response
+
+from core.metrics import render_metrics, METRICS_CONTENT_TYPE
+
+router = APIRouter()
+
+@router.get("/metrics", include_in_schema=False)
+async def metrics_endpoint():
+    """Метрики в формате Prometheus (задержки этапов, очереди, ошибки)"""
+    return Response(render_metrics(), media_type=METRICS_CONTENT_TYPE)
\ No newline at end of file
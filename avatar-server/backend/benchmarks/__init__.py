@@ -0,0 +1,2 @@
+# avatar-server/backend/benchmarks/__init__.py
+# Нагрузочные тесты и микробенчмарки бэкенда (запуск: python -m benchmarks.<модуль>)
\ No newline at end of file
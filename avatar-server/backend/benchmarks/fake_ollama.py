@@ -0,0 +1,104 @@
+# avatar-server/backend/benchmarks/fake_ollama.py
+"""
+Заглушка Ollama для нагрузочных тестов: /api/chat (потоковый и обычный),
+/api/embeddings, /api/tags. Скорость генерации задаётся переменными окружения:
+
+- BENCH_OLLAMA_TTFT_MS     — задержка до первого токена (обработка промпта)
+- BENCH_OLLAMA_TOKEN_RATE  — токенов в секунду (0 — без задержек)
+- BENCH_OLLAMA_TOKENS      — длина ответа в токенах
+- BENCH_OLLAMA_CONCURRENCY — сколько запросов модель обслуживает одновременно
+                             (остальные ждут, как у настоящей Ollama)
+
+Запуск: uvicorn benchmarks.fake_ollama:app --port 11434
+"""
+import os
+import json
+import time
+import asyncio
+import hashlib
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+TTFT = float(os.getenv("BENCH_OLLAMA_TTFT_MS", "150")) / 1000
+TOKEN_RATE = float(os.getenv("BENCH_OLLAMA_TOKEN_RATE", "40"))
+REPLY_TOKENS = int(os.getenv("BENCH_OLLAMA_TOKENS", "60"))
+CONCURRENCY = int(os.getenv("BENCH_OLLAMA_CONCURRENCY", "2"))
+
+# Ответ собирается из предложений, чтобы конвейер озвучки резал его как настоящий
+_WORDS = (
+    "Цифровой аватар отвечает на ваш вопрос. Это тестовый ответ для измерения задержек. "
+    "Каждое предложение уходит на синтез речи отдельно. Модель генерирует текст по токенам. "
+).split()
+
+app = FastAPI(title="Fake Ollama")
+_slots = asyncio.Semaphore(CONCURRENCY)
+
+def _reply_tokens(seed: str):
+    # Детерминированный сдвиг: разные вопросы — разные, но воспроизводимые ответы
+    offset = int(hashlib.md5(seed.encode("utf-8")).hexdigest(), 16) % len(_WORDS)
+    return [_WORDS[(offset + i) % len(_WORDS)] + " " for i in range(REPLY_TOKENS)]
+
+def _prompt_tokens(messages) -> int:
+    return sum(len(m.get("content", "")) for m in messages) // 3
+
+def _done_chunk(model: str, messages, started: float, first_token: float) -> dict:
+    now = time.perf_counter()
+    return {
+        "model": model,
+        "message": {"role": "assistant", "content": ""},
+        "done": True,
+        "total_duration": int((now - started) * 1e9),
+        "load_duration": 0,
+        "prompt_eval_count": _prompt_tokens(messages),
+        "prompt_eval_duration": int((first_token - started) * 1e9),
+        "eval_count": REPLY_TOKENS,
+        "eval_duration": int((now - first_token) * 1e9)
+    }
+
+async def _token_delay():
+    if TOKEN_RATE > 0:
+        await asyncio.sleep(1 / TOKEN_RATE)
+
+@app.post("/api/chat")
+async def chat(request: Request):
+    body = await request.json()
+    model = body.get("model", "llama3")
+    messages = body.get("messages", [])
+    tokens = _reply_tokens(messages[-1]["content"] if messages else "")
+    
+    if body.get("stream"):
+        async def generate():
+            async with _slots:
+                started = time.perf_counter()
+                await asyncio.sleep(TTFT)
+                first_token = time.perf_counter()
+                for token in tokens:
+                    chunk = {"model": model, "message": {"role": "assistant", "content": token}, "done": False}
+                    yield json.dumps(chunk, ensure_ascii=False) + "\n"
+                    await _token_delay()
+                yield json.dumps(_done_chunk(model, messages, started, first_token)) + "\n"
+        return StreamingResponse(generate(), media_type="application/x-ndjson")
+    
+    async with _slots:
+        started = time.perf_counter()
+        await asyncio.sleep(TTFT)
+        first_token = time.perf_counter()
+        if TOKEN_RATE > 0:
+            await asyncio.sleep(len(tokens) / TOKEN_RATE)
+        data = _done_chunk(model, messages, started, first_token)
+        data["message"]["content"] = "".join(tokens).strip()
+        return JSONResponse(data)
+
+@app.post("/api/embeddings")
+async def embeddings(request: Request):
+    body = await request.json()
+    # Мешок символов: похожие тексты дают близкие векторы
+    vector = [0.0] * 64
+    for char in body.get("prompt", "").lower():
+        vector[ord(char) % 64] += 1.0
+    return {"embedding": vector}
+
+@app.get("/api/tags")
+async def tags():
+    return {"models": [{"name": "llama3"}]}
\ No newline at end of file
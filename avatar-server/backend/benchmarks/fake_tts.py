@@ -0,0 +1,67 @@
+# avatar-server/backend/benchmarks/fake_tts.py
+"""
+Заглушка TTS-сервера для нагрузочных тестов: /health, /tts, /audio/<имя>.
+Время синтеза: BENCH_TTS_DELAY_MS + BENCH_TTS_MS_PER_CHAR на каждый символ;
+BENCH_TTS_CONCURRENCY ограничивает число одновременных синтезов.
+Аудио — тишина в WAV длиной, пропорциональной тексту.
+
+Запуск: uvicorn benchmarks.fake_tts:app --port 5002
+"""
+import io
+import os
+import wave
+import asyncio
+import hashlib
+from typing import Dict
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import Response
+
+DELAY = float(os.getenv("BENCH_TTS_DELAY_MS", "80")) / 1000
+PER_CHAR = float(os.getenv("BENCH_TTS_MS_PER_CHAR", "1")) / 1000
+CONCURRENCY = int(os.getenv("BENCH_TTS_CONCURRENCY", "2"))
+
+_SAMPLE_RATE = 24000
+# Примерно 15 символов в секунду речи
+_CHARS_PER_SECOND = 15
+
+app = FastAPI(title="Fake TTS")
+_slots = asyncio.Semaphore(CONCURRENCY)
+_audio: Dict[str, bytes] = {}
+
+def _silence(seconds: float) -> bytes:
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(_SAMPLE_RATE)
+        wav.writeframes(b"\0\0" * int(_SAMPLE_RATE * seconds))
+    return buffer.getvalue()
+
+@app.get("/health")
+async def health():
+    return {"status": "healthy", "model_loaded": True}
+
+@app.post("/tts")
+async def tts(request: Request):
+    body = await request.json()
+    text = body.get("text", "").strip()
+    if not text:
+        raise HTTPException(status_code=400, detail="text is required")
+    
+    name = hashlib.sha256(text.encode("utf-8")).hexdigest() + ".wav"
+    if name not in _audio:
+        async with _slots:
+            await asyncio.sleep(DELAY + PER_CHAR * len(text))
+        _audio[name] = _silence(len(text) / _CHARS_PER_SECOND)
+    
+    frames = max(1, int(len(text) / _CHARS_PER_SECOND * 50))
+    lipsync = {"frame_ms": 20, "values": [0.5] * frames}
+    return {"audio_url": f"/audio/{name}", "lipsync": lipsync}
+
+@app.get("/audio/{name}")
+async def audio(name: str):
+    data = _audio.get(name)
+    if data is None:
+        raise HTTPException(status_code=404, detail="audio not found")
+    return Response(data, media_type="audio/wav", headers={"ETag": f'"{name}"'})
\ No newline at end of file
@@ -0,0 +1,338 @@
+# avatar-server/backend/benchmarks/loadtest.py
+"""
+Нагрузочный тест настоящего FastAPI-приложения на заглушках Ollama и TTS.
+
+Поднимает fake_ollama, fake_tts и сам бэкенд (uvicorn) отдельными процессами
+на свободных портах с временной базой, прогоняет вопросы из prompts.jsonl
+при заданной конкурентности и печатает p50/p95/p99 задержки, время до первого
+токена и до первого аудио, пропускную способность и память процесса бэкенда.
+
+    python -m benchmarks.loadtest --concurrency 1,8,32 --requests 200
+    python -m benchmarks.loadtest --output bench.json
+    python -m benchmarks.loadtest --baseline bench.json --tolerance 0.2
+
+С --baseline процесс завершается с кодом 1, если метрики выросли сильнее
+допуска, — так регрессия видна до выкладки.
+"""
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from benchmarks.stats import compare, load_baseline, print_table, save_results, summarize
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+REPO_DIR = BACKEND_DIR.parent.parent
+DEFAULT_PROMPTS = Path(__file__).resolve().parent / "prompts.jsonl"
+
+# Метрики, по которым ищутся регрессии относительно базового прогона
+_COMPARED = ["p95_ms", "p99_ms", "ttft_p95_ms", "ttfa_p95_ms", "rss_peak_mb"]
+_COLUMNS = [
+    "requests", "errors", "rps", "p50_ms", "p95_ms", "p99_ms",
+    "ttft_p50_ms", "ttft_p95_ms", "ttfa_p50_ms", "ttfa_p95_ms", "rss_peak_mb"
+]
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def _rss_mb(pid: int) -> Optional[float]:
+    """Резидентная память процесса (Linux, /proc); на других ОС — None"""
+    try:
+        with open(f"/proc/{pid}/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+    return None
+
+def load_prompts(path: str) -> List[Dict[str, Any]]:
+    prompts = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                prompts.append(json.loads(line))
+    if not prompts:
+        raise ValueError(f"No prompts in {path}")
+    return prompts
+
+class Stack:
+    """Заглушки и бэкенд в отдельных процессах (как при реальном развёртывании)"""
+    
+    def __init__(self, env: Dict[str, str], workdir: str, verbose: bool = False):
+        self.env = env
+        self.workdir = workdir
+        self.verbose = verbose
+        self.processes: List[subprocess.Popen] = []
+        self.app_pid: Optional[int] = None
+        self.app_url = ""
+    
+    def _spawn(self, target: str, port: int, env: Dict[str, str], cwd: str) -> subprocess.Popen:
+        process = subprocess.Popen(
+            [
+                sys.executable, "-m", "uvicorn", target,
+                "--app-dir", str(BACKEND_DIR),
+                "--host", "127.0.0.1", "--port", str(port),
+                "--log-level", "warning", "--no-access-log"
+            ],
+            cwd=cwd,
+            env=env,
+            # Логи бэкенда (по строке на запрос) искажают замеры и засоряют отчёт
+            stdout=None if self.verbose else subprocess.DEVNULL
+        )
+        self.processes.append(process)
+        return process
+    
+    def start(self):
+        ollama_port, tts_port, app_port = _free_port(), _free_port(), _free_port()
+        env = dict(os.environ, **self.env)
+        self._spawn("benchmarks.fake_ollama:app", ollama_port, env, str(BACKEND_DIR))
+        self._spawn("benchmarks.fake_tts:app", tts_port, env, str(BACKEND_DIR))
+        
+        # Раскладка каталогов как в контейнере: frontend и assets рядом с main.py
+        for name, source in (("frontend", REPO_DIR / "avatar-server" / "frontend"), ("assets", REPO_DIR / "assets")):
+            link = Path(self.workdir) / name
+            if source.exists() and not link.exists():
+                link.symlink_to(source, target_is_directory=True)
+            elif not link.exists():
+                link.mkdir()
+        
+        app_env = dict(
+            env,
+            OLLAMA_URL=f"http://127.0.0.1:{ollama_port}",
+            TTS_URL=f"http://127.0.0.1:{tts_port}",
+            DB_PATH=os.path.join(self.workdir, "chat.db")
+        )
+        app = self._spawn("main:app", app_port, app_env, self.workdir)
+        self.app_pid = app.pid
+        self.app_url = f"http://127.0.0.1:{app_port}"
+        
+        for url in (f"http://127.0.0.1:{ollama_port}/api/tags", f"http://127.0.0.1:{tts_port}/health", f"{self.app_url}/api/health"):
+            _wait_ready(url, self.processes)
+    
+    def stop(self):
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+def _wait_ready(url: str, processes: List[subprocess.Popen], timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if any(process.poll() is not None for process in processes):
+            raise RuntimeError(f"Process exited before {url} became ready")
+        try:
+            if httpx.get(url, timeout=1.0).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.1)
+    raise RuntimeError(f"{url} did not become ready in {timeout:.0f}s")
+
+class Sample:
+    __slots__ = ("ok", "latency", "ttft", "ttfa")
+    
+    def __init__(self):
+        self.ok = False
+        self.latency: Optional[float] = None
+        self.ttft: Optional[float] = None
+        self.ttfa: Optional[float] = None
+
+def _payload(prompt: Dict[str, Any], session_id: str) -> Dict[str, Any]:
+    payload = dict(prompt)
+    payload["session_id"] = session_id
+    return payload
+
+async def _run_chat(client: httpx.AsyncClient, payload: Dict[str, Any]) -> Sample:
+    sample = Sample()
+    started = time.perf_counter()
+    response = await client.post("/api/chat", json=payload)
+    sample.latency = time.perf_counter() - started
+    sample.ok = response.status_code == 200
+    if sample.ok:
+        # Обычный ответ приходит целиком: текст и аудио готовы одновременно
+        sample.ttft = sample.latency
+        if response.json().get("audio_url"):
+            sample.ttfa = sample.latency
+    return sample
+
+async def _run_stream(client: httpx.AsyncClient, payload: Dict[str, Any]) -> Sample:
+    sample = Sample()
+    started = time.perf_counter()
+    event = None
+    async with client.stream("POST", "/api/chat/stream", json=payload) as response:
+        if response.status_code != 200:
+            await response.aread()
+            sample.latency = time.perf_counter() - started
+            return sample
+        async for line in response.aiter_lines():
+            if line.startswith("event: "):
+                event = line[7:]
+                elapsed = time.perf_counter() - started
+                if event == "token" and sample.ttft is None:
+                    sample.ttft = elapsed
+                elif event == "audio" and sample.ttfa is None:
+                    sample.ttfa = elapsed
+                elif event == "done":
+                    sample.ok = True
+                elif event == "error":
+                    sample.ok = False
+    sample.latency = time.perf_counter() - started
+    return sample
+
+async def _run_scenario(
+    base_url: str,
+    mode: str,
+    concurrency: int,
+    total: int,
+    prompts: List[Dict[str, Any]],
+    app_pid: Optional[int],
+    run_id: str
+) -> Dict[str, Any]:
+    run = _run_stream if mode == "stream" else _run_chat
+    samples: List[Sample] = []
+    counter = iter(range(total))
+    rss_peak = 0.0
+    done = asyncio.Event()
+    
+    async def sample_memory():
+        nonlocal rss_peak
+        while not done.is_set():
+            rss = _rss_mb(app_pid) if app_pid else None
+            if rss is not None:
+                rss_peak = max(rss_peak, rss)
+            await asyncio.sleep(0.2)
+    
+    async def user(index: int, client: httpx.AsyncClient):
+        # Каждый виртуальный пользователь — своя сессия: история растёт как в жизни
+        session_id = f"bench-{run_id}-{mode}-{concurrency}-{index}"
+        for number in counter:
+            prompt = prompts[number % len(prompts)]
+            try:
+                samples.append(await run(client, _payload(prompt, session_id)))
+            except httpx.HTTPError:
+                samples.append(Sample())
+    
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    timeout = httpx.Timeout(120.0, connect=5.0)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=timeout) as client:
+        monitor = asyncio.create_task(sample_memory())
+        started = time.perf_counter()
+        await asyncio.gather(*(user(i, client) for i in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        done.set()
+        await monitor
+    
+    ok = [s for s in samples if s.ok]
+    result: Dict[str, Any] = {
+        "requests": len(samples),
+        "errors": len(samples) - len(ok),
+        "rps": round(len(ok) / elapsed, 2) if elapsed else None
+    }
+    result.update(summarize([s.latency for s in ok]))
+    for name in ("ttft", "ttfa"):
+        values = [getattr(s, name) for s in ok if getattr(s, name) is not None]
+        stats = summarize(values)
+        result[f"{name}_p50_ms"] = stats["p50_ms"]
+        result[f"{name}_p95_ms"] = stats["p95_ms"]
+    result["rss_peak_mb"] = round(rss_peak, 1) if rss_peak else None
+    return result
+
+def _parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the avatar backend against fake Ollama/TTS")
+    parser.add_argument("--concurrency", default="1,8,32", help="comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=100, help="requests per scenario")
+    parser.add_argument("--mode", choices=["chat", "stream", "both"], default="both")
+    parser.add_argument("--prompts", default=str(DEFAULT_PROMPTS), help="JSONL with ChatRequest fields")
+    parser.add_argument("--token-rate", type=float, help="fake Ollama tokens per second")
+    parser.add_argument("--ttft-ms", type=float, help="fake Ollama delay before the first token")
+    parser.add_argument("--reply-tokens", type=int, help="fake Ollama reply length")
+    parser.add_argument("--tts-delay-ms", type=float, help="fake TTS base synthesis delay")
+    parser.add_argument("--warmup", type=int, default=5, help="requests before measuring")
+    parser.add_argument("--url", help="benchmark an already running backend instead of spawning one")
+    parser.add_argument("--verbose", action="store_true", help="show backend and fake server output")
+    parser.add_argument("--output", help="write results as JSON")
+    parser.add_argument("--baseline", help="JSON from a previous --output run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed growth vs baseline (0.2 = 20%%)")
+    return parser.parse_args(argv)
+
+def _fake_env(args) -> Dict[str, str]:
+    env = {}
+    for option, name in (
+        ("token_rate", "BENCH_OLLAMA_TOKEN_RATE"),
+        ("ttft_ms", "BENCH_OLLAMA_TTFT_MS"),
+        ("reply_tokens", "BENCH_OLLAMA_TOKENS"),
+        ("tts_delay_ms", "BENCH_TTS_DELAY_MS")
+    ):
+        value = getattr(args, option)
+        if value is not None:
+            env[name] = str(value)
+    # Прогрев модели заглушке не нужен и только шумит в измерениях
+    env.setdefault("OLLAMA_WARMUP", "false")
+    return env
+
+async def _benchmark(args, base_url: str, app_pid: Optional[int]) -> Dict[str, Dict[str, Any]]:
+    prompts = load_prompts(args.prompts)
+    modes = ["chat", "stream"] if args.mode == "both" else [args.mode]
+    levels = [int(level) for level in args.concurrency.split(",") if level.strip()]
+    run_id = str(int(time.time()))
+    
+    if args.warmup:
+        await _run_scenario(base_url, modes[0], 1, args.warmup, prompts, None, run_id + "-warmup")
+    
+    results = {}
+    for mode in modes:
+        for concurrency in levels:
+            name = f"{mode}@{concurrency}"
+            print(f"Running {name} ({args.requests} requests)...", flush=True)
+            results[name] = await _run_scenario(base_url, mode, concurrency, args.requests, prompts, app_pid, run_id)
+    return results
+
+def main(argv=None) -> int:
+    args = _parse_args(argv)
+    
+    if args.url:
+        results = asyncio.run(_benchmark(args, args.url.rstrip("/"), None))
+    else:
+        with tempfile.TemporaryDirectory(prefix="avatar-bench-") as workdir:
+            stack = Stack(_fake_env(args), workdir, args.verbose)
+            try:
+                stack.start()
+                results = asyncio.run(_benchmark(args, stack.app_url, stack.app_pid))
+            finally:
+                stack.stop()
+    
+    print()
+    print_table(results, _COLUMNS)
+    
+    if args.output:
+        save_results(args.output, results, vars(args))
+        print(f"\nResults written to {args.output}")
+    
+    if args.baseline:
+        regressions = compare(results, load_baseline(args.baseline), _COMPARED, args.tolerance)
+        if regressions:
+            print(f"\nRegressions over {args.tolerance:.0%}:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print(f"\nNo regressions over {args.tolerance:.0%} against {args.baseline}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
\ No newline at end of file
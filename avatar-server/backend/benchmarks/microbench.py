@@ -0,0 +1,150 @@
+# avatar-server/backend/benchmarks/microbench.py
+"""
+Микробенчмарки горячих функций: чтение и запись истории в SQLite
+и проверка языка ответа (для неё — ещё и стоимость на килобайт текста).
+
+    python -m benchmarks.microbench
+    python -m benchmarks.microbench --output micro.json
+    python -m benchmarks.microbench --baseline micro.json --tolerance 0.2
+
+База создаётся во временном каталоге и заполняется перед замерами.
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import statistics
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from benchmarks.stats import compare, load_baseline, print_table, save_results
+
+_COMPARED = ["median_us"]
+_COLUMNS = ["ops_per_s", "best_us", "median_us", "us_per_kb"]
+
+# Типичные ответы: русский, английский и смешанный с терминами
+_RUSSIAN = (
+    "Нейронная сеть — это модель, которая учится на примерах. "
+    "Она состоит из слоёв, и каждый слой преобразует входные данные. " * 4
+)
+_ENGLISH = "A neural network is a model that learns from examples and consists of layers. " * 4
+_MIXED = "Для видеосвязи используется WebRTC, а сигналинг идёт через WebSocket и JSON. " * 4
+
+def measure(func: Callable[[], Any], repeat: int, min_time: float) -> Dict[str, float]:
+    """
+    Подбирает число вызовов на серию (не короче min_time), затем делает
+    repeat серий. Лучшая серия — предел скорости, медиана — типичный случай.
+    """
+    number = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time:
+            break
+        number *= 2 if elapsed * 2 >= min_time else 10
+    
+    per_call: List[float] = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(number):
+            func()
+        per_call.append((time.perf_counter() - started) / number)
+    
+    median = statistics.median(per_call)
+    return {
+        "ops_per_s": round(1 / median, 1),
+        "best_us": round(min(per_call) * 1e6, 2),
+        "median_us": round(median * 1e6, 2)
+    }
+
+def _tokens(text: str, size: int = 4) -> List[str]:
+    """Режет текст на фрагменты, похожие на токены потоковой выдачи"""
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+def _stream_guard(tokens: List[str], user_message: str) -> Callable[[], Any]:
+    from services.llm import LanguageGuard
+    
+    def run():
+        guard = LanguageGuard(user_message)
+        for token in tokens:
+            if guard.feed(token) is not None:
+                break
+    return run
+
+def _benchmarks(history_size: int) -> Dict[str, Tuple[Callable[[], Any], Optional[str]]]:
+    """Имя → (функция, обрабатываемый текст для пересчёта на килобайт или None)"""
+    # Импорт после подмены DB_PATH: настройки читаются при импорте
+    from core.database import init_db
+    from services import chat_history
+    from services.llm import ensure_russian_response
+    
+    init_db()
+    session_id = "microbench"
+    for i in range(history_size):
+        role = "user" if i % 2 == 0 else "assistant"
+        chat_history.save_message(session_id, role, f"{_RUSSIAN[:120]} #{i}")
+    
+    counter = iter(range(sys.maxsize))
+    question = "Что такое нейронная сеть?"
+    return {
+        "get_history(30)": (lambda: chat_history.get_history(session_id, limit=30), None),
+        "get_history(200)": (lambda: chat_history.get_history(session_id, limit=200), None),
+        "save_message": (lambda: chat_history.save_message(f"writer-{next(counter) % 100}", "user", _RUSSIAN[:200]), None),
+        "ensure_russian(ru)": (lambda: ensure_russian_response(_RUSSIAN, question), _RUSSIAN),
+        "ensure_russian(en)": (lambda: ensure_russian_response(_ENGLISH, question), _ENGLISH),
+        "ensure_russian(mixed)": (lambda: ensure_russian_response(_MIXED, "Как работает видеосвязь?"), _MIXED),
+        # Весь ответ по токенам: русский проверяется до конца, английский отсекается рано
+        "language_guard(stream ru)": (_stream_guard(_tokens(_RUSSIAN), question), _RUSSIAN),
+        "language_guard(stream en)": (_stream_guard(_tokens(_ENGLISH), question), _ENGLISH)
+    }
+
+def _parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Microbenchmarks for history storage and the language guard")
+    parser.add_argument("--repeat", type=int, default=7, help="timed series per benchmark")
+    parser.add_argument("--min-time", type=float, default=0.1, help="minimal duration of one series, seconds")
+    parser.add_argument("--history-size", type=int, default=1000, help="messages in the benchmark session")
+    parser.add_argument("--filter", help="run only benchmarks whose name contains this text")
+    parser.add_argument("--output", help="write results as JSON")
+    parser.add_argument("--baseline", help="JSON from a previous --output run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown vs baseline (0.2 = 20%%)")
+    return parser.parse_args(argv)
+
+def main(argv=None) -> int:
+    args = _parse_args(argv)
+    
+    with tempfile.TemporaryDirectory(prefix="avatar-micro-") as workdir:
+        os.environ["DB_PATH"] = os.path.join(workdir, "chat.db")
+        results = {}
+        for name, (func, text) in _benchmarks(args.history_size).items():
+            if args.filter and args.filter not in name:
+                continue
+            results[name] = measure(func, args.repeat, args.min_time)
+            if text is not None:
+                kilobytes = len(text.encode("utf-8")) / 1024
+                results[name]["us_per_kb"] = round(results[name]["median_us"] / kilobytes, 2)
+            print(f"{name}: {results[name]['median_us']} us", flush=True)
+        
+        from core.database import close_db
+        close_db()
+    
+    print()
+    print_table(results, _COLUMNS)
+    
+    if args.output:
+        save_results(args.output, results, vars(args))
+        print(f"\nResults written to {args.output}")
+    
+    if args.baseline:
+        regressions = compare(results, load_baseline(args.baseline), _COMPARED, args.tolerance)
+        if regressions:
+            print(f"\nRegressions over {args.tolerance:.0%}:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print(f"\nNo regressions over {args.tolerance:.0%} against {args.baseline}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
\ No newline at end of file
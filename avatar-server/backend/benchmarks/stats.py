@@ -0,0 +1,72 @@
+# avatar-server/backend/benchmarks/stats.py
+import json
+import math
+from typing import Any, Dict, List, Optional, Sequence
+
+def percentile(values: Sequence[float], p: float) -> Optional[float]:
+    """Перцентиль методом ближайшего ранга (None для пустой выборки)"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(p / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+def summarize(values: Sequence[float]) -> Dict[str, Optional[float]]:
+    """p50/p95/p99 и максимум в миллисекундах"""
+    return {
+        "p50_ms": _ms(percentile(values, 50)),
+        "p95_ms": _ms(percentile(values, 95)),
+        "p99_ms": _ms(percentile(values, 99)),
+        "max_ms": _ms(max(values) if values else None)
+    }
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    return None if seconds is None else round(seconds * 1000, 2)
+
+def compare(
+    results: Dict[str, Dict[str, Any]],
+    baseline: Dict[str, Dict[str, Any]],
+    metrics: List[str],
+    tolerance: float
+) -> List[str]:
+    """
+    Сравнивает результаты с сохранённым базовым прогоном.
+    Регрессия — рост метрики больше чем на tolerance (доля, 0.2 = 20%).
+    """
+    regressions = []
+    for scenario, values in results.items():
+        base = baseline.get(scenario)
+        if not base:
+            continue
+        for metric in metrics:
+            current, previous = values.get(metric), base.get(metric)
+            if current is None or not previous:
+                continue
+            if current > previous * (1 + tolerance):
+                regressions.append(
+                    f"{scenario}: {metric} {previous} -> {current} (+{(current / previous - 1) * 100:.0f}%)"
+                )
+    return regressions
+
+def load_baseline(path: str) -> Dict[str, Dict[str, Any]]:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)["results"]
+
+def save_results(path: str, results: Dict[str, Dict[str, Any]], params: Dict[str, Any]):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"params": params, "results": results}, f, ensure_ascii=False, indent=2)
+
+def print_table(results: Dict[str, Dict[str, Any]], columns: List[str]):
+    """Выводит результаты таблицей: строка — сценарий, столбцы — метрики"""
+    header = ["scenario"] + columns
+    rows = [[name] + [_cell(values.get(column)) for column in columns] for name, values in results.items()]
+    widths = [max(len(row[i]) for row in [header] + rows) for i in range(len(header))]
+    for row in [header] + rows:
+        print("  ".join(cell.rjust(width) if i else cell.ljust(width) for i, (cell, width) in enumerate(zip(row, widths))))
+
+def _cell(value: Any) -> str:
+    if value is None:
+        return "-"
+    if isinstance(value, float):
+        return f"{value:.2f}"
+    return str(value)
\ No newline at end of file
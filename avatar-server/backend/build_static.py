@@ -0,0 +1,280 @@
+# avatar-server/backend/build_static.py
+"""
+Сборка статики для выдачи через PrecompressedStaticFiles.
+
+Копирует frontend/ и assets/ в каталог назначения и:
+- кладёт рядом с файлами копии с хэшем содержимого в имени
+  (avatar.3f9c0e1a2b.glb, scene.81d2c4e0aa.js) и переписывает ссылки
+  на них в HTML/JS/CSS; такие файлы кэшируются браузером навсегда
+- сжимает текст и модель заранее (brotli, если установлен пакет brotli,
+  и gzip), чтобы сервер не тратил на это время при каждом запросе
+- по желанию пережимает геометрию GLB через gltf-transform (meshopt
+  или draco) — нужен Node.js и @gltf-transform/cli
+- пишет static-manifest.json: какие имена неизменяемые и у каких файлов
+  есть сжатые варианты
+
+    python build_static.py --frontend ../frontend --assets ../../assets --output ./dist
+    python build_static.py --frontend /src/frontend --assets /src/assets --output /app --glb-compress meshopt
+
+В --output появляются frontend/ и assets/ — как в рабочем каталоге main.py.
+Исходные имена тоже остаются доступны, поэтому внешние ссылки не ломаются.
+"""
+import os
+import re
+import gzip
+import json
+import shutil
+import hashlib
+import argparse
+import subprocess
+from typing import Dict, List, Optional, Set
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Имя манифеста (его же читает core/static_files.py)
+MANIFEST_NAME = "static-manifest.json"
+ROOTS = ("assets", "frontend")
+
+# Что имеет смысл сжимать: текст и модель; картинки и аудио уже сжаты
+COMPRESSIBLE = {".html", ".js", ".mjs", ".css", ".json", ".svg", ".txt", ".map", ".wasm", ".glb", ".gltf", ".ico"}
+# Файлы, в которых ищутся ссылки на другие файлы статики
+REWRITABLE = {".html", ".js", ".mjs", ".css"}
+# Точки входа: их имена фиксированы, они отдаются с ревалидацией
+ENTRY_POINTS = {".html"}
+# Сжатый вариант сохраняется, только если он заметно меньше исходника
+MIN_SAVING = 0.05
+HASH_LENGTH = 10
+_SUFFIXES = {"br": ".br", "gzip": ".gz"}
+
+# Путь в кавычках или url(...): абсолютный от корня сайта или относительный
+_REFERENCE_RE = re.compile(r"""(?<=['"(])((?:\.{1,2}/|/(?!/))[^'"()\s?#]+)(?=[?#'")])""")
+
+def hashed_name(name: str, digest: str) -> str:
+    stem, ext = os.path.splitext(name)
+    return f"{stem}.{digest[:HASH_LENGTH]}{ext}"
+
+def _file_digest(path: str) -> str:
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+def _list_files(root: str) -> List[str]:
+    files = []
+    for directory, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if d != "node_modules" and not d.startswith("."))
+        for filename in sorted(filenames):
+            if filename == MANIFEST_NAME or filename.endswith((".br", ".gz")):
+                continue
+            files.append(os.path.relpath(os.path.join(directory, filename), root).replace(os.sep, "/"))
+    return files
+
+def compress_glb(path: str, mode: str) -> bool:
+    """Пережимает геометрию GLB на месте; False, если gltf-transform недоступен"""
+    tool = shutil.which("gltf-transform")
+    command = [tool] if tool else (["npx", "--yes", "@gltf-transform/cli"] if shutil.which("npx") else None)
+    if command is None:
+        print(f"gltf-transform not found, {path} is left as is")
+        return False
+    
+    tmp_path = path + ".tmp.glb"
+    try:
+        subprocess.run(command + [mode, path, tmp_path], check=True, capture_output=True)
+    except (OSError, subprocess.CalledProcessError) as e:
+        stderr = getattr(e, "stderr", b"") or b""
+        print(f"gltf-transform {mode} failed for {path}: {e} {stderr.decode(errors='replace')[-500:]}")
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        return False
+    
+    before, after = os.path.getsize(path), os.path.getsize(tmp_path)
+    os.replace(tmp_path, path)
+    print(f"{path}: {mode} {before} -> {after} bytes")
+    return True
+
+def precompress(path: str) -> List[str]:
+    """Пишет .br/.gz рядом с файлом; возвращает список сохранённых кодировок"""
+    with open(path, "rb") as f:
+        data = f.read()
+    encodings = []
+    candidates = [("gzip", lambda d: gzip.compress(d, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        candidates.insert(0, ("br", lambda d: brotli.compress(d, quality=11)))
+    for encoding, compress in candidates:
+        packed = compress(data)
+        if len(packed) <= len(data) * (1 - MIN_SAVING):
+            with open(path + _SUFFIXES[encoding], "wb") as f:
+                f.write(packed)
+            encodings.append(encoding)
+    return encodings
+
+class StaticBuild:
+    """Дерево статики в каталоге назначения: хэширование, ссылки, сжатие"""
+    
+    def __init__(self, output: str):
+        self.output = output
+        # "frontend/modules/scene.js" → "scene.81d2c4e0aa.js"
+        self.hashed: Dict[str, str] = {}
+        self.files: Dict[str, List[str]] = {root: _list_files(os.path.join(output, root)) for root in ROOTS}
+    
+    def _abs(self, path: str) -> str:
+        return os.path.join(self.output, path)
+    
+    def _resolve(self, referrer: str, reference: str) -> Optional[str]:
+        """Путь файла вида "<корень>/<путь>" по ссылке из referrer или None"""
+        if reference.startswith("/"):
+            parts = reference.lstrip("/").split("/", 1)
+            # /assets/... — смонтированный каталог ассетов, остальное — frontend
+            path = reference.lstrip("/") if parts[0] == "assets" else "frontend" + reference
+        else:
+            path = os.path.normpath(os.path.join(os.path.dirname(referrer), reference)).replace(os.sep, "/")
+        root = path.split("/", 1)[0]
+        if root in ROOTS and path.split("/", 1)[-1] in self.files[root]:
+            return path
+        return None
+    
+    def _references(self, path: str) -> Set[str]:
+        if os.path.splitext(path)[1] not in REWRITABLE:
+            return set()
+        with open(self._abs(path), encoding="utf-8") as f:
+            text = f.read()
+        found = set()
+        for match in _REFERENCE_RE.finditer(text):
+            target = self._resolve(path, match.group(1))
+            if target is not None and target != path:
+                found.add(target)
+        return found
+    
+    def _rewrite(self, path: str):
+        """Заменяет ссылки на уже хэшированные файлы их новыми именами"""
+        if os.path.splitext(path)[1] not in REWRITABLE:
+            return
+        with open(self._abs(path), encoding="utf-8") as f:
+            text = f.read()
+        
+        def replace(match):
+            reference = match.group(1)
+            target = self._resolve(path, reference)
+            if target is None or target not in self.hashed:
+                return reference
+            head, _, _ = reference.rpartition("/")
+            return f"{head}/{self.hashed[target]}"
+        
+        rewritten = _REFERENCE_RE.sub(replace, text)
+        if rewritten != text:
+            with open(self._abs(path), "w", encoding="utf-8") as f:
+                f.write(rewritten)
+    
+    def hash_files(self):
+        """
+        Хэширует файлы от листьев к корню: имя модуля зависит от имён
+        тех, кого он импортирует. Файлы в циклах импорта остаются
+        с исходными именами (и ревалидацией по ETag).
+        """
+        all_files = [f"{root}/{name}" for root in ROOTS for name in self.files[root]]
+        pending = {path: self._references(path) for path in all_files}
+        while pending:
+            ready = [path for path, deps in pending.items() if not deps - self.hashed.keys() - _unhashable(deps)]
+            if not ready:
+                print(f"Import cycle, left unhashed: {', '.join(sorted(pending))}")
+                break
+            for path in ready:
+                del pending[path]
+                self._rewrite(path)
+                if os.path.splitext(path)[1] in ENTRY_POINTS:
+                    continue
+                source = self._abs(path)
+                name = hashed_name(os.path.basename(path), _file_digest(source))
+                shutil.copy2(source, os.path.join(os.path.dirname(source), name))
+                self.hashed[path] = name
+    
+    def write_manifests(self) -> Dict[str, int]:
+        """Сжимает файлы и пишет манифест в каждый корень; возвращает размеры"""
+        totals = {"files": 0, "bytes": 0, "compressed_bytes": 0}
+        for root in ROOTS:
+            root_dir = self._abs(root)
+            immutable, encoded, hashed = [], {}, {}
+            for path, name in self.hashed.items():
+                if path.startswith(root + "/"):
+                    relative = path[len(root) + 1:]
+                    hashed_path = f"{os.path.dirname(relative)}/{name}".lstrip("/")
+                    hashed[relative] = hashed_path
+                    immutable.append(hashed_path)
+            
+            for name in _list_files(root_dir):
+                if os.path.splitext(name)[1] not in COMPRESSIBLE:
+                    continue
+                path = os.path.join(root_dir, name)
+                encodings = precompress(path)
+                if encodings:
+                    encoded[name] = encodings
+                sizes = [os.path.getsize(path + _SUFFIXES[encoding]) for encoding in encodings]
+                totals["files"] += 1
+                totals["bytes"] += os.path.getsize(path)
+                totals["compressed_bytes"] += min(sizes, default=os.path.getsize(path))
+            
+            manifest = {"hashed": hashed, "immutable": sorted(immutable), "encoded": encoded}
+            with open(os.path.join(root_dir, MANIFEST_NAME), "w", encoding="utf-8") as f:
+                json.dump(manifest, f, ensure_ascii=False, indent=2, sort_keys=True)
+        return totals
+
+def _unhashable(paths: Set[str]) -> Set[str]:
+    # Ссылки на точки входа не ждут хэширования — у них его не будет
+    return {path for path in paths if os.path.splitext(path)[1] in ENTRY_POINTS}
+
+def build(sources: Dict[str, str], output: str, glb_compress: str = "none") -> Dict[str, int]:
+    """sources: каталог-источник для каждого корня (assets, frontend)"""
+    for root in ROOTS:
+        destination = os.path.join(output, root)
+        if os.path.isdir(destination):
+            shutil.rmtree(destination)
+        shutil.copytree(
+            sources[root],
+            destination,
+            ignore=shutil.ignore_patterns("node_modules", ".*", MANIFEST_NAME, "*.br", "*.gz")
+        )
+    
+    if glb_compress != "none":
+        for name in _list_files(os.path.join(output, "assets")):
+            if name.endswith(".glb"):
+                compress_glb(os.path.join(output, "assets", name), glb_compress)
+    
+    static = StaticBuild(output)
+    static.hash_files()
+    totals = static.write_manifests()
+    totals["hashed"] = len(static.hashed)
+    return totals
+
+def main():
+    parser = argparse.ArgumentParser(description="Build hashed, precompressed static files")
+    parser.add_argument("--frontend", required=True, help="frontend source directory")
+    parser.add_argument("--assets", required=True, help="assets source directory (avatar.glb)")
+    parser.add_argument("--output", required=True, help="where to write frontend/ and assets/")
+    parser.add_argument(
+        "--glb-compress",
+        choices=["none", "meshopt", "draco"],
+        default="none",
+        help="recompress GLB geometry with gltf-transform (meshopt keeps morph targets compact)"
+    )
+    args = parser.parse_args()
+    
+    if brotli is None:
+        print("brotli is not installed, writing gzip variants only")
+    
+    sources = {"frontend": args.frontend, "assets": args.assets}
+    for root, source in sources.items():
+        if os.path.realpath(source) == os.path.realpath(os.path.join(args.output, root)):
+            parser.error(f"--output/{root} must differ from --{root}: the build rewrites files")
+    
+    totals = build(sources, args.output, args.glb_compress)
+    print(
+        f"Hashed {totals['hashed']} files; {totals['files']} compressible files, "
+        f"{totals['bytes']} -> {totals['compressed_bytes']} bytes over the wire"
+    )
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -1,12 +1,19 @@
 # avatar-server/backend/core/__init__.py
 from .config import settings, get_allowed_origins
-from .database import get_db_connection, init_db
+from .database import get_db_connection, init_db, run_db, close_db
 from .security import setup_cors
+from .http_clients import init_http_clients, close_http_clients, get_ollama_client, get_tts_client
 
 __all__ = [
     "settings",
     "get_allowed_origins",
     "get_db_connection",
     "init_db",
-    "setup_cors"
+    "run_db",
+    "close_db",
+    "setup_cors",
+    "init_http_clients",
+    "close_http_clients",
+    "get_ollama_client",
+    "get_tts_client"
 ]
\ No newline at end of file
@@ -0,0 +1,72 @@
+# avatar-server/backend/core/circuit_breaker.py
+import time
+from typing import Dict, Any
+
+class CircuitBreaker:
+    """
+    Простой автомат размыкания цепи для внешнего сервиса.
+
+    - closed    — запросы проходят, ошибки подряд считаются
+    - open      — после failure_threshold ошибок запросы сразу отклоняются
+    - half_open — через reset_timeout пропускается один пробный запрос;
+                  успех замыкает цепь, ошибка снова размыкает её
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 3, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._state = self.HALF_OPEN
+            self._trial_in_flight = False
+        return self._state
+
+    def allow_request(self) -> bool:
+        """Можно ли сейчас обращаться к сервису"""
+        state = self.state
+        if state == self.CLOSED:
+            return True
+        if state == self.HALF_OPEN and not self._trial_in_flight:
+            self._trial_in_flight = True
+            return True
+        return False
+
+    def record_success(self):
+        self._state = self.CLOSED
+        self._failures = 0
+        self._trial_in_flight = False
+
+    def record_failure(self):
+        self._failures += 1
+        self._trial_in_flight = False
+        if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+            self._state = self.OPEN
+            self._opened_at = time.monotonic()
+
+    def release(self):
+        """Запрос прерван без результата (например, отменён) — пробный слот освобождается"""
+        self._trial_in_flight = False
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Состояние для мониторинга"""
+        state = self.state
+        retry_in = 0.0
+        if state == self.OPEN:
+            retry_in = max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at))
+        return {
+            "name": self.name,
+            "state": state,
+            "consecutive_failures": self._failures,
+            "retry_in": round(retry_in, 1)
+        }
@@ -8,12 +8,75 @@ class Settings(BaseSettings):
     OLLAMA_URL: str = "http://ollama:11434"
     TTS_URL: str = "http://tts-server:5002"
     
+    # HTTP-клиенты: пул соединений, keep-alive и таймауты по сервисам
+    HTTP_MAX_CONNECTIONS: int = 100
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    HTTP_KEEPALIVE_EXPIRY: float = 30.0
+    HTTP_CONNECT_TIMEOUT: float = 5.0
+    OLLAMA_TIMEOUT: float = 60.0
+    TTS_TIMEOUT: float = 30.0
+    TTS_HEALTH_TIMEOUT: float = 5.0
+    TTS_AUDIO_TIMEOUT: float = 10.0
+    
+    # Ollama: сколько держать модель в памяти после запроса ("30m", "-1" — всегда)
+    # и прогрев модели по умолчанию при старте
+    OLLAMA_KEEP_ALIVE: str = "30m"
+    OLLAMA_WARMUP: bool = True
+    
+    # Мониторинг TTS: период опроса /health, срок жизни кэша и размыкатель цепи
+    TTS_HEALTH_INTERVAL: float = 10.0
+    TTS_HEALTH_TTL: float = 30.0
+    TTS_BREAKER_FAILURES: int = 3
+    TTS_BREAKER_RESET_TIMEOUT: float = 30.0
+    
+    # Формат аудио по умолчанию (wav | ogg | mp3) и частота; None — исходная 48 кГц
+    TTS_AUDIO_FORMAT: str = "wav"
+    TTS_AUDIO_SAMPLE_RATE: Optional[int] = None
+    
+    # Аудио-прокси: общий с TTS-сервером каталог кэша (если смонтирован) и кэширование в браузере
+    TTS_CACHE_DIR: Optional[str] = None
+    AUDIO_CACHE_CONTROL: str = "public, max-age=86400"
+    
+    # WebRTC-сигнализация: бэкенд комнат (local — один процесс, sqlite — общая
+    # БД для нескольких воркеров), очередь и таймаут отправки на участника
+    SIGNALING_BACKEND: str = "local"
+    SIGNALING_QUEUE_SIZE: int = 32
+    SIGNALING_SEND_TIMEOUT: float = 5.0
+    SIGNALING_POLL_INTERVAL: float = 0.05
+    SIGNALING_RETENTION: float = 60.0
+    
+    # Статика: файлы с хэшем содержимого в имени кэшируются навсегда,
+    # остальные браузер перепроверяет по ETag
+    STATIC_CACHE_CONTROL: str = "no-cache"
+    STATIC_IMMUTABLE_CACHE_CONTROL: str = "public, max-age=31536000, immutable"
+    
     # CORS конфигурация
     ALLOWED_ORIGINS: str = "*"
     
     # Путь к БД
     DB_PATH: str = "./chat.db"
     
+    # SQLite: пул потоков для запросов и PRAGMA (WAL включается всегда)
+    DB_POOL_SIZE: int = 4
+    DB_BUSY_TIMEOUT: float = 5.0
+    DB_SYNCHRONOUS: str = "NORMAL"
+    DB_MMAP_SIZE: int = 256 * 1024 * 1024
+    DB_CACHE_SIZE_KB: int = 16 * 1024
+    # Компактная схема истории: целочисленные ключи и таблица сессий
+    # (включается один раз, обратного преобразования нет)
+    DB_COMPACT_SCHEMA: bool = False
+    
+    # Обслуживание БД в фоне: срок хранения неактивных сессий (дни, 0 — без
+    # ограничения), лимит сообщений на сессию (0 — без лимита), каталог
+    # gzip-архивов удаляемого, размер пачки удаления, период запуска
+    # (секунды, 0 — выключено) и доля свободных страниц для VACUUM
+    HISTORY_RETENTION_DAYS: float = 0
+    HISTORY_SESSION_MAX_MESSAGES: int = 0
+    HISTORY_ARCHIVE_DIR: Optional[str] = None
+    MAINTENANCE_BATCH_SIZE: int = 500
+    MAINTENANCE_INTERVAL: float = 3600.0
+    MAINTENANCE_VACUUM_FREE_RATIO: float = 0.2
+    
     # Настройки модели
     DEFAULT_MODEL: str = "llama3"
     DEFAULT_TEMPERATURE: float = 0.7
@@ -22,6 +85,56 @@ class Settings(BaseSettings):
     HISTORY_LIMIT: int = 12
     MAX_TOKENS: int = 256
     
+    # Кэш истории в памяти и отложенная запись (write_behind | write_through)
+    HISTORY_WRITE_MODE: str = "write_behind"
+    HISTORY_FLUSH_INTERVAL: float = 0.5
+    HISTORY_FLUSH_BATCH: int = 100
+    HISTORY_CACHE_SESSIONS: int = 1000
+    HISTORY_CACHE_MESSAGES: int = 50
+    HISTORY_PAGE_MAX: int = 200
+    # Сверять попадание в кэш с БД (несколько воркеров пишут в одну базу);
+    # при одном воркере можно выключить и не ходить в БД вовсе
+    HISTORY_CACHE_VALIDATE: bool = True
+    
+    # Контекст для LLM: бюджет в токенах (оценка по символам) вместо фиксированного
+    # числа сообщений; вытесненные сообщения сжимаются в резюме сессии
+    CONTEXT_TOKEN_BUDGET: int = 2048
+    CONTEXT_MAX_MESSAGES: int = 50
+    CONTEXT_CHARS_PER_TOKEN: float = 3.0
+    SUMMARY_ENABLED: bool = True
+    SUMMARY_MIN_MESSAGES: int = 4
+    SUMMARY_MAX_TOKENS: int = 200
+    SUMMARY_MODEL: Optional[str] = None
+    # При переполнении бюджета история обрезается до этой доли, а не на одно
+    # сообщение: начало контекста остаётся неизменным несколько ходов подряд,
+    # и Ollama переиспользует KV-кэш префикса
+    CONTEXT_REFIT_RATIO: float = 0.6
+    
+    # Очередь к Ollama: одновременных запросов на модель, размер общей очереди
+    # и очереди одной сессии, максимальное ожидание в очереди (секунды)
+    LLM_MAX_CONCURRENCY: int = 2
+    LLM_QUEUE_MAX: int = 32
+    LLM_SESSION_QUEUE_MAX: int = 2
+    LLM_QUEUE_TIMEOUT: float = 30.0
+    
+    # Кэш ответов на повторяющиеся вопросы (выключен по умолчанию): точное
+    # совпадение и, опционально, семантическое через Ollama embeddings
+    RESPONSE_CACHE_ENABLED: bool = False
+    RESPONSE_CACHE_TTL: float = 24 * 3600
+    RESPONSE_CACHE_MAX_ENTRIES: int = 1000
+    RESPONSE_CACHE_MAX_TEMPERATURE: float = 0.3
+    RESPONSE_CACHE_TEMPERATURE_STEP: float = 0.1
+    RESPONSE_CACHE_SEMANTIC: bool = False
+    RESPONSE_CACHE_EMBED_MODEL: str = "nomic-embed-text"
+    RESPONSE_CACHE_SIMILARITY: float = 0.92
+    
+    # Потоковая выдача: сколько букв накопить до первой проверки языка
+    STREAM_GUARD_MIN_CHARS: int = 40
+    
+    # Конвейер LLM → TTS: параллельный синтез и минимальная длина сегмента
+    TTS_PIPELINE_CONCURRENCY: int = 2
+    TTS_SEGMENT_MIN_CHARS: int = 20
+    
     # Языковые настройки
     FORCE_RUSSIAN: bool = True
     SYSTEM_PROMPT: str = """
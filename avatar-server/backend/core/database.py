@@ -1,45 +1,107 @@
 # avatar-server/backend/core/database.py
 import sqlite3
 import os
+import asyncio
+import threading
+from functools import partial
 from pathlib import Path
 from contextlib import contextmanager
-from typing import Iterator, Any
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, Any, Callable, List, Optional
 
 from .config import settings
+from .migrations import apply_migrations, apply_compact_schema
+from .metrics import DB_LATENCY
 
 # Создаем директорию для БД, если она не существует
 Path(settings.DB_PATH).parent.mkdir(parents=True, exist_ok=True)
 
+# Пул соединений: по одному долгоживущему соединению на поток
+_local = threading.local()
+_connections: List[sqlite3.Connection] = []
+_connections_lock = threading.Lock()
+
+# Пул потоков, в котором выполняются обращения к БД из асинхронного кода
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+def _connect() -> sqlite3.Connection:
+    """Открывает соединение с настроенными PRAGMA"""
+    conn = sqlite3.connect(
+        settings.DB_PATH,
+        timeout=settings.DB_BUSY_TIMEOUT,
+        check_same_thread=False
+    )
+    conn.row_factory = sqlite3.Row
+    # WAL: читатели не блокируют писателя и наоборот
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(f"PRAGMA synchronous={settings.DB_SYNCHRONOUS}")
+    conn.execute(f"PRAGMA mmap_size={int(settings.DB_MMAP_SIZE)}")
+    conn.execute(f"PRAGMA cache_size=-{int(settings.DB_CACHE_SIZE_KB)}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    return conn
+
+def _get_thread_connection() -> sqlite3.Connection:
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = _connect()
+        _local.conn = conn
+        with _connections_lock:
+            _connections.append(conn)
+    return conn
+
 @contextmanager
 def get_db_connection() -> Iterator[sqlite3.Connection]:
-    """Контекстный менеджер для подключения к БД"""
-    conn = sqlite3.connect(settings.DB_PATH)
-    conn.row_factory = sqlite3.Row
+    """
+    Контекстный менеджер для подключения к БД.
+
+    Соединение берётся из пула текущего потока и после выхода не закрывается.
+    """
+    conn = _get_thread_connection()
     try:
         yield conn
         conn.commit()
     except Exception:
         conn.rollback()
         raise
-    finally:
-        conn.close()
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.DB_POOL_SIZE,
+                thread_name_prefix="sqlite"
+            )
+        return _executor
+
+async def run_db(func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """Выполняет синхронную работу с БД в пуле потоков, не блокируя event loop"""
+    loop = asyncio.get_running_loop()
+    # Время включает ожидание свободного потока в пуле
+    with DB_LATENCY.labels(func.__name__).time():
+        return await loop.run_in_executor(_get_executor(), partial(func, *args, **kwargs))
+
+def close_db():
+    """Останавливает пул потоков и закрывает все соединения (при остановке приложения)"""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True)
+            _executor = None
+
+    with _connections_lock:
+        for conn in _connections:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        _connections.clear()
+    _local.__dict__.clear()
 
 def init_db():
-    """Инициализация структуры БД"""
+    """Инициализация структуры БД: применяет недостающие миграции схемы"""
     with get_db_connection() as conn:
-        conn.execute("""
-            CREATE TABLE IF NOT EXISTS chat_history (
-                id TEXT PRIMARY KEY,
-                session_id TEXT NOT NULL,
-                role TEXT NOT NULL,
-                content TEXT NOT NULL,
-                ts REAL NOT NULL
-            )
-        """)
-        conn.execute("""
-            CREATE INDEX IF NOT EXISTS idx_session_id ON chat_history (session_id)
-        """)
-        conn.execute("""
-            CREATE INDEX IF NOT EXISTS idx_ts ON chat_history (ts)
-        """)
-        conn.commit()
\ No newline at end of file
+        apply_migrations(conn)
+        if settings.DB_COMPACT_SCHEMA:
+            apply_compact_schema(conn)
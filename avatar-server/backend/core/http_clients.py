@@ -0,0 +1,46 @@
+# avatar-server/backend/core/http_clients.py
+import httpx
+from typing import Dict
+
+from .config import settings
+
+# Общие клиенты на всё приложение: пул соединений и keep-alive
+# переиспользуются между запросами вместо нового TCP-соединения на каждый вызов
+_clients: Dict[str, httpx.AsyncClient] = {}
+
+def _create_client(base_url: str, timeout: float) -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        base_url=base_url,
+        timeout=httpx.Timeout(timeout, connect=settings.HTTP_CONNECT_TIMEOUT),
+        limits=httpx.Limits(
+            max_connections=settings.HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY
+        )
+    )
+
+def init_http_clients():
+    """Создаёт клиенты для Ollama и TTS (вызывается при старте приложения)"""
+    if "ollama" not in _clients:
+        _clients["ollama"] = _create_client(settings.OLLAMA_URL, settings.OLLAMA_TIMEOUT)
+    if "tts" not in _clients:
+        _clients["tts"] = _create_client(settings.TTS_URL, settings.TTS_TIMEOUT)
+
+def get_ollama_client() -> httpx.AsyncClient:
+    """Клиент Ollama (создаётся лениво, если приложение запущено без lifespan)"""
+    if "ollama" not in _clients:
+        init_http_clients()
+    return _clients["ollama"]
+
+def get_tts_client() -> httpx.AsyncClient:
+    """Клиент TTS-сервера (создаётся лениво, если приложение запущено без lifespan)"""
+    if "tts" not in _clients:
+        init_http_clients()
+    return _clients["tts"]
+
+async def close_http_clients():
+    """Закрывает все соединения (вызывается при остановке приложения)"""
+    clients = list(_clients.values())
+    _clients.clear()
+    for client in clients:
+        await client.aclose()
@@ -0,0 +1,161 @@
+# avatar-server/backend/core/metrics.py
+import os
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+
+# Бакеты для этапов: от миллисекунд (БД, кэш) до десятков секунд (LLM)
+_STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+HTTP_REQUESTS = Counter(
+    "avatar_http_requests_total",
+    "HTTP requests by route and status",
+    ["method", "route", "status"]
+)
+HTTP_LATENCY = Histogram(
+    "avatar_http_request_duration_seconds",
+    "HTTP request latency (for streaming responses — until the stream ends)",
+    ["method", "route"],
+    buckets=_STAGE_BUCKETS
+)
+HTTP_IN_FLIGHT = Gauge(
+    "avatar_http_requests_in_flight",
+    "HTTP requests currently being processed",
+    multiprocess_mode="livesum"
+)
+
+STAGE_LATENCY = Histogram(
+    "avatar_stage_duration_seconds",
+    "Latency of chat pipeline stages",
+    ["stage"],
+    buckets=_STAGE_BUCKETS
+)
+DB_LATENCY = Histogram(
+    "avatar_db_duration_seconds",
+    "SQLite operations including executor queue wait",
+    ["op"],
+    buckets=_STAGE_BUCKETS
+)
+
+OLLAMA_DURATION = Histogram(
+    "avatar_ollama_duration_seconds",
+    "Durations reported by Ollama (load, prompt_eval, eval, total)",
+    ["model", "phase"],
+    buckets=_STAGE_BUCKETS
+)
+OLLAMA_TOKENS = Counter(
+    "avatar_ollama_tokens_total",
+    "Tokens processed by Ollama",
+    ["model", "kind"]
+)
+LLM_QUEUE_WAIT = Histogram(
+    "avatar_llm_queue_wait_seconds",
+    "Time spent waiting for an Ollama slot",
+    ["model"],
+    buckets=_STAGE_BUCKETS
+)
+LLM_ACTIVE = Gauge(
+    "avatar_llm_active_requests",
+    "Ollama requests in progress",
+    ["model"],
+    multiprocess_mode="livesum"
+)
+LLM_QUEUED = Gauge(
+    "avatar_llm_queued_requests",
+    "Requests waiting for an Ollama slot",
+    ["model"],
+    multiprocess_mode="livesum"
+)
+
+UPSTREAM_ERRORS = Counter(
+    "avatar_upstream_errors_total",
+    "Errors talking to upstream services",
+    ["upstream", "kind"]
+)
+RESPONSE_CACHE_LOOKUPS = Counter(
+    "avatar_response_cache_lookups_total",
+    "Response cache lookups by result",
+    ["result"]
+)
+HISTORY_PRUNED = Counter(
+    "avatar_history_pruned_messages_total",
+    "Chat history messages removed by the maintenance job",
+    ["reason"]
+)
+AUDIO_PROXY_BYTES = Counter(
+    "avatar_audio_proxy_bytes_total",
+    "Audio bytes served by /tts-audio",
+    ["source"]
+)
+
+@contextmanager
+def track_stage(stage: str) -> Iterator[None]:
+    """Замеряет длительность этапа (работает и внутри async-функций)"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_LATENCY.labels(stage).observe(time.perf_counter() - started)
+
+def _route_label(scope) -> str:
+    # Шаблон пути (/api/history/{session_id}), а не сам путь — ограниченная кардинальность
+    route = scope.get("route")
+    path = getattr(route, "path", None)
+    return path or "static"
+
+class MetricsMiddleware:
+    """
+    ASGI-middleware: счётчик запросов, гистограмма задержек и число запросов
+    в работе. Написан на чистом ASGI, чтобы не буферизовать потоковые ответы.
+    """
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        # None — ответ так и не начат (клиент отключился раньше)
+        status = None
+        started = time.perf_counter()
+        
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+        
+        HTTP_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except BaseException:
+            if status is None:
+                status = 500
+            raise
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            route = _route_label(scope)
+            HTTP_REQUESTS.labels(scope["method"], route, str(status) if status is not None else "cancelled").inc()
+            HTTP_LATENCY.labels(scope["method"], route).observe(time.perf_counter() - started)
+
+def render_metrics() -> bytes:
+    """Метрики в текстовом формате Prometheus (с учётом нескольких воркеров)"""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest()
+
+METRICS_CONTENT_TYPE = CONTENT_TYPE_LATEST
@@ -0,0 +1,160 @@
+# avatar-server/backend/core/migrations.py
+import sqlite3
+from typing import List, Tuple
+
+# Версионированные миграции схемы. Текущая версия хранится в PRAGMA user_version,
+# поэтому существующие файлы БД обновляются на месте при старте.
+# Новые миграции добавляются только в конец списка.
+MIGRATIONS: List[Tuple[int, str, List[str]]] = [
+    (1, "initial schema", [
+        """
+        CREATE TABLE IF NOT EXISTS chat_history (
+            id TEXT PRIMARY KEY,
+            session_id TEXT NOT NULL,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            ts REAL NOT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_session_id ON chat_history (session_id)",
+        "CREATE INDEX IF NOT EXISTS idx_ts ON chat_history (ts)",
+    ]),
+    # Составной индекс обслуживает WHERE session_id=? ORDER BY ts DESC LIMIT ?
+    # без временной сортировки; одиночный индекс по session_id становится лишним
+    (2, "composite (session_id, ts) index", [
+        "CREATE INDEX IF NOT EXISTS idx_session_ts ON chat_history (session_id, ts)",
+        "DROP INDEX IF EXISTS idx_session_id",
+        "ANALYZE chat_history",
+    ]),
+    # Сжатое содержание старой части разговора (скользящее резюме сессии)
+    (3, "chat summaries", [
+        """
+        CREATE TABLE IF NOT EXISTS chat_summaries (
+            session_id TEXT PRIMARY KEY,
+            summary TEXT NOT NULL,
+            upto_ts REAL NOT NULL,
+            updated_ts REAL NOT NULL
+        )
+        """,
+    ]),
+    # Очередь сообщений сигнализации для бэкенда комнат sqlite (несколько воркеров)
+    (4, "signaling messages", [
+        """
+        CREATE TABLE IF NOT EXISTS signaling_messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            room_id TEXT NOT NULL,
+            origin TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            ts REAL NOT NULL
+        )
+        """,
+    ]),
+]
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def apply_migrations(conn: sqlite3.Connection) -> int:
+    """
+    Применяет недостающие миграции, каждую в своей транзакции.
+    BEGIN IMMEDIATE не даёт двум процессам мигрировать одновременно.
+    Возвращает итоговую версию схемы.
+    """
+    for version, name, statements in MIGRATIONS:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if get_schema_version(conn) >= version:
+                conn.execute("COMMIT")
+                continue
+
+            print(f"Applying DB migration {version}: {name}")
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {version}")
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    return get_schema_version(conn)
+
+# Компактная схема истории (необязательная, DB_COMPACT_SCHEMA): таблица сессий,
+# где каждый session_id хранится один раз, и целочисленная ссылка на неё
+# в сообщениях. UUID сообщения сохраняется с ограничением UNIQUE: на нём
+# держится INSERT OR IGNORE при повторной записи пачки. chat_history становится
+# представлением с INSTEAD OF-триггерами, поэтому запросы сервиса не меняются.
+# Преобразование одностороннее.
+COMPACT_SCHEMA: List[str] = [
+    """
+    CREATE TABLE chat_sessions (
+        id INTEGER PRIMARY KEY,
+        session_id TEXT NOT NULL UNIQUE
+    )
+    """,
+    """
+    CREATE TABLE chat_messages (
+        id INTEGER PRIMARY KEY,
+        uid TEXT NOT NULL UNIQUE,
+        session_ref INTEGER NOT NULL REFERENCES chat_sessions (id),
+        role TEXT NOT NULL,
+        content TEXT NOT NULL,
+        ts REAL NOT NULL
+    )
+    """,
+    "INSERT INTO chat_sessions (session_id) SELECT DISTINCT session_id FROM chat_history",
+    """
+    INSERT INTO chat_messages (uid, session_ref, role, content, ts)
+    SELECT h.id, s.id, h.role, h.content, h.ts
+    FROM chat_history h JOIN chat_sessions s ON s.session_id = h.session_id
+    ORDER BY h.ts
+    """,
+    "DROP TABLE chat_history",
+    "CREATE INDEX idx_messages_session_ts ON chat_messages (session_ref, ts)",
+    """
+    CREATE VIEW chat_history AS
+    SELECT m.uid AS id, s.session_id AS session_id, m.role AS role, m.content AS content, m.ts AS ts
+    FROM chat_messages m JOIN chat_sessions s ON s.id = m.session_ref
+    """,
+    """
+    CREATE TRIGGER chat_history_insert INSTEAD OF INSERT ON chat_history
+    BEGIN
+        INSERT OR IGNORE INTO chat_sessions (session_id) VALUES (NEW.session_id);
+        INSERT OR IGNORE INTO chat_messages (uid, session_ref, role, content, ts)
+        SELECT NEW.id, id, NEW.role, NEW.content, NEW.ts FROM chat_sessions WHERE session_id = NEW.session_id;
+    END
+    """,
+    """
+    CREATE TRIGGER chat_history_delete INSTEAD OF DELETE ON chat_history
+    BEGIN
+        DELETE FROM chat_messages WHERE uid = OLD.id;
+    END
+    """,
+    "ANALYZE",
+]
+
+def is_compact_schema(conn: sqlite3.Connection) -> bool:
+    row = conn.execute("SELECT type FROM sqlite_master WHERE name='chat_history'").fetchone()
+    return row is not None and row[0] == "view"
+
+def apply_compact_schema(conn: sqlite3.Connection) -> bool:
+    """
+    Переводит историю на компактную схему одной транзакцией.
+    Возвращает True, если преобразование выполнено сейчас.
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if is_compact_schema(conn):
+            conn.execute("COMMIT")
+            return False
+
+        print("Converting chat history to the compact schema")
+        for statement in COMPACT_SCHEMA:
+            conn.execute(statement)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+    # Освобождённые страницы старой таблицы возвращаются файловой системе
+    conn.execute("VACUUM")
+    return True
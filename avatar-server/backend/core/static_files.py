@@ -0,0 +1,143 @@
+# avatar-server/backend/core/static_files.py
+import os
+import json
+import mimetypes
+from typing import Dict, List, Optional, Set, Tuple
+
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from starlette.types import Scope
+
+from .config import settings
+
+# Манифест, который пишет build_static.py рядом со статикой
+MANIFEST_NAME = "static-manifest.json"
+
+# Модель аватара: без явной регистрации уходила бы как text/plain
+mimetypes.add_type("model/gltf-binary", ".glb")
+mimetypes.add_type("model/gltf+json", ".gltf")
+
+# Порядок предпочтения предсжатых вариантов: расширение файла и Content-Encoding
+_ENCODINGS: List[Tuple[str, str]] = [("br", ".br"), ("gzip", ".gz")]
+
+def _accepted_encodings(header: str) -> Set[str]:
+    """Кодировки из Accept-Encoding, кроме явно запрещённых (q=0)"""
+    accepted = set()
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        params = params.replace(" ", "")
+        if params.startswith("q="):
+            try:
+                if float(params[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        if name:
+            accepted.add(name.lower())
+    return accepted
+
+class PrecompressedStaticFiles(StaticFiles):
+    """
+    Статика с предсжатыми вариантами и кэшированием в браузере.
+    
+    - если сборка (build_static.py) положила рядом с файлом .br/.gz, клиенту
+      отдаётся подходящий по Accept-Encoding вариант: сжатие не тратит
+      время воркера, а большой avatar.glb идёт по сети в разы меньше
+    - файлы с хэшем содержимого в имени отдаются с immutable Cache-Control,
+      и повторные загрузки страницы вообще не доходят до сервера;
+      остальные (index.html, файлы без сборки) — с ревалидацией по ETag
+    
+    Без манифеста (запуск из исходников) ведёт себя как обычный StaticFiles,
+    только с заголовком Cache-Control.
+    """
+    
+    def __init__(self, *, directory: str, **kwargs):
+        super().__init__(directory=directory, **kwargs)
+        self._root = os.path.realpath(directory)
+        self._immutable: Set[str] = set()
+        # Путь исходника → [(Content-Encoding, путь варианта, stat варианта)]
+        self._variants: Dict[str, List[Tuple[str, str, os.stat_result]]] = {}
+        self._load_manifest()
+    
+    def _load_manifest(self):
+        path = os.path.join(self._root, MANIFEST_NAME)
+        try:
+            with open(path, encoding="utf-8") as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            print(f"Static manifest {path} is unreadable, serving files as is: {e}")
+            return
+        
+        self._immutable = {os.path.join(self._root, name) for name in manifest.get("immutable", [])}
+        for name, encodings in manifest.get("encoded", {}).items():
+            source = os.path.join(self._root, name)
+            try:
+                source_stat = os.stat(source)
+            except OSError:
+                continue
+            variants = []
+            for encoding, suffix in _ENCODINGS:
+                if encoding not in encodings:
+                    continue
+                try:
+                    variant_stat = os.stat(source + suffix)
+                except OSError:
+                    continue
+                # Исходник правили после сборки — устаревший вариант не отдаём
+                if variant_stat.st_mtime_ns < source_stat.st_mtime_ns:
+                    continue
+                variants.append((encoding, source + suffix, variant_stat))
+            if variants:
+                self._variants[source] = variants
+    
+    def _cache_control(self, full_path: str) -> str:
+        if full_path in self._immutable:
+            return settings.STATIC_IMMUTABLE_CACHE_CONTROL
+        return settings.STATIC_CACHE_CONTROL
+    
+    def _pick_variant(self, full_path: str, request_headers: Headers) -> Optional[Tuple[str, str, os.stat_result]]:
+        variants = self._variants.get(full_path)
+        if not variants:
+            return None
+        accepted = _accepted_encodings(request_headers.get("accept-encoding", ""))
+        for variant in variants:
+            if variant[0] in accepted:
+                return variant
+        return None
+    
+    def file_response(
+        self,
+        full_path,
+        stat_result: os.stat_result,
+        scope: Scope,
+        status_code: int = 200
+    ) -> Response:
+        full_path = str(full_path)
+        request_headers = Headers(scope=scope)
+        headers = {"Cache-Control": self._cache_control(full_path)}
+        if full_path in self._variants:
+            # Ответ зависит от Accept-Encoding — кэшам нужно это знать
+            headers["Vary"] = "Accept-Encoding"
+        
+        variant = self._pick_variant(full_path, request_headers) if status_code == 200 else None
+        if variant is not None:
+            encoding, variant_path, variant_stat = variant
+            headers["Content-Encoding"] = encoding
+            # Тип содержимого — по исходнику; ETag и длина — по самому варианту
+            media_type = mimetypes.guess_type(full_path)[0] or "application/octet-stream"
+            response = FileResponse(
+                variant_path,
+                status_code=status_code,
+                headers=headers,
+                media_type=media_type,
+                stat_result=variant_stat
+            )
+        else:
+            response = FileResponse(full_path, status_code=status_code, headers=headers, stat_result=stat_result)
+        
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
@@ -1,28 +1,57 @@
 # avatar-server/backend/main.py
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from fastapi.staticfiles import StaticFiles
 
-from core.database import init_db
+from core.database import init_db, close_db
+from core.http_clients import init_http_clients, close_http_clients
 from core.security import setup_cors
-from api import chat, webrtc
+from core.metrics import MetricsMiddleware
+from core.static_files import PrecompressedStaticFiles
+from services import tts, chat_history, context, llm, signaling, maintenance
+from api import chat, webrtc, health, metrics
 
 # Инициализация базы данных
 init_db()
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Ресурсы уровня приложения: создаются при старте, освобождаются при остановке"""
+    init_http_clients()
+    tts.start_health_monitor()
+    llm.start_model_warmup()
+    await signaling.start_signaling()
+    chat_history.start_history_writer()
+    maintenance.start_maintenance()
+    yield
+    await maintenance.stop_maintenance()
+    await signaling.stop_signaling()
+    await llm.stop_model_warmup()
+    await context.stop_summaries()
+    await chat_history.stop_history_writer()
+    await tts.stop_health_monitor()
+    await close_http_clients()
+    close_db()
+
 # Создание приложения
-app = FastAPI(title="Digital Avatar API")
+app = FastAPI(title="Digital Avatar API", lifespan=lifespan)
 
 # Настройка CORS
 setup_cors(app)
 
+# Метрики запросов (маршрут определяется после роутинга, поэтому шаблон пути доступен)
+app.add_middleware(MetricsMiddleware)
+
 # Подключение роутеров
 app.include_router(chat.router)
+app.include_router(health.router)
+app.include_router(metrics.router)
 app.include_router(webrtc.router)
 
 # Монтирование статических файлов
 # ИСПРАВЛЕНО: Используем правильные пути внутри контейнера
-app.mount("/assets", StaticFiles(directory="assets"), name="assets")
-app.mount("/", StaticFiles(directory="frontend", html=True), name="frontend")
+# Предсжатые варианты и хэшированные имена готовит build_static.py (см. Dockerfile)
+app.mount("/assets", PrecompressedStaticFiles(directory="assets"), name="assets")
+app.mount("/", PrecompressedStaticFiles(directory="frontend", html=True), name="frontend")
 
 if __name__ == "__main__":
     import uvicorn
@@ -1,11 +1,12 @@
 # avatar-server/backend/models/__init__.py
-from .chat import ChatRequest, ChatResponse, ChatMessage
+from .chat import ChatRequest, ChatResponse, ChatMessage, HistoryPage
 from .tts import TTSRequest, TTSResponse
 
 __all__ = [
     "ChatRequest",
     "ChatResponse",
     "ChatMessage",
+    "HistoryPage",
     "TTSRequest",
     "TTSResponse"
 ]
\ No newline at end of file
@@ -14,8 +14,23 @@ class ChatRequest(BaseModel):
     temperature: float = 0.7
     max_tokens: int = 256
     model: str = "llama3"
+    # Желаемый формат озвучки (wav | ogg | mp3) и частота дискретизации
+    audio_format: Optional[str] = None
+    audio_sample_rate: Optional[int] = None
+    # Время последнего сообщения, которое уже есть у клиента:
+    # если задано, в history вернутся только более новые сообщения
+    since_ts: Optional[float] = None
 
 class ChatResponse(BaseModel):
     text: str
     history: List[Dict[str, Any]]
-    audio_url: Optional[str] = None
\ No newline at end of file
+    audio_url: Optional[str] = None
+    # Временная шкала открытия рта для lip-sync: {"frame_ms": ..., "values": [...]}
+    lipsync: Optional[Dict[str, Any]] = None
+    # Курсор для следующего запроса (since_ts)
+    last_ts: Optional[float] = None
+
+class HistoryPage(BaseModel):
+    messages: List[ChatMessage]
+    # Курсор для следующей (более старой) страницы; None — история закончилась
+    next_before: Optional[float] = None
\ No newline at end of file
@@ -1,12 +1,32 @@
 # avatar-server/backend/services/__init__.py
-from .llm import get_llm_response
-from .tts import is_tts_available, generate_audio
-from .chat_history import save_message, get_history
+from .llm import get_llm_response, stream_llm_response
+from .tts import is_tts_available, generate_audio, generate_speech, get_tts_status
+from .chat_history import (
+    save_message,
+    get_history,
+    save_message_async,
+    get_history_async,
+    get_history_page_async,
+    flush_history
+)
+from .speech_pipeline import SpeechPipeline, AudioSegment
+from .context import build_context, estimate_tokens
 
 __all__ = [
     "get_llm_response",
+    "stream_llm_response",
     "is_tts_available",
     "generate_audio",
+    "generate_speech",
+    "get_tts_status",
     "save_message",
-    "get_history"
+    "get_history",
+    "save_message_async",
+    "get_history_async",
+    "get_history_page_async",
+    "flush_history",
+    "SpeechPipeline",
+    "AudioSegment",
+    "build_context",
+    "estimate_tokens"
 ]
\ No newline at end of file
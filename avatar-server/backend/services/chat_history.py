@@ -1,11 +1,17 @@
 # avatar-server/backend/services/chat_history.py
 import uuid
 import time
-from typing import List, Dict
+import asyncio
+from collections import OrderedDict, deque
+from typing import List, Dict, Deque, Optional, Tuple
 
-from core.database import get_db_connection
+from core.config import settings
+from core.database import get_db_connection, run_db
 from models.chat import ChatMessage
 
+# Строка таблицы chat_history: (id, session_id, role, content, ts)
+Row = Tuple[str, str, str, str, float]
+
 def save_message(session_id: str, role: str, content: str):
     """Сохраняет сообщение в историю чата"""
     with get_db_connection() as conn:
@@ -14,19 +20,239 @@ def save_message(session_id: str, role: str, content: str):
             (str(uuid.uuid4()), session_id, role, content, time.time())
         )
 
+def save_messages(rows: List[Row]):
+    """Сохраняет пачку сообщений одной транзакцией"""
+    with get_db_connection() as conn:
+        conn.executemany(
+            "INSERT OR IGNORE INTO chat_history (id, session_id, role, content, ts) VALUES (?,?,?,?,?)",
+            rows
+        )
+
 def get_history(session_id: str, limit: int = 30) -> List[ChatMessage]:
     """Получает историю чата для сессии"""
+    # Индекс (session_id, ts) отдаёт последние сообщения уже упорядоченными
     with get_db_connection() as conn:
         rows = conn.execute(
             "SELECT role, content, ts FROM chat_history WHERE session_id=? ORDER BY ts DESC LIMIT ?",
             (session_id, limit)
         ).fetchall()
     
-    # Конвертируем в объекты ChatMessage
-    history = [
+    # Конвертируем в объекты ChatMessage (от старых к новым — просто разворот)
+    return [
         ChatMessage(role=row["role"], content=row["content"], ts=row["ts"])
-        for row in rows
+        for row in reversed(rows)
     ]
+
+def get_recent_timestamps(session_id: str, limit: int) -> List[float]:
+    """ts последних сообщений сессии (читается только индекс (session_id, ts))"""
+    with get_db_connection() as conn:
+        rows = conn.execute(
+            "SELECT ts FROM chat_history WHERE session_id=? ORDER BY ts DESC LIMIT ?",
+            (session_id, limit)
+        ).fetchall()
+    return [row["ts"] for row in rows]
+
+def get_history_page(session_id: str, before: Optional[float], limit: int) -> List[ChatMessage]:
+    """Страница истории: limit сообщений старше before (курсор), от старых к новым"""
+    with get_db_connection() as conn:
+        if before is None:
+            rows = conn.execute(
+                "SELECT role, content, ts FROM chat_history WHERE session_id=? ORDER BY ts DESC LIMIT ?",
+                (session_id, limit)
+            ).fetchall()
+        else:
+            rows = conn.execute(
+                "SELECT role, content, ts FROM chat_history WHERE session_id=? AND ts<? ORDER BY ts DESC LIMIT ?",
+                (session_id, before, limit)
+            ).fetchall()
+    
+    return [
+        ChatMessage(role=row["role"], content=row["content"], ts=row["ts"])
+        for row in reversed(rows)
+    ]
+
+class _SessionHistory:
+    """Хвост истории одной сессии в памяти"""
+    
+    def __init__(self, messages: List[ChatMessage], complete: bool):
+        self.messages: Deque[ChatMessage] = deque(messages, maxlen=settings.HISTORY_CACHE_MESSAGES)
+        # complete — в памяти вся история сессии, в БД нет более старых сообщений
+        self.complete = complete
+    
+    def append(self, message: ChatMessage):
+        if len(self.messages) == self.messages.maxlen:
+            self.complete = False
+        self.messages.append(message)
+
+class HistoryCache:
+    """
+    Кэш истории с отложенной записью.
+    
+    - последние HISTORY_CACHE_MESSAGES сообщений каждой сессии хранятся
+      в памяти, число сессий ограничено LRU (HISTORY_CACHE_SESSIONS)
+    - в режиме write_behind новые сообщения копятся в очереди и пишутся
+      пачкой раз в HISTORY_FLUSH_INTERVAL (или при HISTORY_FLUSH_BATCH строк)
+      и при остановке приложения; write_through пишет сразу
+    - кэш свой у каждого процесса: при нескольких воркерах uvicorn другой
+      воркер может дописать сессию в БД. С HISTORY_CACHE_VALIDATE попадание
+      сверяется с ts последних сообщений в БД (только индекс), и при
+      расхождении хвост перечитывается. Сообщения, ещё лежащие в очереди
+      другого воркера, видны после его сброса (до HISTORY_FLUSH_INTERVAL)
     
-    # Сортируем по времени (от старых к новым)
-    return sorted(history, key=lambda x: x.ts)
\ No newline at end of file
+    Работает только из event loop, поэтому блокировки не нужны.
+    """
+    
+    def __init__(self):
+        self._sessions: "OrderedDict[str, _SessionHistory]" = OrderedDict()
+        self._pending: List[Row] = []
+        self._flush_epoch = 0
+        self._flush_lock = asyncio.Lock()
+        self._flush_needed = asyncio.Event()
+        self._writer_task: Optional[asyncio.Task] = None
+    
+    async def save(self, session_id: str, role: str, content: str) -> ChatMessage:
+        message = ChatMessage(role=role, content=content, ts=time.time())
+        row = (str(uuid.uuid4()), session_id, role, content, message.ts)
+        
+        if settings.HISTORY_WRITE_MODE == "write_through":
+            await run_db(save_messages, [row])
+        else:
+            self._pending.append(row)
+            if len(self._pending) >= settings.HISTORY_FLUSH_BATCH:
+                self._flush_needed.set()
+        
+        entry = self._sessions.get(session_id)
+        if entry is not None:
+            entry.append(message)
+            self._sessions.move_to_end(session_id)
+        return message
+    
+    async def get(self, session_id: str, limit: int) -> List[ChatMessage]:
+        entry = self._sessions.get(session_id)
+        if entry is not None and (len(entry.messages) >= limit or entry.complete):
+            if not settings.HISTORY_CACHE_VALIDATE or await self._is_current(session_id, entry):
+                self._sessions.move_to_end(session_id)
+                messages = list(entry.messages)
+                return messages[-limit:] if limit < len(messages) else messages
+        
+        messages = await self._load(session_id, limit)
+        return messages[-limit:] if limit < len(messages) else messages
+    
+    async def _is_current(self, session_id: str, entry: _SessionHistory) -> bool:
+        """Все сообщения из БД в пределах хвоста есть в памяти (других записей не было)"""
+        timestamps = await run_db(get_recent_timestamps, session_id, len(entry.messages) or 1)
+        if not entry.messages:
+            return not timestamps
+        cached = {message.ts for message in entry.messages}
+        oldest = entry.messages[0].ts
+        return all(ts in cached for ts in timestamps if ts >= oldest)
+    
+    async def _load(self, session_id: str, limit: int) -> List[ChatMessage]:
+        """Читает хвост из БД в кэш; возвращает все прочитанные сообщения"""
+        fetch_limit = max(limit, settings.HISTORY_CACHE_MESSAGES)
+        while True:
+            epoch = self._flush_epoch
+            messages = await run_db(get_history, session_id, fetch_limit)
+            # Если за время чтения завершилась запись, часть строк могла уйти
+            # из очереди, не попав в прочитанный снимок — читаем заново
+            if epoch == self._flush_epoch:
+                break
+        complete = len(messages) < fetch_limit
+        
+        # Досыпаем ещё не записанные сообщения; строки, которые успели
+        # записаться во время чтения, отбрасываем как дубликаты
+        pending = [row for row in self._pending if row[1] == session_id]
+        if pending:
+            seen = {(m.role, m.content, m.ts) for m in messages}
+            for _, _, role, content, ts in pending:
+                if (role, content, ts) not in seen:
+                    messages.append(ChatMessage(role=role, content=content, ts=ts))
+        
+        # Полнота — после досыпки: если хвост не влез в deque, старые
+        # сообщения вытеснены, и в памяти уже не вся история
+        entry = _SessionHistory(messages, complete)
+        if len(messages) > len(entry.messages):
+            entry.complete = False
+        self._sessions[session_id] = entry
+        self._sessions.move_to_end(session_id)
+        while len(self._sessions) > settings.HISTORY_CACHE_SESSIONS:
+            self._sessions.popitem(last=False)
+        return messages
+    
+    def forget(self, session_ids: List[str]):
+        """Убирает сессии из памяти (их история удалена из БД)"""
+        for session_id in session_ids:
+            self._sessions.pop(session_id, None)
+    
+    async def flush(self):
+        """Записывает накопленные сообщения одной транзакцией"""
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            rows = self._pending[:]
+            await run_db(save_messages, rows)
+            # Удаляем из очереди только после успешной записи
+            del self._pending[:len(rows)]
+            self._flush_epoch += 1
+    
+    async def _run_writer(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_needed.wait(), settings.HISTORY_FLUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_needed.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                # Строки остаются в очереди и будут записаны при следующей попытке
+                print(f"Chat history flush error: {e}")
+    
+    def start(self):
+        if self._writer_task is None:
+            self._writer_task = asyncio.create_task(self._run_writer())
+    
+    async def stop(self):
+        if self._writer_task is not None:
+            self._writer_task.cancel()
+            try:
+                await self._writer_task
+            except asyncio.CancelledError:
+                pass
+            self._writer_task = None
+        await self.flush()
+
+_cache = HistoryCache()
+
+async def save_message_async(session_id: str, role: str, content: str) -> ChatMessage:
+    """Сохраняет сообщение через кэш истории (запись в БД — отложенная)"""
+    return await _cache.save(session_id, role, content)
+
+async def get_history_async(session_id: str, limit: int = 30) -> List[ChatMessage]:
+    """Получает историю из памяти; к БД обращается только при промахе кэша"""
+    return await _cache.get(session_id, limit)
+
+async def get_history_page_async(
+    session_id: str,
+    before: Optional[float] = None,
+    limit: int = 50
+) -> List[ChatMessage]:
+    """Постраничное чтение из БД (отложенные записи сначала сбрасываются)"""
+    await _cache.flush()
+    return await run_db(get_history_page, session_id, before, limit)
+
+async def flush_history():
+    """Принудительно записывает отложенные сообщения в БД"""
+    await _cache.flush()
+
+def forget_sessions(session_ids: List[str]):
+    """Сбрасывает кэш удалённых сессий, чтобы не отдавать их историю из памяти"""
+    _cache.forget(session_ids)
+
+def start_history_writer():
+    """Запускает фоновую запись истории (вызывается при старте приложения)"""
+    _cache.start()
+
+async def stop_history_writer():
+    """Останавливает фоновую запись и сбрасывает очередь (при остановке приложения)"""
+    await _cache.stop()
@@ -0,0 +1,190 @@
+# avatar-server/backend/services/context.py
+import time
+import asyncio
+from collections import OrderedDict
+from typing import List, Optional, Set, Tuple
+
+from core.config import settings
+from core.database import get_db_connection, run_db
+from models.chat import ChatMessage
+from services import llm
+
+# Служебные токены на одно сообщение (роль, разделители шаблона чата)
+_MESSAGE_OVERHEAD = 4
+
+def estimate_tokens(text: str) -> int:
+    """Грубая оценка числа токенов по длине текста (без токенизатора модели)"""
+    return int(len(text) / settings.CONTEXT_CHARS_PER_TOKEN) + _MESSAGE_OVERHEAD
+
+def load_summary(session_id: str) -> Optional[Tuple[str, float]]:
+    """Читает резюме сессии: (текст, ts последнего учтённого сообщения)"""
+    with get_db_connection() as conn:
+        row = conn.execute(
+            "SELECT summary, upto_ts FROM chat_summaries WHERE session_id=?",
+            (session_id,)
+        ).fetchone()
+    return (row["summary"], row["upto_ts"]) if row else None
+
+def store_summary(session_id: str, summary: str, upto_ts: float):
+    """Сохраняет (или заменяет) резюме сессии"""
+    with get_db_connection() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO chat_summaries (session_id, summary, upto_ts, updated_ts) VALUES (?,?,?,?)",
+            (session_id, summary, upto_ts, time.time())
+        )
+
+class ContextBuilder:
+    """
+    Собирает контекст для LLM в пределах бюджета токенов.
+    
+    - берёт самые свежие сообщения истории, пока они помещаются в
+      CONTEXT_TOKEN_BUDGET (за вычетом системного промпта и вопроса)
+    - при переполнении история обрезается с запасом (CONTEXT_REFIT_RATIO),
+      после чего начало контекста сессии не сдвигается, пока снова не
+      перестанет помещаться: префикс запроса совпадает между ходами,
+      и Ollama не пересчитывает его заново
+    - вытесненные сообщения сжимаются в скользящее резюме сессии; резюме
+      обновляется в фоне и попадает в контекст со следующего запроса,
+      поэтому ответ пользователю не ждёт суммаризации. Пока резюме их
+      не покрывает, вытесненные сообщения остаются в контексте сверх
+      бюджета — иначе они пропали бы из промпта до суммаризации
+    - если суммаризация сессии не удалась, бюджет снова строгий: старые
+      несуммированные сообщения отбрасываются (начало контекста то же),
+      пока очередная попытка не сохранит резюме
+    
+    Работает только из event loop, как и кэш истории.
+    """
+    
+    def __init__(self):
+        # None в значении — в БД резюме нет (чтобы не перечитывать каждый раз)
+        self._summaries: "OrderedDict[str, Optional[Tuple[str, float]]]" = OrderedDict()
+        # ts первого сообщения контекста по сессиям
+        self._anchors: "OrderedDict[str, float]" = OrderedDict()
+        self._in_progress: Set[str] = set()
+        # Сессии, чья последняя суммаризация не удалась
+        self._failed: "OrderedDict[str, None]" = OrderedDict()
+        self._tasks: Set[asyncio.Task] = set()
+    
+    async def build(
+        self,
+        session_id: str,
+        message: str,
+        history: List[ChatMessage],
+        system_prompt: Optional[str] = None
+    ) -> Tuple[List[ChatMessage], Optional[str]]:
+        """Возвращает (сообщения истории для промпта, резюме старой части или None)"""
+        summary = await self._get_summary(session_id) if settings.SUMMARY_ENABLED else None
+        summary_text, upto_ts = summary if summary else (None, 0.0)
+        
+        budget = settings.CONTEXT_TOKEN_BUDGET
+        budget -= estimate_tokens(llm.normalize_system_prompt(system_prompt or settings.SYSTEM_PROMPT))
+        budget -= estimate_tokens(message)
+        if summary_text:
+            budget -= estimate_tokens(summary_text)
+        
+        # Сначала пробуем сохранить прежнее начало контекста
+        anchor = self._anchors.get(session_id, 0.0)
+        start = next((i for i, msg in enumerate(history) if msg.ts >= anchor), len(history))
+        if sum(estimate_tokens(msg.content) for msg in history[start:]) > budget:
+            # Не помещается — идём от новых к старым до доли бюджета
+            limit = budget * settings.CONTEXT_REFIT_RATIO
+            start = len(history)
+            for msg in reversed(history):
+                cost = estimate_tokens(msg.content)
+                if cost > limit:
+                    break
+                limit -= cost
+                start -= 1
+        
+        if start < len(history):
+            self._anchors[session_id] = history[start].ts
+            self._anchors.move_to_end(session_id)
+            while len(self._anchors) > settings.HISTORY_CACHE_SESSIONS:
+                self._anchors.popitem(last=False)
+        
+        if settings.SUMMARY_ENABLED:
+            unsummarized = [msg for msg in history[:start] if msg.ts > upto_ts]
+            if len(unsummarized) >= settings.SUMMARY_MIN_MESSAGES:
+                self._schedule_summary(session_id, summary_text, unsummarized)
+            # Резюме их ещё не покрывает (мало сообщений или оно в работе);
+            # после неудачной суммаризации — жёсткая обрезка по бюджету
+            if session_id not in self._failed:
+                start -= len(unsummarized)
+        
+        # Сообщения, уже вошедшие в резюме, второй раз в контекст не попадают
+        context = [msg for msg in history[start:] if msg.ts > upto_ts]
+        return context, summary_text
+    
+    async def _get_summary(self, session_id: str) -> Optional[Tuple[str, float]]:
+        if session_id in self._summaries:
+            self._summaries.move_to_end(session_id)
+            return self._summaries[session_id]
+        
+        summary = await run_db(load_summary, session_id)
+        self._remember(session_id, summary)
+        return summary
+    
+    def _remember(self, session_id: str, summary: Optional[Tuple[str, float]]):
+        self._summaries[session_id] = summary
+        self._summaries.move_to_end(session_id)
+        while len(self._summaries) > settings.HISTORY_CACHE_SESSIONS:
+            self._summaries.popitem(last=False)
+    
+    def _schedule_summary(self, session_id: str, previous: Optional[str], messages: List[ChatMessage]):
+        # Одновременно обновляется не больше одного резюме на сессию
+        if session_id in self._in_progress:
+            return
+        self._in_progress.add(session_id)
+        task = asyncio.create_task(self._summarize(session_id, previous, messages))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+    
+    async def _summarize(self, session_id: str, previous: Optional[str], messages: List[ChatMessage]):
+        try:
+            summary = await llm.summarize_messages(previous, messages)
+            if not summary:
+                raise ValueError("empty summary")
+            upto_ts = messages[-1].ts
+            await run_db(store_summary, session_id, summary, upto_ts)
+            self._remember(session_id, (summary, upto_ts))
+            self._failed.pop(session_id, None)
+        except Exception as e:
+            # Без свежего резюме контекст просто короче — ответы не ломаются
+            print(f"Chat summary error: {e}")
+            self._failed[session_id] = None
+            self._failed.move_to_end(session_id)
+            while len(self._failed) > settings.HISTORY_CACHE_SESSIONS:
+                self._failed.popitem(last=False)
+        finally:
+            self._in_progress.discard(session_id)
+    
+    def forget(self, session_ids: List[str]):
+        for session_id in session_ids:
+            self._summaries.pop(session_id, None)
+            self._anchors.pop(session_id, None)
+            self._failed.pop(session_id, None)
+    
+    async def stop(self):
+        for task in list(self._tasks):
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+_builder = ContextBuilder()
+
+async def build_context(
+    session_id: str,
+    message: str,
+    history: List[ChatMessage],
+    system_prompt: Optional[str] = None
+) -> Tuple[List[ChatMessage], Optional[str]]:
+    """Подбирает историю под бюджет токенов и возвращает её вместе с резюме"""
+    return await _builder.build(session_id, message, history, system_prompt)
+
+def forget_sessions(session_ids: List[str]):
+    """Сбрасывает резюме и начало контекста удалённых сессий"""
+    _builder.forget(session_ids)
+
+async def stop_summaries():
+    """Отменяет незавершённую суммаризацию (при остановке приложения)"""
+    await _builder.stop()
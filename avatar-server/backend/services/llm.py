@@ -1,46 +1,186 @@
 # avatar-server/backend/services/llm.py
 import re
+import json
+import time
+import asyncio
+import textwrap
 import httpx
-from typing import Optional, Dict, Any
+from functools import lru_cache
+from typing import Optional, Dict, Any, AsyncIterator, List, Tuple, Union
 
 from core.config import settings
+from core.http_clients import get_ollama_client
+from core.metrics import OLLAMA_DURATION, OLLAMA_TOKENS, UPSTREAM_ERRORS
 from models.chat import ChatMessage
 
+# Классы символов для проверки языка. Таблица покрывает кодовые точки до U+3000
+# (последний пробельный символ Unicode): str.translate за один проход в C
+# превращает текст в строку классов, остальное — подсчёт str.count
+_RU, _EN, _WS = "\x01", "\x02", "\x03"
+
+def _build_language_table() -> str:
+    table = []
+    for code in range(0x3001):
+        char = chr(code)
+        if "а" <= char <= "я" or "А" <= char <= "Я":
+            table.append(_RU)
+        elif "a" <= char <= "z" or "A" <= char <= "Z":
+            table.append(_EN)
+        elif char.isspace() and char != " ":
+            # Пробел в долю не входит, а переводы строк и прочие пробельные — входят
+            table.append(_WS)
+        else:
+            table.append("\x00")
+    return "".join(table)
+
+_LANGUAGE_TABLE = _build_language_table()
+_LATIN_RE = re.compile(r'[a-zA-Z]')
+
+_NOT_UNDERSTOOD = "Извините, я не понял ваш вопрос. Пожалуйста, повторите его на русском языке."
+_ASK_IN_RUSSIAN = "Пожалуйста, задайте ваш вопрос на русском языке. Я могу отвечать только на русском."
+_ONLY_RUSSIAN = "Извините, я могу отвечать только на русском языке. Пожалуйста, повторите ваш вопрос."
+
+def count_language_chars(text: str) -> Tuple[int, int, int]:
+    """Число русских букв, латинских букв и пробельных символов (кроме пробела)"""
+    classes = text.translate(_LANGUAGE_TABLE)
+    return classes.count(_RU), classes.count(_EN), classes.count(_WS)
+
+def _language_replacement(russian: int, english: int, whitespace: int, user_message: str) -> Optional[str]:
+    """Текст замены по счётчикам символов или None, если ответ на русском"""
+    if russian + english == 0:
+        return _NOT_UNDERSTOOD
+    
+    # Если есть английские символы и их больше 10% от всех символов
+    if english > 0 and english / (russian + english + whitespace) > 0.1:
+        if _LATIN_RE.search(user_message):
+            # Если вопрос был на английском, просим повторить на русском
+            return _ASK_IN_RUSSIAN
+        # Если вопрос был на русском, но ответ на английском
+        return _ONLY_RUSSIAN
+    return None
+
 def ensure_russian_response(text: str, user_message: str) -> str:
     """
     Проверяет, содержит ли ответ кириллические символы.
     Если нет, возвращает принудительный ответ на русском языке.
     """
-    # Удаляем всё, кроме букв и пробелов
-    clean_text = re.sub(r'[^а-яА-Яa-zA-Z\s]', '', text)
+    replacement = _language_replacement(*count_language_chars(text), user_message)
+    return text if replacement is None else replacement
+
+class LanguageGuard:
+    """
+    Инкрементальная проверка языка потокового ответа.
     
-    # Если текст пустой после очистки, возвращаем стандартный ответ
-    if not clean_text.strip():
-        return "Извините, я не понял ваш вопрос. Пожалуйста, повторите его на русском языке."
+    Фрагменты подсчитываются по мере поступления (каждый символ — один раз),
+    поэтому проверка после каждого токена не пересканирует накопленный текст.
+    Решение принимается, когда накоплено min_letters букв.
+    """
     
-    # Подсчитываем количество русских и английских символов
-    russian_chars = len(re.findall(r'[а-яА-Я]', clean_text))
-    english_chars = len(re.findall(r'[a-zA-Z]', clean_text))
-    total_chars = len(clean_text.replace(' ', ''))
+    def __init__(self, user_message: str, min_letters: Optional[int] = None):
+        self.user_message = user_message
+        self.min_letters = settings.STREAM_GUARD_MIN_CHARS if min_letters is None else min_letters
+        self.russian = 0
+        self.english = 0
+        self.whitespace = 0
     
-    # Если есть английские символы и их больше 10% от всех символов
-    if english_chars > 0 and (english_chars / max(1, total_chars)) > 0.1:
-        if re.search(r'[a-zA-Z]', user_message):
-            # Если вопрос был на английском, просим повторить на русском
-            return "Пожалуйста, задайте ваш вопрос на русском языке. Я могу отвечать только на русском."
-        else:
-            # Если вопрос был на русском, но ответ на английском
-            return "Извините, я могу отвечать только на русском языке. Пожалуйста, повторите ваш вопрос."
+    @property
+    def letters(self) -> int:
+        return self.russian + self.english
+    
+    def feed(self, chunk: str) -> Optional[str]:
+        """Учитывает фрагмент; возвращает текст замены, если ответ ушёл в английский"""
+        russian, english, whitespace = count_language_chars(chunk)
+        self.russian += russian
+        self.english += english
+        self.whitespace += whitespace
+        return self.verdict()
+    
+    def verdict(self) -> Optional[str]:
+        if self.letters < self.min_letters:
+            return None
+        return _language_replacement(self.russian, self.english, self.whitespace, self.user_message)
+
+# Последние тайминги Ollama по моделям (для /api/health)
+_timings: Dict[str, Dict[str, Any]] = {}
+_warmup_task: Optional[asyncio.Task] = None
+
+@lru_cache(maxsize=32)
+def normalize_system_prompt(prompt: str) -> str:
+    """
+    Приводит системный промпт к каноническому виду (без общего отступа
+    и хвостовых пробелов). Одинаковые байты префикса в каждом запросе —
+    условие переиспользования KV-кэша Ollama.
+    """
+    lines = textwrap.dedent(prompt).strip().splitlines()
+    return "\n".join(line.rstrip() for line in lines)
+
+def keep_alive() -> Union[int, str]:
+    """keep_alive для Ollama: число секунд ("-1", "3600") или длительность ("30m")"""
+    value = settings.OLLAMA_KEEP_ALIVE.strip()
+    try:
+        return int(value)
+    except ValueError:
+        return value
+
+def record_timings(model: str, data: Dict[str, Any]):
+    """
+    Сохраняет длительности из ответа Ollama (наносекунды → мс): загрузка
+    модели, обработка промпта и генерация. Без вывода в лог на каждый
+    вызов — они видны в /metrics и в /health.
+    """
+    timings = {
+        "total_ms": data.get("total_duration", 0) / 1e6,
+        "load_ms": data.get("load_duration", 0) / 1e6,
+        "prompt_eval_count": data.get("prompt_eval_count", 0),
+        "prompt_eval_ms": data.get("prompt_eval_duration", 0) / 1e6,
+        "eval_count": data.get("eval_count", 0),
+        "eval_ms": data.get("eval_duration", 0) / 1e6,
+        "at": time.time()
+    }
+    _timings[model] = timings
+    for phase in ("total", "load", "prompt_eval", "eval"):
+        OLLAMA_DURATION.labels(model, phase).observe(timings[f"{phase}_ms"] / 1000)
+    OLLAMA_TOKENS.labels(model, "prompt").inc(timings["prompt_eval_count"])
+    OLLAMA_TOKENS.labels(model, "eval").inc(timings["eval_count"])
+
+def get_llm_status() -> Dict[str, Any]:
+    """Последние тайминги Ollama по моделям"""
+    return {"keep_alive": keep_alive(), "timings": dict(_timings)}
+
+def build_messages(
+    message: str,
+    history: list,
+    system_prompt: Optional[str] = None,
+    summary: Optional[str] = None
+) -> List[Dict[str, str]]:
+    """Собирает список сообщений для Ollama: системный промпт, резюме, история, вопрос"""
+    messages = []
+    # Порядок (системный промпт → резюме → история → вопрос) держит
+    # неизменную часть в начале, чтобы префикс совпадал между запросами
+    messages.append({
+        "role": "system",
+        "content": normalize_system_prompt(system_prompt or settings.SYSTEM_PROMPT)
+    })
+    
+    if summary:
+        messages.append({
+            "role": "system",
+            "content": f"Краткое содержание предыдущей части разговора: {summary}"
+        })
+    
+    for msg in history:
+        messages.append({"role": msg.role, "content": msg.content})
     
-    # Если ответ уже на русском, возвращаем как есть
-    return text
+    messages.append({"role": "user", "content": message})
+    return messages
 
 async def get_llm_response(
     message: str,
     history: list,
     system_prompt: Optional[str] = None,
     temperature: float = 0.7,
-    model: str = "llama3"
+    model: str = "llama3",
+    summary: Optional[str] = None
 ) -> str:
     """
     Получает ответ от LLM через Ollama
@@ -51,46 +191,176 @@ async def get_llm_response(
         system_prompt: Системный промпт (опционально)
         temperature: Параметр температуры
         model: Модель для использования
+        summary: Резюме более старой части разговора (опционально)
     
     Returns:
         Текст ответа от LLM
     """
-    # Подготовка промпта
-    messages = []
-    messages.append({"role": "system", "content": system_prompt or settings.SYSTEM_PROMPT})
+    # Подготовка payload
+    payload = {
+        "model": model,
+        "messages": build_messages(message, history, system_prompt, summary),
+        "options": {"temperature": temperature},
+        "stream": False,
+        "keep_alive": keep_alive()
+    }
     
-    for msg in history:
-        messages.append({"role": msg.role, "content": msg.content})
+    # Запрос к Ollama
+    client = get_ollama_client()
+    try:
+        response = await client.post("/api/chat", json=payload)
+        response.raise_for_status()
+        
+        # Парсим JSON ответ
+        response_data = response.json()
+        record_timings(model, response_data)
+        assistant_text = response_data["message"]["content"].strip()
+        
+        # Принудительно проверяем и исправляем язык ответа
+        if settings.FORCE_RUSSIAN:
+            assistant_text = ensure_russian_response(assistant_text, message)
+        
+        return assistant_text
     
-    messages.append({"role": "user", "content": message})
+    except httpx.RequestError as e:
+        UPSTREAM_ERRORS.labels("ollama", "connection").inc()
+        raise ConnectionError(f"Request error to Ollama: {str(e)}")
+    except httpx.HTTPStatusError as e:
+        UPSTREAM_ERRORS.labels("ollama", "http").inc()
+        raise RuntimeError(f"Ollama HTTP error: {str(e)}")
+    except (KeyError, ValueError) as e:
+        raise ValueError(f"Invalid response format from Ollama: {str(e)}")
+
+async def stream_llm_response(
+    message: str,
+    history: list,
+    system_prompt: Optional[str] = None,
+    temperature: float = 0.7,
+    model: str = "llama3",
+    summary: Optional[str] = None
+) -> AsyncIterator[str]:
+    """
+    Потоковый вариант get_llm_response: отдаёт фрагменты ответа по мере
+    генерации (Ollama с "stream": true возвращает NDJSON по строке на чанк).
     
-    # Подготовка payload
+    Проверка языка здесь не выполняется — её делает вызывающий код,
+    т.к. ему нужно решать, что уже отправлено клиенту.
+    """
     payload = {
         "model": model,
-        "messages": messages,
+        "messages": build_messages(message, history, system_prompt, summary),
         "options": {"temperature": temperature},
-        "stream": False
+        "stream": True,
+        "keep_alive": keep_alive()
     }
     
-    # Запрос к Ollama
-    async with httpx.AsyncClient(timeout=60) as client:
-        try:
-            response = await client.post(f"{settings.OLLAMA_URL}/api/chat", json=payload)
+    client = get_ollama_client()
+    try:
+        async with client.stream("POST", "/api/chat", json=payload) as response:
             response.raise_for_status()
             
-            # Парсим JSON ответ
-            response_data = response.json()
-            assistant_text = response_data["message"]["content"].strip()
-            
-            # Принудительно проверяем и исправляем язык ответа
-            if settings.FORCE_RUSSIAN:
-                assistant_text = ensure_russian_response(assistant_text, message)
-            
-            return assistant_text
-            
-        except httpx.RequestError as e:
-            raise ConnectionError(f"Request error to Ollama: {str(e)}")
-        except httpx.HTTPStatusError as e:
-            raise RuntimeError(f"Ollama HTTP error: {str(e)}")
-        except (KeyError, ValueError) as e:
-            raise ValueError(f"Invalid response format from Ollama: {str(e)}")
\ No newline at end of file
+            async for line in response.aiter_lines():
+                if not line.strip():
+                    continue
+                
+                chunk = json.loads(line)
+                if "error" in chunk:
+                    UPSTREAM_ERRORS.labels("ollama", "stream").inc()
+                    raise RuntimeError(f"Ollama error: {chunk['error']}")
+                
+                token = chunk.get("message", {}).get("content", "")
+                if token:
+                    yield token
+                
+                if chunk.get("done"):
+                    # Финальный чанк содержит длительности всего запроса
+                    record_timings(model, chunk)
+                    break
+    
+    except httpx.RequestError as e:
+        UPSTREAM_ERRORS.labels("ollama", "connection").inc()
+        raise ConnectionError(f"Request error to Ollama: {str(e)}")
+    except httpx.HTTPStatusError as e:
+        UPSTREAM_ERRORS.labels("ollama", "http").inc()
+        raise RuntimeError(f"Ollama HTTP error: {str(e)}")
+    except ValueError as e:
+        raise ValueError(f"Invalid response format from Ollama: {str(e)}")
+
+async def summarize_messages(previous_summary: Optional[str], history: list) -> str:
+    """
+    Сжимает фрагмент разговора в краткое резюме (скользящее: новое резюме
+    включает предыдущее). Вызывается в фоне, не на пути ответа пользователю.
+    """
+    transcript = "\n".join(
+        f"{'Пользователь' if msg.role == 'user' else 'Ассистент'}: {msg.content}"
+        for msg in history
+    )
+    prompt = (
+        "Сожми разговор ниже в краткое резюме на русском языке (3-5 предложений). "
+        "Сохрани факты о пользователе, договорённости и открытые вопросы.\n\n"
+    )
+    if previous_summary:
+        prompt += f"Предыдущее резюме: {previous_summary}\n\n"
+    prompt += f"Разговор:\n{transcript}"
+    
+    payload = {
+        "model": settings.SUMMARY_MODEL or settings.DEFAULT_MODEL,
+        "messages": [{"role": "user", "content": prompt}],
+        "options": {"temperature": 0.2, "num_predict": settings.SUMMARY_MAX_TOKENS},
+        "stream": False,
+        "keep_alive": keep_alive()
+    }
+    
+    client = get_ollama_client()
+    try:
+        response = await client.post("/api/chat", json=payload)
+        response.raise_for_status()
+        return response.json()["message"]["content"].strip()
+    except httpx.RequestError as e:
+        UPSTREAM_ERRORS.labels("ollama", "connection").inc()
+        raise ConnectionError(f"Request error to Ollama: {str(e)}")
+    except httpx.HTTPStatusError as e:
+        UPSTREAM_ERRORS.labels("ollama", "http").inc()
+        raise RuntimeError(f"Ollama HTTP error: {str(e)}")
+    except (KeyError, ValueError) as e:
+        raise ValueError(f"Invalid response format from Ollama: {str(e)}")
+
+async def warmup_model(model: Optional[str] = None):
+    """
+    Загружает модель в память и прогоняет через неё системный промпт,
+    чтобы первый пользователь не платил за холодный старт, а префикс
+    системного промпта уже был в KV-кэше.
+    """
+    model = model or settings.DEFAULT_MODEL
+    payload = {
+        "model": model,
+        "messages": [{"role": "system", "content": normalize_system_prompt(settings.SYSTEM_PROMPT)}],
+        "options": {"num_predict": 1},
+        "stream": False,
+        "keep_alive": keep_alive()
+    }
+    
+    client = get_ollama_client()
+    try:
+        response = await client.post("/api/chat", json=payload)
+        response.raise_for_status()
+        record_timings(model, response.json())
+    except (httpx.HTTPError, ValueError) as e:
+        print(f"Ollama warmup failed for {model}: {e}")
+
+def start_model_warmup():
+    """Запускает прогрев модели в фоне (вызывается при старте приложения)"""
+    global _warmup_task
+    if settings.OLLAMA_WARMUP and _warmup_task is None:
+        _warmup_task = asyncio.create_task(warmup_model())
+
+async def stop_model_warmup():
+    """Отменяет незавершённый прогрев (при остановке приложения)"""
+    global _warmup_task
+    if _warmup_task is not None:
+        _warmup_task.cancel()
+        try:
+            await _warmup_task
+        except asyncio.CancelledError:
+            pass
+        _warmup_task = None
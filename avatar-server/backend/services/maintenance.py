@@ -0,0 +1,242 @@
+# avatar-server/backend/services/maintenance.py
+"""
+Фоновое обслуживание chat.db: срок хранения истории, архив удаляемого
+и VACUUM/ANALYZE/wal_checkpoint.
+
+Разовый запуск (например, из cron или перед бэкапом):
+
+    python -m services.maintenance
+    python -m services.maintenance --compact
+"""
+import os
+import gzip
+import json
+import time
+import asyncio
+import argparse
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from core.config import settings
+from core.database import close_db, get_db_connection, init_db, run_db
+from core.metrics import HISTORY_PRUNED
+from core.migrations import apply_compact_schema, is_compact_schema
+from services import chat_history, context
+
+_maintenance_task: Optional[asyncio.Task] = None
+
+class HistoryArchive:
+    """
+    gzip-архив удаляемых сообщений (JSON Lines), один файл на запуск.
+    Пачка пишется и сбрасывается на диск до фиксации её удаления.
+    """
+    
+    def __init__(self, directory: str):
+        self.path = os.path.join(directory, f"chat-history-{time.strftime('%Y%m%d-%H%M%S')}.jsonl.gz")
+        self._file = None
+    
+    def write(self, rows: Sequence[Any]):
+        if self._file is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._file = gzip.open(self.path, "at", encoding="utf-8")
+        for row in rows:
+            record = {"session_id": row["session_id"], "role": row["role"], "content": row["content"], "ts": row["ts"]}
+            self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+    
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+def find_expired_sessions(cutoff: float) -> List[str]:
+    """Сессии, последнее сообщение которых старше cutoff"""
+    with get_db_connection() as conn:
+        rows = conn.execute(
+            "SELECT session_id FROM chat_history GROUP BY session_id HAVING MAX(ts)<?",
+            (cutoff,)
+        ).fetchall()
+    return [row["session_id"] for row in rows]
+
+def find_oversized_sessions(max_messages: int) -> List[Tuple[str, float]]:
+    """Сессии сверх лимита сообщений: (session_id, ts самого старого из оставляемых)"""
+    with get_db_connection() as conn:
+        rows = conn.execute(
+            "SELECT session_id FROM chat_history GROUP BY session_id HAVING COUNT(*)>?",
+            (max_messages,)
+        ).fetchall()
+        result = []
+        for row in rows:
+            keep_from = conn.execute(
+                "SELECT ts FROM chat_history WHERE session_id=? ORDER BY ts DESC LIMIT 1 OFFSET ?",
+                (row["session_id"], max_messages - 1)
+            ).fetchone()
+            result.append((row["session_id"], keep_from["ts"]))
+    return result
+
+def prune_batch(condition: str, params: Sequence[Any], limit: int, archive: Optional[HistoryArchive]) -> int:
+    """
+    Удаляет до limit сообщений, подходящих под условие, одной короткой
+    транзакцией (запись истории ждёт не дольше одной пачки).
+    BEGIN IMMEDIATE: два воркера не заархивируют одни и те же строки.
+    """
+    with get_db_connection() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        rows = conn.execute(
+            f"SELECT id, session_id, role, content, ts FROM chat_history WHERE {condition} LIMIT ?",
+            (*params, limit)
+        ).fetchall()
+        if rows:
+            if archive is not None:
+                archive.write(rows)
+            conn.executemany("DELETE FROM chat_history WHERE id=?", [(row["id"],) for row in rows])
+    return len(rows)
+
+def drop_sessions(session_ids: Sequence[str]):
+    """Удаляет резюме (и запись сессии в компактной схеме), если сообщений не осталось"""
+    placeholders = ",".join("?" * len(session_ids))
+    with get_db_connection() as conn:
+        conn.execute(
+            f"""DELETE FROM chat_summaries WHERE session_id IN ({placeholders})
+            AND NOT EXISTS (SELECT 1 FROM chat_history h WHERE h.session_id = chat_summaries.session_id)""",
+            tuple(session_ids)
+        )
+        if is_compact_schema(conn):
+            conn.execute(
+                f"""DELETE FROM chat_sessions WHERE session_id IN ({placeholders})
+                AND NOT EXISTS (SELECT 1 FROM chat_messages m WHERE m.session_ref = chat_sessions.id)""",
+                tuple(session_ids)
+            )
+
+def optimize_db(analyze: bool, vacuum_free_ratio: float) -> Dict[str, Any]:
+    """
+    Статистика планировщика, VACUUM при заметной доле свободных страниц
+    и усечение WAL-файла
+    """
+    with get_db_connection() as conn:
+        # После массового удаления статистика устарела; иначе optimize
+        # пересчитывает её только там, где это нужно
+        conn.execute("ANALYZE" if analyze else "PRAGMA optimize")
+    
+    with get_db_connection() as conn:
+        pages = conn.execute("PRAGMA page_count").fetchone()[0]
+        free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        vacuumed = bool(pages) and free / pages >= vacuum_free_ratio
+        if vacuumed:
+            conn.execute("VACUUM")
+        busy, wal_pages, _ = conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+    
+    return {"pages": pages, "free_pages": free, "vacuumed": vacuumed, "checkpoint_busy": bool(busy), "wal_pages": wal_pages}
+
+async def _prune(condition: str, params: Sequence[Any], archive: Optional[HistoryArchive]) -> int:
+    batch = max(1, settings.MAINTENANCE_BATCH_SIZE)
+    total = 0
+    while True:
+        removed = await run_db(prune_batch, condition, params, batch, archive)
+        total += removed
+        if removed < batch:
+            return total
+
+async def expire_sessions(retention_days: float, archive: Optional[HistoryArchive]) -> int:
+    """Удаляет сессии, неактивные дольше retention_days"""
+    cutoff = time.time() - retention_days * 86400
+    session_ids = await run_db(find_expired_sessions, cutoff)
+    removed = 0
+    chunk_size = max(1, settings.MAINTENANCE_BATCH_SIZE)
+    for start in range(0, len(session_ids), chunk_size):
+        chunk = session_ids[start:start + chunk_size]
+        placeholders = ",".join("?" * len(chunk))
+        # ts<cutoff: сообщение, пришедшее в сессию во время обслуживания, остаётся
+        removed += await _prune(f"session_id IN ({placeholders}) AND ts<?", (*chunk, cutoff), archive)
+        await run_db(drop_sessions, chunk)
+        chat_history.forget_sessions(chunk)
+        context.forget_sessions(chunk)
+    HISTORY_PRUNED.labels("expired").inc(removed)
+    return removed
+
+async def trim_sessions(max_messages: int, archive: Optional[HistoryArchive]) -> int:
+    """
+    Оставляет в каждой сессии не больше max_messages последних сообщений.
+    При включённых резюме удаляются только сообщения, которые резюме
+    уже покрывает (ts не позже upto_ts): остальные контекст ещё не учёл.
+    """
+    removed = 0
+    for session_id, keep_from in await run_db(find_oversized_sessions, max_messages):
+        condition, params = "session_id=? AND ts<?", (session_id, keep_from)
+        if settings.SUMMARY_ENABLED:
+            summary = await run_db(context.load_summary, session_id)
+            if summary is None:
+                continue
+            condition, params = "session_id=? AND ts<? AND ts<=?", (session_id, keep_from, summary[1])
+        removed += await _prune(condition, params, archive)
+    HISTORY_PRUNED.labels("trimmed").inc(removed)
+    return removed
+
+async def run_maintenance() -> Dict[str, Any]:
+    """Один проход обслуживания: срок хранения, лимит на сессию, оптимизация БД"""
+    started = time.monotonic()
+    # Отложенные записи истории должны попасть в БД до отбора устаревшего
+    await chat_history.flush_history()
+    
+    archive = HistoryArchive(settings.HISTORY_ARCHIVE_DIR) if settings.HISTORY_ARCHIVE_DIR else None
+    report: Dict[str, Any] = {"expired": 0, "trimmed": 0}
+    try:
+        if settings.HISTORY_RETENTION_DAYS > 0:
+            report["expired"] = await expire_sessions(settings.HISTORY_RETENTION_DAYS, archive)
+        if settings.HISTORY_SESSION_MAX_MESSAGES > 0:
+            report["trimmed"] = await trim_sessions(settings.HISTORY_SESSION_MAX_MESSAGES, archive)
+    finally:
+        if archive is not None:
+            archive.close()
+    
+    deleted = report["expired"] + report["trimmed"]
+    if archive is not None and deleted:
+        report["archive"] = archive.path
+    report.update(await run_db(optimize_db, deleted > 0, settings.MAINTENANCE_VACUUM_FREE_RATIO))
+    report["seconds"] = round(time.monotonic() - started, 3)
+    print(f"DB maintenance: {report}")
+    return report
+
+async def _run_maintenance_loop():
+    while True:
+        await asyncio.sleep(settings.MAINTENANCE_INTERVAL)
+        try:
+            await run_maintenance()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Следующая попытка — через интервал; сервис продолжает работу
+            print(f"DB maintenance error: {e}")
+
+def start_maintenance():
+    """Запускает периодическое обслуживание БД (вызывается при старте приложения)"""
+    global _maintenance_task
+    if settings.MAINTENANCE_INTERVAL > 0 and _maintenance_task is None:
+        _maintenance_task = asyncio.create_task(_run_maintenance_loop())
+
+async def stop_maintenance():
+    """Останавливает обслуживание (вызывается при остановке приложения)"""
+    global _maintenance_task
+    if _maintenance_task is not None:
+        _maintenance_task.cancel()
+        try:
+            await _maintenance_task
+        except asyncio.CancelledError:
+            pass
+        _maintenance_task = None
+
+def main():
+    parser = argparse.ArgumentParser(description="Chat database maintenance")
+    parser.add_argument("--compact", action="store_true", help="convert chat history to the compact schema first")
+    args = parser.parse_args()
+    
+    init_db()
+    if args.compact:
+        with get_db_connection() as conn:
+            apply_compact_schema(conn)
+    try:
+        asyncio.run(run_maintenance())
+    finally:
+        close_db()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+# avatar-server/backend/services/response_cache.py
+import re
+import math
+import time
+import hashlib
+import operator
+import httpx
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from core.config import settings
+from core.http_clients import get_ollama_client
+from core.metrics import RESPONSE_CACHE_LOOKUPS, UPSTREAM_ERRORS
+from models.chat import ChatMessage
+from services import llm
+
+# Пунктуация и прочие небуквенные символы при нормализации вопроса отбрасываются
+_NON_WORD = re.compile(r'[^\w\s]+')
+_SPACES = re.compile(r'\s+')
+
+@dataclass
+class CachedResponse:
+    text: str
+    created: float
+    # Нормированный вектор вопроса (только для семантического уровня)
+    embedding: Optional[List[float]] = None
+
+def normalize_message(message: str) -> str:
+    """Приводит вопрос к каноническому виду: регистр, ё, пунктуация, пробелы"""
+    text = message.lower().replace("ё", "е")
+    text = _NON_WORD.sub(" ", text)
+    return _SPACES.sub(" ", text).strip()
+
+def context_digest(context_messages: List[ChatMessage], summary: Optional[str]) -> str:
+    """Отпечаток контекста: ответ на тот же вопрос в другом разговоре другой"""
+    sha = hashlib.sha256((summary or "").encode("utf-8"))
+    for msg in context_messages:
+        sha.update(f"\0{msg.role}\0{msg.content}".encode("utf-8"))
+    return sha.hexdigest()
+
+def _normalize_vector(vector: List[float]) -> Optional[List[float]]:
+    norm = math.sqrt(sum(x * x for x in vector))
+    if not norm:
+        return None
+    return [x / norm for x in vector]
+
+class ResponseCache:
+    """
+    Кэш ответов на повторяющиеся вопросы (типичные для киоска).
+    
+    - точный уровень: ключ из нормализованного вопроса, системного промпта,
+      модели, округлённой температуры и отпечатка контекста (история и резюме)
+    - семантический уровень (RESPONSE_CACHE_SEMANTIC): вектор вопроса из
+      Ollama embeddings, попадание — косинусная близость не ниже порога
+      среди записей с тем же промптом, моделью, температурой и контекстом
+    - записи вытесняются по LRU (RESPONSE_CACHE_MAX_ENTRIES) и по TTL
+    - хранится только текст: аудио к нему запрашивается у TTS-сервера,
+      который отвечает из своего кэша (ссылка на вытесненный файл
+      оказалась бы битой)
+    
+    Работает только из event loop, поэтому блокировки не нужны.
+    """
+    
+    def __init__(self):
+        self._entries: "OrderedDict[str, CachedResponse]" = OrderedDict()
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+    
+    def eligible(self, temperature: float, has_context: bool) -> bool:
+        """Кэшируются только вопросы без истории или с низкой температурой"""
+        if not settings.RESPONSE_CACHE_ENABLED:
+            return False
+        return not has_context or temperature <= settings.RESPONSE_CACHE_MAX_TEMPERATURE
+    
+    def _scope(self, system_prompt: Optional[str], model: str, temperature: float, context: str) -> str:
+        prompt = llm.normalize_system_prompt(system_prompt or settings.SYSTEM_PROMPT)
+        bucket = round(temperature / settings.RESPONSE_CACHE_TEMPERATURE_STEP)
+        return hashlib.sha256(f"{prompt}|{model}|{bucket}|{context}".encode("utf-8")).hexdigest()
+    
+    def _key(self, scope: str, message: str) -> str:
+        return f"{scope}:{normalize_message(message)}"
+    
+    def _get_entry(self, key: str) -> Optional[CachedResponse]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if time.time() - entry.created > settings.RESPONSE_CACHE_TTL:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+    
+    async def lookup(
+        self,
+        message: str,
+        system_prompt: Optional[str],
+        model: str,
+        temperature: float,
+        context_messages: List[ChatMessage],
+        summary: Optional[str]
+    ) -> Tuple[str, Optional[CachedResponse], Optional[List[float]]]:
+        """
+        Ищет ответ. Возвращает (ключ, запись или None, вектор вопроса) —
+        вектор переиспользуется при сохранении, чтобы не считать его дважды.
+        """
+        context = context_digest(context_messages, summary)
+        scope = self._scope(system_prompt, model, temperature, context)
+        key = self._key(scope, message)
+        
+        entry = self._get_entry(key)
+        if entry is not None:
+            self.hits += 1
+            RESPONSE_CACHE_LOOKUPS.labels("hit").inc()
+            return key, entry, entry.embedding
+        
+        embedding = None
+        if settings.RESPONSE_CACHE_SEMANTIC:
+            embedding = await self._embed(message)
+            if embedding is not None:
+                entry = self._nearest(scope, embedding)
+                if entry is not None:
+                    self.semantic_hits += 1
+                    RESPONSE_CACHE_LOOKUPS.labels("semantic_hit").inc()
+                    return key, entry, embedding
+        
+        self.misses += 1
+        RESPONSE_CACHE_LOOKUPS.labels("miss").inc()
+        return key, None, embedding
+    
+    def _nearest(self, scope: str, embedding: List[float]) -> Optional[CachedResponse]:
+        best_key, best_score = None, settings.RESPONSE_CACHE_SIMILARITY
+        now = time.time()
+        for key, entry in self._entries.items():
+            if entry.embedding is None or not key.startswith(scope):
+                continue
+            if now - entry.created > settings.RESPONSE_CACHE_TTL:
+                continue
+            # Векторы нормированы, скалярное произведение — косинус
+            score = sum(map(operator.mul, embedding, entry.embedding))
+            if score >= best_score:
+                best_key, best_score = key, score
+        return self._get_entry(best_key) if best_key else None
+    
+    async def _embed(self, message: str) -> Optional[List[float]]:
+        payload = {
+            "model": settings.RESPONSE_CACHE_EMBED_MODEL,
+            "prompt": normalize_message(message),
+            "keep_alive": llm.keep_alive()
+        }
+        client = get_ollama_client()
+        try:
+            response = await client.post("/api/embeddings", json=payload)
+            response.raise_for_status()
+            return _normalize_vector(response.json()["embedding"])
+        except (httpx.HTTPError, KeyError, ValueError) as e:
+            # Без вектора работает только точный уровень
+            UPSTREAM_ERRORS.labels("ollama", "embeddings").inc()
+            print(f"Response cache embedding error: {e}")
+            return None
+    
+    def store(self, key: str, text: str, embedding: Optional[List[float]] = None):
+        entry = self._entries.get(key)
+        if entry is None or entry.text != text:
+            self._entries[key] = CachedResponse(text=text, created=time.time(), embedding=embedding)
+        self._entries.move_to_end(key)
+        while len(self._entries) > settings.RESPONSE_CACHE_MAX_ENTRIES:
+            self._entries.popitem(last=False)
+    
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses
+        }
+
+response_cache = ResponseCache()
@@ -0,0 +1,198 @@
+# avatar-server/backend/services/scheduler.py
+import math
+import time
+import asyncio
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, Optional
+
+from core.config import settings
+from core.metrics import LLM_ACTIVE, LLM_QUEUED, LLM_QUEUE_WAIT
+
+# Начальная оценка времени генерации одного ответа (уточняется по факту)
+_INITIAL_SERVICE_TIME = 5.0
+# Как часто ожидающий в очереди запрос проверяет, не отключился ли клиент
+_DISCONNECT_POLL_INTERVAL = 0.5
+
+class OverloadedError(Exception):
+    """Очередь к модели переполнена — запрос отклонён сразу (HTTP 429)"""
+    
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class RequestCancelled(Exception):
+    """Клиент отключился, пока запрос ждал в очереди"""
+
+class FairScheduler:
+    """
+    Допуск запросов к одной модели Ollama.
+    
+    - одновременно выполняется не больше max_concurrency запросов
+    - ожидающие сгруппированы по сессиям и получают слот по кругу
+      (round-robin), поэтому одна «болтливая» сессия не вытесняет остальных
+    - при переполнении общей очереди или очереди сессии запрос сразу
+      получает отказ с оценкой Retry-After вместо ожидания до таймаута
+    - ожидание ограничено по времени и прерывается при отключении клиента
+    
+    Работает только из event loop, поэтому блокировки не нужны.
+    """
+    
+    def __init__(self, name: str, max_concurrency: int, max_queue: int, session_queue_max: int):
+        self.name = name
+        self._max_concurrency = max(1, max_concurrency)
+        self._max_queue = max_queue
+        self._session_queue_max = session_queue_max
+        self._active = 0
+        self._depth = 0
+        self._waiters: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict()
+        # Скользящее среднее времени обработки (для Retry-After)
+        self._service_time = _INITIAL_SERVICE_TIME
+        self.rejected = 0
+    
+    def retry_after(self) -> int:
+        """Оценка, через сколько секунд в очереди освободится место"""
+        waves = (self._depth + 1) / self._max_concurrency
+        return max(1, math.ceil(waves * self._service_time))
+    
+    def check(self, session_id: str):
+        """Быстрая проверка допуска без постановки в очередь"""
+        if self._active < self._max_concurrency and not self._depth:
+            return
+        if self._depth >= self._max_queue:
+            self.rejected += 1
+            raise OverloadedError(f"Model {self.name} is overloaded", self.retry_after())
+        if len(self._waiters.get(session_id, ())) >= self._session_queue_max:
+            self.rejected += 1
+            raise OverloadedError("Too many queued requests for this session", self.retry_after())
+    
+    async def acquire(
+        self,
+        session_id: str,
+        timeout: Optional[float] = None,
+        is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None
+    ):
+        """Ждёт свободный слот; при отказе — OverloadedError, при отключении — RequestCancelled"""
+        self.check(session_id)
+        if self._active < self._max_concurrency and not self._depth:
+            self._active += 1
+            self._publish_metrics()
+            LLM_QUEUE_WAIT.labels(self.name).observe(0)
+            return
+        
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(session_id, deque()).append(future)
+        self._depth += 1
+        self._publish_metrics()
+        started = time.monotonic()
+        try:
+            await self._wait(future, timeout, is_disconnected)
+        except BaseException:
+            if future.done() and not future.cancelled():
+                # Слот успели передать — отдаём его следующему
+                self.release()
+            else:
+                self._remove(session_id, future)
+            raise
+        finally:
+            LLM_QUEUE_WAIT.labels(self.name).observe(time.monotonic() - started)
+    
+    async def _wait(
+        self,
+        future: asyncio.Future,
+        timeout: Optional[float],
+        is_disconnected: Optional[Callable[[], Awaitable[bool]]]
+    ):
+        deadline = time.monotonic() + timeout if timeout else None
+        while True:
+            step = _DISCONNECT_POLL_INTERVAL if is_disconnected else None
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.rejected += 1
+                    raise OverloadedError(f"Queue wait for {self.name} timed out", self.retry_after())
+                step = min(step, remaining) if step else remaining
+            try:
+                await asyncio.wait_for(asyncio.shield(future), step)
+                return
+            except asyncio.TimeoutError:
+                if is_disconnected and await is_disconnected():
+                    raise RequestCancelled()
+    
+    def _remove(self, session_id: str, future: asyncio.Future):
+        queue = self._waiters.get(session_id)
+        if queue is not None and future in queue:
+            queue.remove(future)
+            self._depth -= 1
+            if not queue:
+                del self._waiters[session_id]
+        future.cancel()
+        self._publish_metrics()
+    
+    def release(self, duration: Optional[float] = None):
+        """Освобождает слот и передаёт его следующей по кругу сессии"""
+        if duration is not None:
+            self._service_time = 0.8 * self._service_time + 0.2 * duration
+        
+        while self._waiters:
+            session_id, queue = next(iter(self._waiters.items()))
+            future = queue.popleft()
+            self._depth -= 1
+            if queue:
+                self._waiters.move_to_end(session_id)
+            else:
+                del self._waiters[session_id]
+            if not future.done():
+                # Слот переходит ожидающему без уменьшения счётчика активных
+                future.set_result(None)
+                self._publish_metrics()
+                return
+        
+        self._active -= 1
+        self._publish_metrics()
+    
+    def _publish_metrics(self):
+        LLM_ACTIVE.labels(self.name).set(self._active)
+        LLM_QUEUED.labels(self.name).set(self._depth)
+    
+    @asynccontextmanager
+    async def slot(
+        self,
+        session_id: str,
+        timeout: Optional[float] = None,
+        is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None
+    ) -> AsyncIterator[None]:
+        await self.acquire(session_id, timeout, is_disconnected)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - started)
+    
+    def status(self) -> Dict[str, Any]:
+        return {
+            "active": self._active,
+            "queued": self._depth,
+            "sessions_waiting": len(self._waiters),
+            "rejected": self.rejected,
+            "service_time": round(self._service_time, 3)
+        }
+
+_schedulers: Dict[str, FairScheduler] = {}
+
+def get_scheduler(model: str) -> FairScheduler:
+    """Планировщик для модели (создаётся при первом обращении)"""
+    scheduler = _schedulers.get(model)
+    if scheduler is None:
+        scheduler = FairScheduler(
+            model,
+            settings.LLM_MAX_CONCURRENCY,
+            settings.LLM_QUEUE_MAX,
+            settings.LLM_SESSION_QUEUE_MAX
+        )
+        _schedulers[model] = scheduler
+    return scheduler
+
+def get_scheduler_status() -> Dict[str, Any]:
+    """Загрузка очередей по моделям (для /api/health)"""
+    return {model: scheduler.status() for model, scheduler in _schedulers.items()}
@@ -0,0 +1,238 @@
+# avatar-server/backend/services/signaling.py
+import time
+import uuid
+import asyncio
+from typing import Callable, Dict, List, Optional, Tuple
+
+from fastapi import WebSocket
+
+from core.config import settings
+from core.database import get_db_connection, run_db
+
+# Доставка сообщения локальным участникам комнаты: (room_id, text)
+Deliver = Callable[[str, str], None]
+
+class Peer:
+    """
+    Участник комнаты с собственной очередью исходящих сообщений.
+    
+    Отправка идёт в отдельной задаче, поэтому медленный клиент не задерживает
+    остальных. Переполнение очереди или таймаут отправки закрывают соединение.
+    """
+    
+    def __init__(self, websocket: WebSocket):
+        self.id = uuid.uuid4().hex
+        self.websocket = websocket
+        self._queue: "asyncio.Queue[str]" = asyncio.Queue(maxsize=settings.SIGNALING_QUEUE_SIZE)
+        self._writer: Optional[asyncio.Task] = None
+        self._closed = False
+    
+    def start(self):
+        self._writer = asyncio.create_task(self._run_writer())
+    
+    def send(self, text: str):
+        """Ставит сообщение в очередь, не дожидаясь отправки"""
+        if self._closed:
+            return
+        try:
+            self._queue.put_nowait(text)
+        except asyncio.QueueFull:
+            print(f"Signaling peer {self.id} is too slow, closing")
+            self.close(code=1013)
+    
+    async def _run_writer(self):
+        try:
+            while True:
+                text = await self._queue.get()
+                await asyncio.wait_for(self.websocket.send_text(text), settings.SIGNALING_SEND_TIMEOUT)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Signaling send to peer {self.id} failed: {e}")
+            self.close(code=1011)
+    
+    def close(self, code: int = 1000):
+        """Останавливает отправку и закрывает сокет (обработчик получит отключение)"""
+        if self._closed:
+            return
+        self._closed = True
+        if self._writer is not None and self._writer is not asyncio.current_task():
+            self._writer.cancel()
+        asyncio.create_task(self._close_socket(code))
+    
+    async def _close_socket(self, code: int):
+        try:
+            await self.websocket.close(code=code)
+        except Exception:
+            pass
+    
+    async def stop(self):
+        """Закрывает участника при нормальном выходе из комнаты"""
+        self._closed = True
+        if self._writer is not None:
+            self._writer.cancel()
+            try:
+                await self._writer
+            except (asyncio.CancelledError, Exception):
+                pass
+
+class LocalRoomBackend:
+    """Комнаты в пределах одного процесса: публиковать наружу некуда"""
+    
+    async def start(self, deliver: Deliver):
+        pass
+    
+    async def publish(self, room_id: str, text: str):
+        pass
+    
+    async def stop(self):
+        pass
+
+def _publish_row(room_id: str, origin: str, text: str):
+    with get_db_connection() as conn:
+        conn.execute(
+            "INSERT INTO signaling_messages (room_id, origin, payload, ts) VALUES (?,?,?,?)",
+            (room_id, origin, text, time.time())
+        )
+
+def _last_message_id() -> int:
+    with get_db_connection() as conn:
+        row = conn.execute("SELECT MAX(id) AS id FROM signaling_messages").fetchone()
+    return row["id"] or 0
+
+def _fetch_rows(after_id: int, origin: str, limit: int) -> List[Tuple[int, str, str]]:
+    with get_db_connection() as conn:
+        rows = conn.execute(
+            "SELECT id, room_id, payload FROM signaling_messages WHERE id>? AND origin!=? ORDER BY id LIMIT ?",
+            (after_id, origin, limit)
+        ).fetchall()
+    return [(row["id"], row["room_id"], row["payload"]) for row in rows]
+
+def _delete_before(ts: float):
+    with get_db_connection() as conn:
+        conn.execute("DELETE FROM signaling_messages WHERE ts<?", (ts,))
+
+class SQLiteRoomBackend:
+    """
+    Pub/sub через общую SQLite-базу: каждый процесс (воркер uvicorn) пишет
+    сообщения своих участников в таблицу и опрашивает её на чужие.
+    Подходит для нескольких воркеров на одном хосте и для тестов.
+    """
+    
+    _BATCH = 500
+    
+    def __init__(self):
+        # Идентификатор процесса: свои сообщения уже доставлены локально
+        self._origin = uuid.uuid4().hex
+        self._last_id = 0
+        self._deliver: Optional[Deliver] = None
+        self._task: Optional[asyncio.Task] = None
+    
+    async def start(self, deliver: Deliver):
+        self._deliver = deliver
+        self._last_id = await run_db(_last_message_id)
+        self._task = asyncio.create_task(self._run_poller())
+    
+    async def publish(self, room_id: str, text: str):
+        await run_db(_publish_row, room_id, self._origin, text)
+    
+    async def _run_poller(self):
+        last_cleanup = time.monotonic()
+        while True:
+            rows = []
+            try:
+                rows = await run_db(_fetch_rows, self._last_id, self._origin, self._BATCH)
+                for message_id, room_id, text in rows:
+                    self._last_id = message_id
+                    self._deliver(room_id, text)
+                
+                if time.monotonic() - last_cleanup > settings.SIGNALING_RETENTION:
+                    await run_db(_delete_before, time.time() - settings.SIGNALING_RETENTION)
+                    last_cleanup = time.monotonic()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Signaling poll error: {e}")
+            
+            if len(rows) < self._BATCH:
+                await asyncio.sleep(settings.SIGNALING_POLL_INTERVAL)
+    
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+class SignalingHub:
+    """
+    Комнаты WebRTC-сигнализации.
+    
+    Сообщение сериализуется один раз (пересылается исходный текст),
+    раскладывается по очередям локальных участников и публикуется
+    в бэкенд комнат для участников в других процессах.
+    """
+    
+    def __init__(self, backend):
+        self.backend = backend
+        self.rooms: Dict[str, Dict[str, Peer]] = {}
+    
+    async def start(self):
+        await self.backend.start(self.deliver_local)
+    
+    async def stop(self):
+        await self.backend.stop()
+        for room in list(self.rooms.values()):
+            for peer in list(room.values()):
+                await peer.stop()
+        self.rooms.clear()
+    
+    async def join(self, room_id: str, websocket: WebSocket) -> Peer:
+        """Принимает WebSocket и добавляет участника в комнату"""
+        await websocket.accept()
+        peer = Peer(websocket)
+        peer.start()
+        self.rooms.setdefault(room_id, {})[peer.id] = peer
+        return peer
+    
+    async def leave(self, room_id: str, peer: Peer):
+        """Убирает участника из комнаты"""
+        room = self.rooms.get(room_id)
+        if room is not None:
+            room.pop(peer.id, None)
+            if not room:
+                del self.rooms[room_id]
+        await peer.stop()
+    
+    def deliver_local(self, room_id: str, text: str, exclude: Optional[str] = None):
+        """Раскладывает сообщение по очередям участников этого процесса"""
+        room = self.rooms.get(room_id)
+        if not room:
+            return
+        for peer_id, peer in list(room.items()):
+            if peer_id != exclude:
+                peer.send(text)
+    
+    async def broadcast(self, room_id: str, text: str, exclude: Optional[Peer] = None):
+        """Транслирует сообщение всем в комнате, кроме отправителя"""
+        self.deliver_local(room_id, text, exclude.id if exclude else None)
+        await self.backend.publish(room_id, text)
+
+def create_backend(name: str):
+    if name == "local":
+        return LocalRoomBackend()
+    if name == "sqlite":
+        return SQLiteRoomBackend()
+    raise ValueError(f"Unknown signaling backend: {name}")
+
+hub = SignalingHub(create_backend(settings.SIGNALING_BACKEND))
+
+async def start_signaling():
+    """Запускает бэкенд комнат (вызывается при старте приложения)"""
+    await hub.start()
+
+async def stop_signaling():
+    """Закрывает участников и останавливает бэкенд (при остановке приложения)"""
+    await hub.stop()
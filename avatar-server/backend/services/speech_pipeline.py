@@ -0,0 +1,107 @@
+# avatar-server/backend/services/speech_pipeline.py
+import re
+import asyncio
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, AsyncIterator
+
+from core.config import settings
+from services import tts
+
+# Конец предложения: знаки препинания, возможные закрывающие кавычки/скобки и пробел
+_SENTENCE_END = re.compile(r'[.!?…]+[»"\')\]]*\s+')
+
+@dataclass
+class AudioSegment:
+    index: int
+    text: str
+    audio_url: Optional[str]
+    # Временная шкала открытия рта для lip-sync: {"frame_ms": ..., "values": [...]}
+    lipsync: Optional[Dict[str, Any]] = None
+
+class SpeechPipeline:
+    """
+    Конвейер LLM → TTS: режет потоковый ответ на предложения и отправляет
+    каждое на синтез, пока LLM ещё генерирует следующие.
+    
+    Сегменты выдаются строго по порядку, даже если синтез более поздних
+    предложений закончился раньше.
+    """
+    
+    def __init__(
+        self,
+        max_concurrency: Optional[int] = None,
+        min_chars: Optional[int] = None,
+        audio_format: Optional[str] = None,
+        sample_rate: Optional[int] = None
+    ):
+        self._buffer = ""
+        self._pending = ""
+        self._tasks: List[asyncio.Task] = []
+        self._texts: List[str] = []
+        self._next_index = 0
+        self._min_chars = min_chars if min_chars is not None else settings.TTS_SEGMENT_MIN_CHARS
+        self._semaphore = asyncio.Semaphore(max_concurrency or settings.TTS_PIPELINE_CONCURRENCY)
+        self._audio_format = audio_format
+        self._sample_rate = sample_rate
+    
+    def feed(self, text: str):
+        """Добавляет фрагмент ответа и запускает синтез готовых предложений"""
+        self._buffer += text
+        
+        last_end = 0
+        for match in _SENTENCE_END.finditer(self._buffer):
+            self._add_sentence(self._buffer[last_end:match.end()])
+            last_end = match.end()
+        
+        self._buffer = self._buffer[last_end:]
+    
+    def ready(self) -> List[AudioSegment]:
+        """Возвращает уже синтезированные сегменты, не нарушая порядок"""
+        segments = []
+        while self._next_index < len(self._tasks) and self._tasks[self._next_index].done():
+            segments.append(self._result(self._next_index))
+            self._next_index += 1
+        return segments
+    
+    async def finish(self) -> AsyncIterator[AudioSegment]:
+        """Отправляет остаток текста на синтез и выдаёт оставшиеся сегменты по порядку"""
+        self._add_sentence(self._buffer, force=True)
+        self._buffer = ""
+        
+        while self._next_index < len(self._tasks):
+            await asyncio.wait({self._tasks[self._next_index]})
+            yield self._result(self._next_index)
+            self._next_index += 1
+    
+    def cancel(self):
+        """Отменяет незавершённый синтез (например, при замене ответа)"""
+        for task in self._tasks:
+            if not task.done():
+                task.cancel()
+    
+    def _add_sentence(self, sentence: str, force: bool = False):
+        # Очень короткие предложения склеиваем со следующими
+        self._pending += sentence
+        text = self._pending.strip()
+        if not text or (len(text) < self._min_chars and not force):
+            return
+        
+        self._pending = ""
+        self._texts.append(text)
+        self._tasks.append(asyncio.create_task(self._synthesize(text)))
+    
+    async def _synthesize(self, text: str) -> Optional[Dict[str, Any]]:
+        async with self._semaphore:
+            return await tts.generate_speech(text, self._audio_format, self._sample_rate)
+    
+    def _result(self, index: int) -> AudioSegment:
+        task = self._tasks[index]
+        speech = None
+        if not task.cancelled() and task.exception() is None:
+            speech = task.result()
+        return AudioSegment(
+            index=index,
+            text=self._texts[index],
+            audio_url=speech["audio_url"] if speech else None,
+            lipsync=speech["lipsync"] if speech else None
+        )
@@ -1,46 +1,170 @@
 # avatar-server/backend/services/tts.py
+import time
+import asyncio
 import httpx
-from typing import Optional
+from typing import Optional, Dict, Any
 
 from core.config import settings
+from core.circuit_breaker import CircuitBreaker
+from core.http_clients import get_tts_client
+from core.metrics import UPSTREAM_ERRORS, track_stage
 
-async def is_tts_available() -> bool:
-    """Проверяет доступность TTS-сервера"""
+# Состояние TTS-сервера: размыкатель цепи и кэш последней проверки /health
+tts_breaker = CircuitBreaker(
+    "tts",
+    failure_threshold=settings.TTS_BREAKER_FAILURES,
+    reset_timeout=settings.TTS_BREAKER_RESET_TIMEOUT
+)
+_health: Dict[str, Any] = {"available": None, "checked_at": 0.0}
+_monitor_task: Optional[asyncio.Task] = None
+
+async def check_tts_health() -> bool:
+    """Опрашивает /health TTS-сервера и обновляет кэш и размыкатель"""
     try:
-        async with httpx.AsyncClient(timeout=5) as client:
-            response = await client.get(f"{settings.TTS_URL}/health")
-            return response.status_code == 200
+        client = get_tts_client()
+        with track_stage("tts_health"):
+            response = await client.get("/health", timeout=settings.TTS_HEALTH_TIMEOUT)
+        available = response.status_code == 200
+    except asyncio.CancelledError:
+        # Проверка прервана без результата — пробный слот не должен зависнуть
+        tts_breaker.release()
+        raise
     except Exception:
+        available = False
+    if not available:
+        UPSTREAM_ERRORS.labels("tts", "health").inc()
+    
+    _health["available"] = available
+    _health["checked_at"] = time.monotonic()
+    
+    if available:
+        tts_breaker.record_success()
+    else:
+        tts_breaker.record_failure()
+    return available
+
+async def is_tts_available() -> bool:
+    """
+    Проверяет доступность TTS-сервера.
+    
+    Пока кэш свежий (TTS_HEALTH_TTL), сетевой запрос не выполняется;
+    обновление кэша обычно делает фоновый монитор.
+    """
+    # Состояние смотрим без захвата пробного слота: его берёт только тот,
+    # кто действительно обращается к серверу
+    state = tts_breaker.state
+    if state == CircuitBreaker.OPEN:
+        return False
+    
+    fresh = time.monotonic() - _health["checked_at"] < settings.TTS_HEALTH_TTL
+    if state == CircuitBreaker.CLOSED and fresh and _health["available"] is not None:
+        return _health["available"]
+    
+    if not tts_breaker.allow_request():
+        # Пробный запрос уже выполняется кем-то другим
         return False
+    return await check_tts_health()
 
-async def generate_audio(text: str) -> Optional[str]:
+def get_tts_status() -> Dict[str, Any]:
+    """Состояние TTS для остальных частей бэкенда и мониторинга"""
+    checked_at = _health["checked_at"]
+    return {
+        "available": _health["available"],
+        "checked_ago": round(time.monotonic() - checked_at, 1) if checked_at else None,
+        "breaker": tts_breaker.snapshot()
+    }
+
+async def _run_health_monitor():
+    while True:
+        # В разомкнутом состоянии не нагружаем сервер до истечения таймаута
+        if tts_breaker.allow_request():
+            await check_tts_health()
+        await asyncio.sleep(settings.TTS_HEALTH_INTERVAL)
+
+def start_health_monitor():
+    """Запускает фоновый опрос /health (вызывается при старте приложения)"""
+    global _monitor_task
+    if settings.TTS_URL and _monitor_task is None:
+        _monitor_task = asyncio.create_task(_run_health_monitor())
+
+async def stop_health_monitor():
+    """Останавливает фоновый опрос (вызывается при остановке приложения)"""
+    global _monitor_task
+    if _monitor_task is not None:
+        _monitor_task.cancel()
+        try:
+            await _monitor_task
+        except asyncio.CancelledError:
+            pass
+        _monitor_task = None
+
+async def generate_speech(
+    text: str,
+    audio_format: Optional[str] = None,
+    sample_rate: Optional[int] = None
+) -> Optional[Dict[str, Any]]:
     """
-    Генерирует аудио через TTS-сервер и возвращает URL
+    Генерирует аудио через TTS-сервер
     
     Args:
         text: Текст для озвучки
+        audio_format: Формат файла (wav | ogg | mp3), по умолчанию TTS_AUDIO_FORMAT
+        sample_rate: Частота дискретизации, по умолчанию TTS_AUDIO_SAMPLE_RATE
     
     Returns:
-        URL к аудиофайлу или None, если TTS недоступен
+        {"audio_url": ..., "lipsync": {"frame_ms": ..., "values": [...]} | None}
+        или None, если TTS недоступен
     """
-    if not await is_tts_available():
+    # Решение принимается по размыкателю, без лишнего запроса к /health:
+    # если TTS лежит, чат сразу деградирует до текста
+    if not tts_breaker.allow_request():
+        UPSTREAM_ERRORS.labels("tts", "circuit_open").inc()
         return None
     
-    tts_payload = {"text": text}
+    tts_payload = {"text": text, "format": audio_format or settings.TTS_AUDIO_FORMAT}
+    sample_rate = sample_rate or settings.TTS_AUDIO_SAMPLE_RATE
+    if sample_rate:
+        tts_payload["sample_rate"] = sample_rate
     
-    async with httpx.AsyncClient(timeout=30) as client:
-        try:
-            response = await client.post(f"{settings.TTS_URL}/tts", json=tts_payload)
-            response.raise_for_status()
-            audio_url = response.json().get("audio_url")
-            
-            # Используем прокси через наш бэкенд вместо прямого URL TTS-сервера
-            if audio_url:
-                filename = audio_url.split("/")[-1]
-                return f"/tts-audio/{filename}"
-                
-            return None
-            
-        except Exception as e:
-            print(f"TTS service error: {e}")
-            return None
\ No newline at end of file
+    client = get_tts_client()
+    try:
+        with track_stage("tts_synthesis"):
+            response = await client.post("/tts", json=tts_payload)
+        response.raise_for_status()
+        data = response.json()
+        audio_url = data.get("audio_url")
+        tts_breaker.record_success()
+        
+        # Используем прокси через наш бэкенд вместо прямого URL TTS-сервера
+        if audio_url:
+            filename = audio_url.split("/")[-1]
+            return {"audio_url": f"/tts-audio/{filename}", "lipsync": data.get("lipsync")}
+        
+        return None
+    
+    except asyncio.CancelledError:
+        tts_breaker.release()
+        raise
+    except httpx.HTTPStatusError as e:
+        # Ошибки клиента (4xx) не говорят о неисправности сервера
+        if e.response.status_code >= 500:
+            tts_breaker.record_failure()
+        else:
+            tts_breaker.release()
+        UPSTREAM_ERRORS.labels("tts", f"http_{e.response.status_code}").inc()
+        print(f"TTS service error: {e}")
+        return None
+    except Exception as e:
+        tts_breaker.record_failure()
+        UPSTREAM_ERRORS.labels("tts", "error").inc()
+        print(f"TTS service error: {e}")
+        return None
+
+async def generate_audio(
+    text: str,
+    audio_format: Optional[str] = None,
+    sample_rate: Optional[int] = None
+) -> Optional[str]:
+    """Генерирует аудио и возвращает только URL (или None, если TTS недоступен)"""
+    speech = await generate_speech(text, audio_format, sample_rate)
+    return speech["audio_url"] if speech else None
@@ -0,0 +1,25 @@
+# avatar-server/backend/tests/conftest.py
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Пакеты бэкенда импортируются от его корня, как при запуске main.py;
+# база — временная, рабочая chat.db не трогается
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+os.environ["DB_PATH"] = os.path.join(tempfile.mkdtemp(prefix="avatar-tests-"), "chat.db")
+
+@pytest.fixture
+def db():
+    """Пустая база с применёнными миграциями"""
+    from core.config import settings
+    from core.database import close_db, init_db
+    close_db()
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(settings.DB_PATH + suffix):
+            os.remove(settings.DB_PATH + suffix)
+    init_db()
+    yield settings.DB_PATH
+    close_db()
@@ -0,0 +1,46 @@
+# avatar-server/backend/tests/test_context.py
+import asyncio
+
+from core.config import settings
+from models.chat import ChatMessage
+from services import llm
+from services.context import ContextBuilder, estimate_tokens
+
+def _history(count: int):
+    return [
+        ChatMessage(role="user" if i % 2 == 0 else "assistant", content="слово " * 40, ts=float(i + 1))
+        for i in range(count)
+    ]
+
+def test_budget_holds_after_summary_failure(db, monkeypatch):
+    monkeypatch.setattr(settings, "CONTEXT_TOKEN_BUDGET", 600)
+    monkeypatch.setattr(settings, "SUMMARY_ENABLED", True)
+    monkeypatch.setattr(settings, "SUMMARY_MIN_MESSAGES", 2)
+    calls = []
+
+    async def failing_summary(previous, messages):
+        calls.append(len(messages))
+        raise ConnectionError("Ollama is down")
+
+    monkeypatch.setattr(llm, "summarize_messages", failing_summary)
+    history = _history(12)
+
+    async def scenario():
+        builder = ContextBuilder()
+        # Пока суммаризация в работе, вытесненные сообщения остаются в контексте
+        pending, _ = await builder.build("s1", "вопрос", history)
+        await asyncio.gather(*builder._tasks)
+        # После отказа — снова строгий бюджет с тем же началом контекста
+        anchor = builder._anchors["s1"]
+        context, summary = await builder.build("s1", "вопрос", history)
+        await asyncio.gather(*builder._tasks)
+        return pending, context, summary, anchor, builder._anchors["s1"]
+
+    pending, context, summary, anchor, anchor_after = asyncio.run(scenario())
+    assert calls
+    assert len(pending) == len(history)
+    assert summary is None
+    assert anchor_after == anchor == context[0].ts
+    budget = settings.CONTEXT_TOKEN_BUDGET - estimate_tokens(llm.normalize_system_prompt(settings.SYSTEM_PROMPT))
+    assert sum(estimate_tokens(msg.content) for msg in context) <= budget
+    assert len(context) < len(history)
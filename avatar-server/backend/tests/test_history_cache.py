@@ -0,0 +1,47 @@
+# avatar-server/backend/tests/test_history_cache.py
+import time
+import uuid
+import asyncio
+
+from core.config import settings
+from services import chat_history
+from services.chat_history import HistoryCache
+
+def _rows(session_id: str, count: int, start: float, prefix: str = "m"):
+    return [(str(uuid.uuid4()), session_id, "user", f"{prefix}{i}", start + i) for i in range(count)]
+
+def test_history_truncated_by_pending_rows_is_not_complete(db, monkeypatch):
+    monkeypatch.setattr(settings, "HISTORY_CACHE_MESSAGES", 3)
+    monkeypatch.setattr(settings, "HISTORY_WRITE_MODE", "write_behind")
+    started = time.time()
+    chat_history.save_messages(_rows("s1", 2, started))
+
+    async def scenario():
+        cache = HistoryCache()
+        # Две строки ещё в очереди отложенной записи: вместе с БД их 4 > 3
+        cache._pending.extend(_rows("s1", 2, started + 10, "p"))
+        first = await cache.get("s1", 3)
+        entry = cache._sessions["s1"]
+        assert len(entry.messages) == 3
+        assert not entry.complete
+        # Запрос глубже хвоста идёт в БД и получает всю историю
+        await cache.flush()
+        return first, await cache.get("s1", 4)
+
+    first, full = asyncio.run(scenario())
+    assert [m.content for m in first] == ["m1", "p0", "p1"]
+    assert len(full) == 4
+
+def test_cache_sees_messages_written_by_another_worker(db, monkeypatch):
+    monkeypatch.setattr(settings, "HISTORY_CACHE_VALIDATE", True)
+    started = time.time()
+    chat_history.save_messages(_rows("s1", 2, started))
+
+    async def scenario():
+        cache = HistoryCache()
+        assert len(await cache.get("s1", 10)) == 2
+        # Другой процесс дописал сессию в общую БД в обход этого кэша
+        chat_history.save_messages(_rows("s1", 1, started + 5))
+        return await cache.get("s1", 10)
+
+    assert len(asyncio.run(scenario())) == 3
@@ -1,7 +1,7 @@
 // digital_avatar/avatar-server/frontend/main.js
 import { initScene } from './modules/scene.js';
 import { setupUI } from './modules/ui.js';
-import { playAudio, safePlay, setupAudioEndHandler } from './modules/audio.js';
+import { playAudio, safePlay, setupAudioEndHandler, getPreferredAudioFormat } from './modules/audio.js';
 import { AvatarController } from './modules/avatar.js';
 import { isMobile } from './modules/utils.js';
 
@@ -45,11 +45,13 @@ import { isMobile } from './modules/utils.js';
   }
 })();
 
-// Отправка сообщения на сервер
+// Отправка сообщения на сервер (потоковый ответ через SSE)
 async function sendMessage(text, sessionId, avatarCtrl) {
   try {
     addMsg('user', text);
-    const res = await fetch('/api/chat', {
+    // Компактный формат озвучки (Opus/MP3) вместо несжатого WAV
+    const { format: audioFormat, sampleRate: audioSampleRate } = getPreferredAudioFormat();
+    const res = await fetch('/api/chat/stream', {
       method: 'POST',
       headers: { 'Content-Type': 'application/json' },
       body: JSON.stringify({
@@ -57,7 +59,9 @@ async function sendMessage(text, sessionId, avatarCtrl) {
         message: text,
         system_prompt: 'ТЫ ДОЛЖЕН ОТВЕЧАТЬ ТОЛЬКО НА РУССКОМ ЯЗЫКЕ! НИКОГДА не используй английские слова или фразы в ответах. Если тебя спрашивают на английском, ответь: "Извините, я могу отвечать только на русском языке". Твои ответы должны быть краткими и понятными. Отвечай только на русском языке, без исключений.',
         temperature: 0.6,
-        model: 'llama3'
+        model: 'llama3',
+        audio_format: audioFormat,
+        audio_sample_rate: audioSampleRate
       })
     });
 
@@ -67,47 +71,128 @@ async function sendMessage(text, sessionId, avatarCtrl) {
       throw new Error(`HTTP ${res.status}: ${errorText}`);
     }
 
-    const data = await res.json();
-    
+    // Узел ответа создаётся сразу и дополняется по мере прихода токенов
+    const node = addMsg('assistant', '');
+    // Аудиосегменты воспроизводятся по очереди, пока приходят следующие
+    const playlist = createPlaylist(avatarCtrl);
+    let data = null;
+
+    await readEventStream(res, (event, payload) => {
+      if (event === 'token') {
+        if (node) node.textContent += payload.text;
+      } else if (event === 'audio') {
+        if (payload.audio_url) playlist.enqueue(payload.audio_url, payload.lipsync);
+      } else if (event === 'replace') {
+        if (node) node.textContent = payload.text;
+        playlist.clear();
+      } else if (event === 'done') {
+        data = payload;
+      } else if (event === 'error') {
+        throw new Error(`HTTP ${payload.status}: ${payload.detail}`);
+      }
+    });
+
     // Проверяем, что ответ содержит текст
-    if (!data.text) {
+    if (!data || !data.text) {
       throw new Error('Пустой ответ от сервера');
     }
-    
-    addMsg('assistant', data.text);
-
-    if (data.audio_url) {
-      try {
-        // Добавляем базовый URL для аудио, если нужно
-        const audioUrl = data.audio_url.startsWith('http') ? data.audio_url : `${window.location.origin}${data.audio_url}`;
-        
-        // Используем улучшенный playAudio
-        const { audio, analyser, cleanup } = await playAudio(audioUrl);
-        
-        // Настройка lip-sync
-        avatarCtrl.lipSyncWithAnalyser(analyser);
-        
-        // Обработка завершения воспроизведения
-        setupAudioEndHandler(audio, (success) => {
-          // Останавливаем lip-sync анимацию
-          avatarCtrl.stopLipSync();
-          // Освобождаем ресурсы
-          cleanup();
-        });
-        
-        // Безопасное воспроизведение
-        await safePlay(audio);
-      } catch (audioError) {
-        console.error('Ошибка воспроизведения аудио:', audioError);
-        showChatMessage('❌ Ошибка воспроизведения аудио', true);
-      }
-    }
+
+    if (node) node.textContent = data.text;
   } catch (err) {
     console.error('Ошибка при отправке сообщения:', err);
     showChatMessage(`❌ Ошибка отправки: ${err.message}`, true);
   }
 }
 
+// Очередь воспроизведения аудиосегментов ответа
+function createPlaylist(avatarCtrl) {
+  const queue = [];
+  let playing = false;
+  let current = null;
+
+  const playNext = async () => {
+    if (playing || queue.length === 0) return;
+    playing = true;
+
+    const { url, lipsync } = queue.shift();
+    try {
+      // Добавляем базовый URL для аудио, если нужно
+      const audioUrl = url.startsWith('http') ? url : `${window.location.origin}${url}`;
+      
+      // Используем улучшенный playAudio
+      const { audio, analyser, cleanup } = await playAudio(audioUrl);
+      current = cleanup;
+      
+      // Настройка lip-sync: готовая шкала с сервера дешевле анализа аудио
+      if (lipsync && lipsync.values && lipsync.values.length) {
+        avatarCtrl.lipSyncWithTimeline(audio, lipsync);
+      } else {
+        avatarCtrl.lipSyncWithAnalyser(analyser);
+      }
+      
+      // По завершении сегмента переходим к следующему
+      setupAudioEndHandler(audio, () => {
+        avatarCtrl.stopLipSync();
+        cleanup();
+        current = null;
+        playing = false;
+        playNext();
+      });
+      
+      // Безопасное воспроизведение
+      await safePlay(audio);
+    } catch (audioError) {
+      console.error('Ошибка воспроизведения аудио:', audioError);
+      showChatMessage('❌ Ошибка воспроизведения аудио', true);
+      playing = false;
+      playNext();
+    }
+  };
+
+  return {
+    enqueue(url, lipsync = null) {
+      queue.push({ url, lipsync });
+      playNext();
+    },
+    clear() {
+      queue.length = 0;
+      if (current) {
+        avatarCtrl.stopLipSync();
+        current();
+        current = null;
+      }
+      playing = false;
+    }
+  };
+}
+
+// Разбор потока Server-Sent Events из fetch-ответа
+async function readEventStream(res, onEvent) {
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    let sep;
+    while ((sep = buffer.indexOf('\n\n')) !== -1) {
+      const block = buffer.slice(0, sep);
+      buffer = buffer.slice(sep + 2);
+
+      let event = 'message';
+      let dataLine = '';
+      for (const line of block.split('\n')) {
+        if (line.startsWith('event: ')) event = line.slice(7);
+        else if (line.startsWith('data: ')) dataLine += line.slice(6);
+      }
+      if (dataLine) onEvent(event, JSON.parse(dataLine));
+    }
+  }
+}
+
 // Вывод сообщений в чат
 function addMsg(role, text) {
   const history = document.getElementById('history');
@@ -117,6 +202,7 @@ function addMsg(role, text) {
   node.textContent = text;
   history.appendChild(node);
   node.scrollIntoView({ behavior: 'smooth', block: 'end' });
+  return node;
 }
 
 function showChatMessage(message, isError = false) {
@@ -124,6 +124,22 @@ function cleanupAudio(audio, source, analyser) {
   }
 }
 
+/**
+* Picks the most compact audio format the browser can play
+* (Opus/OGG at 24 kHz, otherwise MP3, otherwise WAV)
+* @returns {{format: string, sampleRate: number|null}}
+*/
+export function getPreferredAudioFormat() {
+  const probe = new Audio();
+  if (probe.canPlayType('audio/ogg; codecs=opus')) {
+    return { format: 'ogg', sampleRate: 24000 };
+  }
+  if (probe.canPlayType('audio/mpeg')) {
+    return { format: 'mp3', sampleRate: 24000 };
+  }
+  return { format: 'wav', sampleRate: null };
+}
+
 /**
 * Checks if the device is mobile
 * @returns {boolean}
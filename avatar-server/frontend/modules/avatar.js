@@ -228,6 +228,49 @@ export class AvatarController {
     update();
   }
 
+  /**
+   * Запускает lip-sync по готовой временной шкале с TTS-сервера:
+   * в браузере остаётся только интерполяция, без анализа аудио
+   * @param {HTMLAudioElement} audio - Воспроизводимый аудиоэлемент
+   * @param {{frame_ms: number, values: number[]}} timeline - Открытие рта по кадрам
+   */
+  lipSyncWithTimeline(audio, timeline) {
+    this.stopLipSync(); // Сначала останавливаем текущую анимацию
+    
+    this._lipSync.isActive = true;
+    
+    const { frame_ms: frameMs, values } = timeline;
+    let lastTime = performance.now();
+    
+    const update = () => {
+      if (!this._lipSync.isActive) return;
+      
+      const now = performance.now();
+      const deltaTime = now - lastTime;
+      lastTime = now;
+      
+      // Линейная интерполяция между соседними кадрами шкалы
+      const pos = audio.currentTime * 1000 / frameMs;
+      const i = Math.floor(pos);
+      let targetValue = 0;
+      if (i + 1 < values.length) {
+        targetValue = values[i] + (values[i + 1] - values[i]) * (pos - i);
+      } else if (i < values.length) {
+        targetValue = values[i];
+      }
+      
+      // Плавное изменение значения (фильтр низких частот)
+      this._lipSync.lastMouthValue += (targetValue - this._lipSync.lastMouthValue) * 
+                                     Math.min(1, deltaTime * this._lipSync.smoothing / 16);
+      
+      this.setMorph(this.morphs.mouthOpen, this._lipSync.lastMouthValue);
+      
+      this._lipSync.rafId = requestAnimationFrame(update);
+    };
+    
+    update();
+  }
+
   /**
    * Запускает анимацию губ для Web Speech API fallback
    * @param {number} intensity - Интенсивность анимации (0-1)
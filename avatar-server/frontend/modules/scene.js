@@ -9,6 +9,9 @@ import {
 import {
    OrbitControls
 } from 'three/examples/jsm/controls/OrbitControls.js';
+import {
+   MeshoptDecoder
+} from 'three/examples/jsm/libs/meshopt_decoder.module.js';
 
 export async function initScene(canvas, glbPath) {
    console.log('🎯 initScene вызван с путём:', glbPath);
@@ -70,6 +73,8 @@ export async function initScene(canvas, glbPath) {
 
          const loader = new GLTFLoader();
          loader.setDRACOLoader(dracoLoader);
+         // Модель может быть сжата сборкой (build_static.py --glb-compress meshopt)
+         loader.setMeshoptDecoder(MeshoptDecoder);
 
          console.log('📦 Загружаем GLB...');
          const gltf = await loader.loadAsync(glbPath);
@@ -15,6 +15,18 @@ export class AudioManager {
     return this.audioContext;
   }
 
+  // Самый компактный формат, который браузер умеет воспроизводить
+  getPreferredAudioFormat() {
+    const probe = new Audio();
+    if (probe.canPlayType('audio/ogg; codecs=opus')) {
+      return { format: 'ogg', sampleRate: 24000 };
+    }
+    if (probe.canPlayType('audio/mpeg')) {
+      return { format: 'mp3', sampleRate: 24000 };
+    }
+    return { format: 'wav', sampleRate: null };
+  }
+
   async playAudio(url) {
     try {
       const audio = new Audio();
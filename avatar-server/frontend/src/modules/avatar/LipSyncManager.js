@@ -3,18 +3,31 @@ export class LipSyncManager {
     this.controller = avatarController;
     this.isActive = false;
     this.analyser = null;
+    this.analyserData = null;
+    this.timeline = null;
+    this.audio = null;
     this.lastMouthValue = 0;
     this.smoothing = 0.3;
   }
 
-  start(analyser = null) {
+  // timeline — готовая шкала с TTS-сервера ({frame_ms, values}),
+  // audio — элемент, по currentTime которого она читается
+  start(analyser = null, timeline = null, audio = null) {
     this.isActive = true;
     this.analyser = analyser;
+    this.timeline = timeline && timeline.values && timeline.values.length ? timeline : null;
+    this.audio = audio;
+    // Буфер анализатора выделяется один раз, а не на каждый кадр
+    if (analyser && (!this.analyserData || this.analyserData.length !== analyser.frequencyBinCount)) {
+      this.analyserData = new Uint8Array(analyser.frequencyBinCount);
+    }
   }
 
   stop() {
     this.isActive = false;
     this.analyser = null;
+    this.timeline = null;
+    this.audio = null;
     
     // Плавное закрытие рта
     this.animateMouthClose();
@@ -23,7 +36,10 @@ export class LipSyncManager {
   update() {
     if (!this.isActive) return;
 
-    if (this.analyser) {
+    if (this.timeline && this.audio) {
+      // Режим с готовой шкалой: только интерполяция, без анализа аудио
+      this.updateWithTimeline();
+    } else if (this.analyser) {
       // Режим с анализатором аудио
       this.updateWithAnalyser();
     } else {
@@ -32,8 +48,25 @@ export class LipSyncManager {
     }
   }
 
+  updateWithTimeline() {
+    const { frame_ms: frameMs, values } = this.timeline;
+    const pos = this.audio.currentTime * 1000 / frameMs;
+    const i = Math.floor(pos);
+    
+    // Линейная интерполяция между соседними кадрами шкалы
+    let targetValue = 0;
+    if (i + 1 < values.length) {
+      targetValue = values[i] + (values[i + 1] - values[i]) * (pos - i);
+    } else if (i < values.length) {
+      targetValue = values[i];
+    }
+    
+    this.lastMouthValue += (targetValue - this.lastMouthValue) * this.smoothing;
+    this.controller.setMorph('mouthOpen', this.lastMouthValue);
+  }
+
   updateWithAnalyser() {
-    const data = new Uint8Array(this.analyser.frequencyBinCount);
+    const data = this.analyserData;
     this.analyser.getByteFrequencyData(data);
     
     let sum = 0;
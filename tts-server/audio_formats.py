@@ -0,0 +1,51 @@
+# digital_avatar/tts-server/audio_formats.py
+import re
+from typing import Optional, Tuple
+
+import librosa
+import soundfile as sf
+
+# Поддерживаемые форматы: расширение → (формат libsndfile, подтип, MIME-тип)
+FORMATS = {
+    "wav": ("WAV", "PCM_16", "audio/wav"),
+    "ogg": ("OGG", "OPUS", "audio/ogg"),
+    "mp3": ("MP3", "MPEG_LAYER_III", "audio/mpeg"),
+}
+
+# Opus кодирует только эти частоты дискретизации
+OPUS_SAMPLE_RATES = (8000, 12000, 16000, 24000, 48000)
+
+# Имя варианта: <ключ>.<частота>.<расширение>, исходник — <ключ>.wav
+_VARIANT_RE = re.compile(r'^([0-9a-f]{64})\.(\d+)\.(wav|ogg|mp3)$')
+
+def validate(fmt: str, sample_rate: int) -> Optional[str]:
+    """Возвращает текст ошибки, если формат или частота не поддерживаются"""
+    if fmt not in FORMATS:
+        return f"unsupported format '{fmt}', expected one of: {', '.join(FORMATS)}"
+    if fmt == "ogg" and sample_rate not in OPUS_SAMPLE_RATES:
+        return f"opus supports sample rates: {', '.join(map(str, OPUS_SAMPLE_RATES))}"
+    if not 8000 <= sample_rate <= 48000:
+        return "sample_rate must be between 8000 and 48000"
+    return None
+
+def variant_name(key: str, fmt: str, sample_rate: int, source_rate: int) -> str:
+    """Имя файла для варианта; исходный WAV сохраняет прежнее имя <ключ>.wav"""
+    if fmt == "wav" and sample_rate == source_rate:
+        return f"{key}.wav"
+    return f"{key}.{sample_rate}.{fmt}"
+
+def parse_variant_name(name: str) -> Optional[Tuple[str, int, str]]:
+    """Разбирает имя варианта на (ключ, частота, формат) или возвращает None"""
+    match = _VARIANT_RE.match(name)
+    if match is None:
+        return None
+    return match.group(1), int(match.group(2)), match.group(3)
+
+def encode(source_path: str, dest_path: str, fmt: str, sample_rate: int):
+    """Перекодирует исходный WAV в нужный формат и частоту"""
+    data, source_rate = sf.read(source_path, dtype="float32")
+    if sample_rate != source_rate:
+        data = librosa.resample(data, orig_sr=source_rate, target_sr=sample_rate)
+
+    sf_format, subtype, _ = FORMATS[fmt]
+    sf.write(dest_path, data, sample_rate, format=sf_format, subtype=subtype)
@@ -0,0 +1,171 @@
+# digital_avatar/tts-server/cache.py
+import os
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, Optional, Tuple
+
+TMP_PREFIX = ".tmp-"
+
+class AudioCache:
+    """
+    Файловый кэш аудио с ограничением по размеру.
+
+    - индекс (имя → размер, время создания) держится в памяти и строится
+      одним проходом os.scandir при старте
+    - вытеснение LRU при превышении max_bytes и, опционально, по TTL
+    - запись идёт во временный файл и переименовывается атомарно,
+      поэтому читатели никогда не видят недописанный файл
+    - закреплённые файлы (pinned) не вытесняются, пока их читают
+    """
+
+    def __init__(self, directory: str, max_bytes: int, ttl: float = 0):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._index: "OrderedDict[str, Tuple[int, float]]" = OrderedDict()
+        self._bytes = 0
+        self._last_sweep = 0.0
+        # Имя → число держателей закрепления
+        self._pins: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def load_index(self):
+        """Строит индекс по содержимому каталога (старые файлы — в начало LRU)"""
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if not entry.is_file():
+                    continue
+                if entry.name.startswith(TMP_PREFIX):
+                    # Остатки прерванной записи
+                    self._unlink(entry.path)
+                    continue
+                stat = entry.stat()
+                entries.append((stat.st_mtime, entry.name, stat.st_size))
+
+        entries.sort()
+        with self._lock:
+            self._index.clear()
+            self._bytes = 0
+            for mtime, name, size in entries:
+                self._index[name] = (size, mtime)
+                self._bytes += size
+            self._evict_locked()
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def get(self, name: str) -> Optional[str]:
+        """Путь к файлу из кэша или None; учитывается в счётчиках попаданий"""
+        with self._lock:
+            if self._lookup_locked(name):
+                self.hits += 1
+                return self.path(name)
+            self.misses += 1
+            return None
+
+    def touch(self, name: str) -> bool:
+        """Отмечает использование файла без учёта в счётчиках"""
+        with self._lock:
+            return self._lookup_locked(name)
+
+    @contextmanager
+    def pinned(self, names: Iterable[str]) -> Iterator[None]:
+        """
+        Не даёт вытеснить файлы, пока блок выполняется. Имя можно
+        закрепить до того, как файл записан.
+        """
+        names = list(names)
+        with self._lock:
+            for name in names:
+                self._pins[name] = self._pins.get(name, 0) + 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                for name in names:
+                    count = self._pins.pop(name) - 1
+                    if count:
+                        self._pins[name] = count
+
+    def write(self, name: str, writer: Callable[[str], None]) -> str:
+        """
+        Записывает файл через writer(tmp_path) и атомарно публикует его.
+        Временное имя сохраняет расширение, чтобы writer мог определить формат.
+        """
+        tmp_path = self.path(f"{TMP_PREFIX}{uuid.uuid4().hex}-{name}")
+        final_path = self.path(name)
+        try:
+            writer(tmp_path)
+            os.replace(tmp_path, final_path)
+        except Exception:
+            self._unlink(tmp_path)
+            raise
+
+        size = os.path.getsize(final_path)
+        with self._lock:
+            previous = self._index.pop(name, None)
+            if previous is not None:
+                self._bytes -= previous[0]
+            self._index[name] = (size, time.time())
+            self._bytes += size
+            self._evict_locked()
+        return final_path
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "files": len(self._index),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }
+
+    def _lookup_locked(self, name: str) -> bool:
+        entry = self._index.get(name)
+        if entry is None:
+            return False
+        if self._expired(entry) and name not in self._pins:
+            self._remove_locked(name)
+            return False
+        self._index.move_to_end(name)
+        return True
+
+    def _expired(self, entry: Tuple[int, float]) -> bool:
+        return self.ttl > 0 and time.time() - entry[1] > self.ttl
+
+    def _evict_locked(self):
+        # Сначала просроченные (полный проход не чаще раза в минуту),
+        # затем самые давно использованные
+        now = time.time()
+        if self.ttl > 0 and now - self._last_sweep > min(60.0, self.ttl):
+            self._last_sweep = now
+            for name in [n for n, e in self._index.items() if self._expired(e) and n not in self._pins]:
+                self._remove_locked(name)
+        while self._bytes > self.max_bytes:
+            name = next((n for n in self._index if n not in self._pins), None)
+            if name is None:
+                break
+            self._remove_locked(name)
+
+    def _remove_locked(self, name: str):
+        size, _ = self._index.pop(name)
+        self._bytes -= size
+        self.evictions += 1
+        self._unlink(self.path(name))
+
+    @staticmethod
+    def _unlink(path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,54 @@
+# digital_avatar/tts-server/lipsync.py
+import json
+from typing import Any, Dict
+
+import numpy as np
+import soundfile as sf
+
+# Шаг временной шкалы: 20 мс — 50 значений в секунду, плавнее частоты кадров не нужно
+DEFAULT_FRAME_MS = 20
+# Громкость нормируется по этому перцентилю, чтобы редкие пики не «съедали» шкалу
+_NORM_PERCENTILE = 95
+# Кадры тише этой доли от нормы считаются паузой (рот закрыт)
+_SILENCE_LEVEL = 0.08
+
+def lipsync_name(key: str) -> str:
+    """Имя файла временной шкалы рядом с исходным <ключ>.wav"""
+    return f"{key}.lipsync.json"
+
+def compute_timeline(audio: np.ndarray, sample_rate: int, frame_ms: int = DEFAULT_FRAME_MS) -> Dict[str, Any]:
+    """
+    Считает открытие рта по кадрам: RMS в окне frame_ms, нормированный
+    к 0..1. Весь расчёт векторный — один проход по сигналу.
+    """
+    audio = np.asarray(audio, dtype=np.float32).reshape(-1)
+    frame = max(1, int(sample_rate * frame_ms / 1000))
+    frames = -(-len(audio) // frame)
+    if frames == 0:
+        return {"frame_ms": frame_ms, "values": []}
+
+    padded = np.zeros(frames * frame, dtype=np.float32)
+    padded[:len(audio)] = audio
+    rms = np.sqrt(np.mean(padded.reshape(frames, frame) ** 2, axis=1))
+
+    norm = np.percentile(rms, _NORM_PERCENTILE)
+    if norm <= 0:
+        return {"frame_ms": frame_ms, "values": [0.0] * frames}
+    values = np.clip(rms / norm, 0.0, 1.0)
+    values[values < _SILENCE_LEVEL] = 0.0
+    return {"frame_ms": frame_ms, "values": np.round(values.astype(np.float64), 2).tolist()}
+
+def timeline_from_file(path: str, frame_ms: int = DEFAULT_FRAME_MS) -> Dict[str, Any]:
+    """Временная шкала для уже сохранённого WAV (записи кэша без шкалы)"""
+    audio, sample_rate = sf.read(path, dtype="float32")
+    if audio.ndim > 1:
+        audio = audio.mean(axis=1)
+    return compute_timeline(audio, sample_rate, frame_ms)
+
+def write_timeline(path: str, timeline: Dict[str, Any]):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(timeline, f, separators=(",", ":"))
+
+def read_timeline(path: str) -> Dict[str, Any]:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
@@ -0,0 +1,86 @@
+# digital_avatar/tts-server/metrics.py
+import time
+
+from fastapi import FastAPI, Response
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+REQUESTS = Counter(
+    "tts_http_requests_total",
+    "HTTP requests by endpoint and status",
+    ["endpoint", "status"]
+)
+LATENCY = Histogram(
+    "tts_http_request_duration_seconds",
+    "HTTP request latency",
+    ["endpoint"],
+    buckets=_BUCKETS
+)
+IN_FLIGHT = Gauge("tts_http_requests_in_flight", "HTTP requests currently being processed")
+
+QUEUE_DEPTH = Gauge("tts_queue_depth", "Synthesis jobs waiting for a worker")
+QUEUE_WAIT = Histogram(
+    "tts_queue_wait_seconds",
+    "Time a synthesis job spent in the queue",
+    buckets=_BUCKETS
+)
+SYNTHESIS = Histogram(
+    "tts_synthesis_duration_seconds",
+    "Model inference time per batch",
+    buckets=_BUCKETS
+)
+BATCH_SIZE = Histogram(
+    "tts_batch_size",
+    "Texts per synthesis batch",
+    buckets=(1, 2, 3, 4, 6, 8, 12, 16)
+)
+ENCODE = Histogram(
+    "tts_encode_duration_seconds",
+    "Transcoding of a cached WAV into the requested format",
+    buckets=_BUCKETS
+)
+CACHE_LOOKUPS = Counter(
+    "tts_cache_lookups_total",
+    "Audio cache lookups in /tts",
+    ["result"]
+)
+
+class MetricsMiddleware:
+    """ASGI-middleware: счётчик запросов, задержки и число запросов в работе"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            IN_FLIGHT.dec()
+            # Шаблон маршрута (/audio/{filename:path}), а не путь — ограниченная кардинальность
+            endpoint = getattr(scope.get("route"), "path", None) or "unknown"
+            REQUESTS.labels(endpoint, str(status)).inc()
+            LATENCY.labels(endpoint).observe(time.perf_counter() - started)
+
+def init_app(app: FastAPI, queue_depth):
+    """Подключает учёт запросов и маршрут /metrics; queue_depth — функция глубины очереди"""
+    QUEUE_DEPTH.set_function(queue_depth)
+    app.add_middleware(MetricsMiddleware)
+
+    @app.get("/metrics", include_in_schema=False)
+    async def metrics():
+        return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
\ No newline at end of file
@@ -0,0 +1,291 @@
+# digital_avatar/tts-server/normalizer.py
+import re
+import unicodedata
+from typing import List, Optional, Tuple
+
+# Нормализация текста перед синтезом. Silero не читает цифры и сокращения,
+# а ключ кэша считается по тексту, поэтому ответы, отличающиеся только
+# пробелами, кавычками или записью чисел, должны давать одинаковые предложения.
+
+_ONES = ("ноль", "один", "два", "три", "четыре", "пять", "шесть", "семь", "восемь", "девять")
+_ONES_FEMININE = ("ноль", "одна", "две")
+_TEENS = (
+    "десять", "одиннадцать", "двенадцать", "тринадцать", "четырнадцать",
+    "пятнадцать", "шестнадцать", "семнадцать", "восемнадцать", "девятнадцать"
+)
+_TENS = ("", "", "двадцать", "тридцать", "сорок", "пятьдесят", "шестьдесят", "семьдесят", "восемьдесят", "девяносто")
+_HUNDREDS = ("", "сто", "двести", "триста", "четыреста", "пятьсот", "шестьсот", "семьсот", "восемьсот", "девятьсот")
+
+# Разряды: (множитель, формы для 1 / 2-4 / 5+, женский род)
+_SCALES = (
+    (10 ** 9, ("миллиард", "миллиарда", "миллиардов"), False),
+    (10 ** 6, ("миллион", "миллиона", "миллионов"), False),
+    (10 ** 3, ("тысяча", "тысячи", "тысяч"), True),
+)
+_FRACTIONS = (
+    ("десятая", "десятых"),
+    ("сотая", "сотых"),
+    ("тысячная", "тысячных"),
+)
+
+# Единицы после числа: формы для 1 / 2-4 / 5+ и женский род
+_UNITS = {
+    "%": (("процент", "процента", "процентов"), False),
+    "км": (("километр", "километра", "километров"), False),
+    "м": (("метр", "метра", "метров"), False),
+    "см": (("сантиметр", "сантиметра", "сантиметров"), False),
+    "мм": (("миллиметр", "миллиметра", "миллиметров"), False),
+    "кг": (("килограмм", "килограмма", "килограммов"), False),
+    "ч": (("час", "часа", "часов"), False),
+    "мин": (("минута", "минуты", "минут"), True),
+    "сек": (("секунда", "секунды", "секунд"), True),
+    "шт": (("штука", "штуки", "штук"), True),
+    "руб": (("рубль", "рубля", "рублей"), False),
+    "₽": (("рубль", "рубля", "рублей"), False),
+    "коп": (("копейка", "копейки", "копеек"), True),
+    "$": (("доллар", "доллара", "долларов"), False),
+    "€": (("евро", "евро", "евро"), False),
+    "°": (("градус", "градуса", "градусов"), False),
+    "тыс": (("тысяча", "тысячи", "тысяч"), True),
+    "млн": (("миллион", "миллиона", "миллионов"), False),
+    "млрд": (("миллиард", "миллиарда", "миллиардов"), False),
+}
+
+# Сокращения без числа (точки внутри допускают пробелы: «т. е.» и «т.е.»)
+_ABBREVIATIONS = (
+    (r"т\.\s?е\.", "то есть"),
+    (r"т\.\s?к\.", "так как"),
+    (r"т\.\s?д\.", "так далее"),
+    (r"т\.\s?п\.", "тому подобное"),
+    (r"т\.\s?н\.", "так называемый"),
+    (r"гг\.", "годы"),
+    (r"и\s+др\.", "и другие"),
+    (r"и\s+пр\.", "и прочее"),
+    (r"напр\.", "например"),
+    (r"см\.", "смотрите"),
+)
+
+_NUMBER = r"\d+(?:[.,]\d+)?"
+_LETTER = "а-яА-ЯёЁa-zA-Z"
+
+_MARKDOWN_LINK_RE = re.compile(r"\[([^\]]*)\]\([^)]*\)")
+_URL_RE = re.compile(r"https?://\S+")
+_LIST_MARKER_RE = re.compile(r"^\s*(?:[-*•]|\d+[.)])\s+", re.MULTILINE)
+_MARKUP_RE = re.compile(r"[*_#`~|<>\"«»“”„]")
+_DASH_RE = re.compile(r"\s+(?:-|–|—|−|--)\s+")
+_ELLIPSIS_RE = re.compile(r"\.{2,}|…+")
+_REPEATED_RE = re.compile(r"([!?])[!?]+|([,;:])[,;:]+")
+_SPACE_BEFORE_RE = re.compile(r"\s+([,.!?…:;])")
+_SPACE_AFTER_RE = re.compile(rf"([,!?…:;])(?=[{_LETTER}])|(\.)(?=[А-ЯЁA-Z])")
+_BRACKETS_RE = re.compile(r"\s*[(\[]\s*([^()\[\]]*?)\s*[)\]]")
+_GROUPED_NUMBER_RE = re.compile(r"(?<![\d.,])\d{1,3}(?:[ \u00a0\u2009\u202f]\d{3})+(?!\d)")
+_CURRENCY_PREFIX_RE = re.compile(rf"([$€₽])\s?({_NUMBER})")
+_NUMBER_UNIT_RE = re.compile(
+    rf"(?<![\d{_LETTER}])(?<!\d:)([-−]?)({_NUMBER})\s?(%|°[CС]?|(?:км|мм|см|кг|мин|сек|шт|руб|коп|тыс|млн|млрд|ч|м)\.?|₽|\$|€)(?![{_LETTER}])"
+)
+# Год с сокращением: «2024 г.», «2020–2022 гг.» (без точки «г» — граммы)
+_YEAR_RE = re.compile(r"(?<![\d.,])(\d{1,4})\s?(гг?)\.")
+# Версии и даты через точку (3.11.2, 01.02.2024) читаются по частям, а не как дроби
+_DOTTED_RE = re.compile(r"\d+(?:\.\d+){2,}")
+_TIME_RE = re.compile(r"(?<![\d.,:])([01]?\d|2[0-3]):([0-5]\d)(?::([0-5]\d))?(?![\d:])")
+# Счёт и соотношения (2:1, 1:100) — то, что не подошло под время
+_RATIO_RE = re.compile(r"(?<![\d.,:])(\d+):(\d+)(?![\d:])")
+_DECIMAL_RE = re.compile(r"(?<![\d.,])([-−]?)(\d+)[.,](\d+)(?![.,]?\d)")
+_INTEGER_RE = re.compile(rf"(?<![\d{_LETTER}])([-−](?=\d))?(\d+)")
+_SENTENCE_SPLIT_RE = re.compile(r"(?<=[.!?…])\s+")
+_SENTENCE_END_RE = re.compile(r"[.!?…]$")
+_ABBREVIATION_RES = [
+    (re.compile(rf"(?<![{_LETTER}]){pattern}", re.IGNORECASE), words)
+    for pattern, words in _ABBREVIATIONS
+]
+
+def plural_form(number: int, forms: Tuple[str, str, str]) -> str:
+    """Форма слова для числа: 1 рубль, 2 рубля, 5 рублей"""
+    number = abs(number) % 100
+    if 11 <= number <= 19:
+        return forms[2]
+    if number % 10 == 1:
+        return forms[0]
+    if 2 <= number % 10 <= 4:
+        return forms[1]
+    return forms[2]
+
+def _hundreds_to_words(number: int, feminine: bool) -> List[str]:
+    words = []
+    hundreds, rest = divmod(number, 100)
+    if hundreds:
+        words.append(_HUNDREDS[hundreds])
+    if 10 <= rest <= 19:
+        words.append(_TEENS[rest - 10])
+        return words
+    tens, ones = divmod(rest, 10)
+    if tens:
+        words.append(_TENS[tens])
+    if ones:
+        words.append(_ONES_FEMININE[ones] if feminine and ones <= 2 else _ONES[ones])
+    return words
+
+def number_to_words(number: int, feminine: bool = False) -> str:
+    """Целое число словами в именительном падеже (до триллиона, дальше — по цифрам)"""
+    if number < 0:
+        return "минус " + number_to_words(-number, feminine)
+    if number >= 10 ** 12:
+        return " ".join(_ONES[int(digit)] for digit in str(number))
+    if number == 0:
+        return _ONES[0]
+
+    words = []
+    for scale, forms, scale_feminine in _SCALES:
+        count, number = divmod(number, scale)
+        if count:
+            words.extend(_hundreds_to_words(count, scale_feminine))
+            words.append(plural_form(count, forms))
+    words.extend(_hundreds_to_words(number, feminine))
+    return " ".join(words)
+
+def decimal_to_words(integer: str, fraction: str) -> str:
+    """Десятичная дробь: «три целых пять десятых»; длинные дроби — по цифрам"""
+    whole = int(integer)
+    if len(fraction) > len(_FRACTIONS):
+        digits = " ".join(_ONES[int(digit)] for digit in fraction)
+        return f"{number_to_words(whole)} запятая {digits}"
+    numerator = int(fraction)
+    whole_words = f"{number_to_words(whole, feminine=True)} {plural_form(whole, ('целая', 'целых', 'целых'))}"
+    forms = _FRACTIONS[len(fraction) - 1]
+    fraction_words = f"{number_to_words(numerator, feminine=True)} {plural_form(numerator, (forms[0], forms[1], forms[1]))}"
+    return f"{whole_words} {fraction_words}"
+
+def _unit_key(unit: str) -> str:
+    unit = unit.rstrip(".")
+    if unit.startswith("°"):
+        return "°"
+    return unit
+
+def _quantity_to_words(sign: str, value: str, unit: Optional[str]) -> str:
+    """Число (целое или дробное) с необязательной единицей, согласованной по числу"""
+    forms, feminine = _UNITS.get(_unit_key(unit), (None, False)) if unit else (None, False)
+    prefix = "минус " if sign else ""
+    if "." in value or "," in value:
+        integer, fraction = re.split(r"[.,]", value, maxsplit=1)
+        words = decimal_to_words(integer, fraction)
+        # После дроби — родительный падеж единственного числа: «2,5 километра»
+        return prefix + (f"{words} {forms[1]}" if forms else words)
+    number = int(value)
+    words = number_to_words(number, feminine)
+    return prefix + (f"{words} {plural_form(number, forms)}" if forms else words)
+
+def _sentence_end_follows(text: str, position: int) -> bool:
+    """Стоит ли за позицией начало нового предложения (или конец текста)"""
+    rest = text[position:]
+    return not rest.strip() or bool(re.match(r"\s+[А-ЯЁA-Z]", rest))
+
+def _expand_units(text: str) -> str:
+    def replace(match: re.Match) -> str:
+        sign, value, unit = match.groups()
+        words = _quantity_to_words(sign, value, unit)
+        # Точка сокращения («100 руб.») может одновременно заканчивать предложение
+        if unit.endswith(".") and _sentence_end_follows(match.string, match.end()):
+            words += "."
+        return words
+    return _NUMBER_UNIT_RE.sub(replace, text)
+
+def _clock_part(value: str) -> str:
+    # Минуты и секунды: «05» — «ноль пять», «00» — «ноль ноль»
+    words = number_to_words(int(value), feminine=True)
+    if value.startswith("0"):
+        words = "ноль " + words if value != "00" else "ноль ноль"
+    return words
+
+def _expand_year(match: re.Match) -> str:
+    year, abbreviation = match.groups()
+    words = f"{number_to_words(int(year))} {'годы' if abbreviation == 'гг' else 'год'}"
+    # Точка сокращения не делит предложение, но может его заканчивать
+    if _sentence_end_follows(match.string, match.end()):
+        words += "."
+    return words
+
+def _expand_time(match: re.Match) -> str:
+    hours, minutes, seconds = match.groups()
+    words = f"{number_to_words(int(hours))} {_clock_part(minutes)}"
+    return f"{words} {_clock_part(seconds)}" if seconds else words
+
+def expand_numbers(text: str) -> str:
+    """Числа, время, проценты, валюты и единицы измерения — словами"""
+    text = _GROUPED_NUMBER_RE.sub(lambda m: re.sub(r"\D", "", m.group(0)), text)
+    text = _DOTTED_RE.sub(lambda m: m.group(0).replace(".", " "), text)
+    text = _CURRENCY_PREFIX_RE.sub(lambda m: f"{m.group(2)} {m.group(1)}", text)
+    text = _YEAR_RE.sub(_expand_year, text)
+    # Время и счёт раньше единиц: в «10:05 м» «05 м» — не метры
+    text = _TIME_RE.sub(_expand_time, text)
+    text = _RATIO_RE.sub(r"\1 — \2", text)
+    text = _expand_units(text)
+    text = _DECIMAL_RE.sub(lambda m: _quantity_to_words(m.group(1), f"{m.group(2)},{m.group(3)}", None), text)
+    return _INTEGER_RE.sub(lambda m: _quantity_to_words(m.group(1) or "", m.group(2), None), text)
+
+def _expand_abbreviation(match: re.Match, words: str) -> str:
+    # «См.» в начале предложения остаётся с заглавной
+    if match.group(0)[0].isupper():
+        words = words[0].upper() + words[1:]
+    # Точка сокращения может одновременно заканчивать предложение
+    if _sentence_end_follows(match.string, match.end()):
+        words += "."
+    return words
+
+def expand_abbreviations(text: str) -> str:
+    for pattern, words in _ABBREVIATION_RES:
+        text = pattern.sub(lambda m, w=words: _expand_abbreviation(m, w), text)
+    return text
+
+def _canonicalize(text: str) -> str:
+    """Разметка, кавычки, тире, многоточия и пробелы — к одному виду"""
+    text = unicodedata.normalize("NFC", text)
+    text = _MARKDOWN_LINK_RE.sub(r"\1", text)
+    text = _URL_RE.sub("", text)
+    text = _LIST_MARKER_RE.sub("", text)
+    text = _MARKUP_RE.sub("", text)
+
+    # Строка без знака в конце (пункт списка, заголовок) — отдельное предложение
+    lines = [line.strip() for line in text.splitlines()]
+    text = " ".join(
+        line if _SENTENCE_END_RE.search(line) or line.endswith((",", ":", ";")) else line + "."
+        for line in lines if line
+    )
+
+    text = _BRACKETS_RE.sub(r", \1,", text)
+    text = _DASH_RE.sub(" — ", text)
+    text = _ELLIPSIS_RE.sub("…", text)
+    text = _REPEATED_RE.sub(lambda m: m.group(1) or m.group(2), text)
+    return text
+
+def _tidy(text: str) -> str:
+    text = " ".join(text.split())
+    text = _SPACE_BEFORE_RE.sub(r"\1", text)
+    text = _SPACE_AFTER_RE.sub(lambda m: (m.group(1) or m.group(2)) + " ", text)
+    # Знаки, оставшиеся рядом после замен: «слово,.» → «слово.»
+    text = re.sub(r"[,;:]+([.!?…])", r"\1", text)
+    text = re.sub(r"([.!?…])[,;:]+", r"\1", text)
+    text = re.sub(r",{2,}", ",", text)
+    return text.strip(" ,;:")
+
+def normalize_text(text: str) -> str:
+    """Полная нормализация: разметка и пунктуация, числа, сокращения, пробелы"""
+    text = _canonicalize(text)
+    # Сначала числа с единицами: «5 см.» — сантиметры, а не «смотрите»
+    text = expand_numbers(text)
+    text = expand_abbreviations(text)
+    return _tidy(text)
+
+def split_sentences(text: str) -> List[str]:
+    """
+    Режет нормализованный текст на предложения. Каждое заканчивается
+    знаком препинания, чтобы «Привет» и «Привет.» давали один ключ кэша.
+    """
+    sentences = []
+    for sentence in _SENTENCE_SPLIT_RE.split(text):
+        sentence = sentence.strip(" ,;:—")
+        if not re.search(rf"[{_LETTER}]", sentence):
+            continue
+        if not _SENTENCE_END_RE.search(sentence):
+            sentence += "."
+        sentences.append(sentence)
+    return sentences
\ No newline at end of file
@@ -0,0 +1,147 @@
+# digital_avatar/tts-server/scheduler.py
+import time
+import queue
+import threading
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List
+
+class QueueFullError(Exception):
+    """Очередь синтеза переполнена — запрос нужно отклонить (429)"""
+
+@dataclass
+class Job:
+    key: str
+    text: str
+    payload: Any = None
+    future: Future = field(default_factory=Future)
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+class SynthesisScheduler:
+    """
+    Пул потоков инференса с ограниченной очередью и микробатчингом.
+
+    - submit() не блокируется: при переполнении очереди сразу QueueFullError
+    - одинаковые запросы (по ключу кэша) в полёте объединяются в один
+    - короткие тексты, пришедшие в пределах batch_window, отдаются
+      обработчику одной пачкой — только если включён батчинг (модель
+      синтезирует пачку одним вызовом); иначе каждое задание берёт
+      свободный воркер, и короткие тексты идут параллельно
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[List[Job]], List[Any]],
+        workers: int = 2,
+        queue_size: int = 32,
+        batch_window: float = 0.01,
+        batch_max_size: int = 8,
+        batch_max_chars: int = 120,
+        batching: bool = True
+    ):
+        self._handler = handler
+        self._workers = workers
+        self._queue: "queue.Queue[Job]" = queue.Queue(maxsize=queue_size)
+        self._batch_window = batch_window
+        self._batch_max_size = batch_max_size
+        self._batch_max_chars = batch_max_chars
+        self._batching = batching
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._threads: List[threading.Thread] = []
+
+    def start(self):
+        """Запускает потоки-обработчики (повторный вызов ничего не делает)"""
+        if self._threads:
+            return
+        for i in range(self._workers):
+            thread = threading.Thread(target=self._worker, name=f"tts-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, key: str, text: str, payload: Any = None) -> Future:
+        """Ставит синтез в очередь и возвращает Future с результатом обработчика"""
+        with self._lock:
+            existing = self._inflight.get(key)
+            if existing is not None:
+                return existing
+
+            job = Job(key=key, text=text, payload=payload)
+            try:
+                self._queue.put_nowait(job)
+            except queue.Full:
+                raise QueueFullError(f"TTS queue is full ({self._queue.maxsize} jobs)")
+
+            self._inflight[key] = job.future
+
+        job.future.add_done_callback(lambda _f, k=key: self._forget(k))
+        return job.future
+
+    def set_batching(self, enabled: bool):
+        """Включает сбор пачек (когда стало известно, умеет ли их модель)"""
+        self._batching = enabled
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def _forget(self, key: str):
+        with self._lock:
+            self._inflight.pop(key, None)
+
+    def _is_short(self, job: Job) -> bool:
+        return len(job.text) <= self._batch_max_chars
+
+    def _collect_batch(self, first: Job) -> List[List[Job]]:
+        """
+        Добирает короткие задания в течение окна. Длинное задание
+        возвращается в очередь свободному воркеру: выполняя его здесь же
+        после пачки, воркер сериализовал бы синтез.
+        """
+        if not self._batching or not self._is_short(first) or self._batch_max_size <= 1:
+            return [[first]]
+
+        batch = [first]
+        singles: List[List[Job]] = []
+        deadline = time.monotonic() + self._batch_window
+
+        while len(batch) < self._batch_max_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                job = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if self._is_short(job):
+                batch.append(job)
+                continue
+            try:
+                self._queue.put_nowait(job)
+            except queue.Full:
+                # Место заняли новые задания — выполняем сами, но не теряем
+                singles.append([job])
+            # Дальше не добираем, иначе снова вынем то же задание
+            break
+
+        return [batch] + singles
+
+    def _worker(self):
+        while True:
+            first = self._queue.get()
+            for batch in self._collect_batch(first):
+                self._run(batch)
+
+    def _run(self, batch: List[Job]):
+        # Future, отменённые до начала работы, пропускаем
+        batch = [job for job in batch if job.future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        try:
+            results = self._handler(batch)
+        except Exception as e:
+            for job in batch:
+                job.future.set_exception(e)
+            return
+        for job, result in zip(batch, results):
+            job.future.set_result(result)
@@ -1,93 +1,470 @@
 # digital_avatar/tts-server/server.py
 import os
 import time
+import asyncio
 import hashlib
+import inspect
+import threading
+from contextlib import asynccontextmanager
+from email.utils import formatdate
+from typing import Optional, Tuple
+
+import anyio
+import numpy as np
 import torch
 import soundfile as sf
-from flask import Flask, request, jsonify, send_from_directory
-from flask_cors import CORS
+from fastapi import FastAPI, Request
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 
-app = Flask(__name__)
-CORS(app)
+import audio_formats
+import lipsync
+import metrics
+import normalizer
+from cache import AudioCache
+from scheduler import SynthesisScheduler, QueueFullError
 
 CACHE_DIR = "./tts-cache"
-os.makedirs(CACHE_DIR, exist_ok=True)
 
-# Загрузка модели Silero
+# Кэш аудио: бюджет по размеру (по умолчанию 2 ГиБ) и необязательный TTL
+TTS_CACHE_MAX_BYTES = int(os.getenv("TTS_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))
+TTS_CACHE_TTL = float(os.getenv("TTS_CACHE_TTL", "0"))
+audio_cache = AudioCache(CACHE_DIR, max_bytes=TTS_CACHE_MAX_BYTES, ttl=TTS_CACHE_TTL)
+
+# Модель Silero загружается при старте из локального файла (torch.package),
+# без обращения к сети; torch.hub — только если это явно разрешено
+SILERO_MODEL_PATH = os.getenv("SILERO_MODEL_PATH", "./models/v3_1_ru.pt")
+TTS_ALLOW_DOWNLOAD = os.getenv("TTS_ALLOW_DOWNLOAD", "0").lower() in ("1", "true", "yes")
+# Пробный синтез перед тем, как сервис объявит себя готовым
+TTS_WARMUP_TEXT = os.getenv("TTS_WARMUP_TEXT", "Привет! Сервис синтеза речи готов к работе.")
+
 _model = None
 _device = torch.device('cpu')
 _speaker = 'aidar'  # Доступные голоса: aidar, baya, kseniya, xenia, eugene
 _sample_rate = 48000
 
+# Состояние запуска: starting → loading → warming_up → ready (или failed)
+_state = {"status": "starting", "error": None, "load_seconds": None, "warmup_seconds": None}
+
+# Параметры обслуживания: пул потоков инференса, очередь и микробатчинг
+TTS_WORKERS = int(os.getenv("TTS_WORKERS", "2"))
+TTS_TORCH_THREADS = int(os.getenv("TTS_TORCH_THREADS", str(max(1, (os.cpu_count() or 1) // TTS_WORKERS))))
+TTS_QUEUE_SIZE = int(os.getenv("TTS_QUEUE_SIZE", "32"))
+TTS_BATCH_WINDOW_MS = float(os.getenv("TTS_BATCH_WINDOW_MS", "10"))
+TTS_BATCH_MAX_SIZE = int(os.getenv("TTS_BATCH_MAX_SIZE", "8"))
+TTS_BATCH_MAX_CHARS = int(os.getenv("TTS_BATCH_MAX_CHARS", "120"))
+TTS_REQUEST_TIMEOUT = float(os.getenv("TTS_REQUEST_TIMEOUT", "60"))
+
+# Временная шкала открытия рта для lip-sync (шаг в мс, 0 — не считать)
+TTS_LIPSYNC_FRAME_MS = int(os.getenv("TTS_LIPSYNC_FRAME_MS", str(lipsync.DEFAULT_FRAME_MS)))
+
+# Пауза между предложениями при склейке клипа из закэшированных фрагментов
+TTS_SENTENCE_PAUSE_MS = int(os.getenv("TTS_SENTENCE_PAUSE_MS", "120"))
+
+# Размер куска при отдаче диапазона аудиофайла
+_AUDIO_CHUNK_SIZE = 64 * 1024
+
+def _load_model():
+    """Загружает Silero из локального чекпойнта (или через torch.hub, если разрешено)"""
+    if os.path.isfile(SILERO_MODEL_PATH):
+        from torch.package import PackageImporter
+        importer = PackageImporter(SILERO_MODEL_PATH)
+        model = importer.load_pickle("tts_models", "model")
+    elif TTS_ALLOW_DOWNLOAD:
+        print(f"Silero checkpoint {SILERO_MODEL_PATH} not found, downloading via torch.hub")
+        model, _ = torch.hub.load(
+            repo_or_dir='snakers4/silero-models',
+            model='silero_tts',
+            language='ru',
+            speaker='ru_v3',
+            trust_repo=True
+        )
+    else:
+        raise FileNotFoundError(f"Silero checkpoint not found: {SILERO_MODEL_PATH}")
+    model.to(_device)
+    return model
+
+def load_and_warm_up():
+    """
+    Загрузка модели и пробный синтез при старте (в отдельном потоке).
+    Первый синтез заметно медленнее последующих, поэтому его платит
+    сервис, а не первый пользователь.
+    """
+    global _model
+    try:
+        _state["status"] = "loading"
+        torch.set_num_threads(TTS_TORCH_THREADS)
+        started = time.monotonic()
+        model = _load_model()
+        _state["load_seconds"] = round(time.monotonic() - started, 2)
+        print(f"Silero TTS model loaded in {_state['load_seconds']}s")
+
+        _state["status"] = "warming_up"
+        started = time.monotonic()
+        with torch.no_grad():
+            model.apply_tts(text=TTS_WARMUP_TEXT, speaker=_speaker, sample_rate=_sample_rate)
+        _state["warmup_seconds"] = round(time.monotonic() - started, 2)
+        print(f"Silero TTS warmup took {_state['warmup_seconds']}s")
+
+        # Пачки имеют смысл, только если модель синтезирует их одним вызовом:
+        # иначе короткие тексты параллельнее на разных воркерах
+        scheduler.set_batching(_supports_batch(model))
+        _model = model
+        _state["status"] = "ready"
+    except Exception as e:
+        _state["status"] = "failed"
+        _state["error"] = str(e)
+        print(f"Error loading Silero TTS model: {e}")
+
 def get_model():
-    global _model, _sample_rate
-    if _model is None:
-        try:
-            print("Loading Silero TTS model...")
-            torch.set_num_threads(4)
-            _model, example_text = torch.hub.load(
-                repo_or_dir='snakers4/silero-models',
-                model='silero_tts',
-                language='ru',
-                speaker='ru_v3',
-                trust_repo=True
-            )
-            _model.to(_device)
-            print("Silero TTS model loaded successfully.")
-            return _model
-        except Exception as e:
-            print(f"Error loading Silero TTS model: {e}")
-            return None
     return _model
 
-@app.route("/health", methods=["GET"])
-def health():
+def _supports_batch(model) -> bool:
+    """Принимает ли apply_tts список текстов (модели v3 — только одну строку)"""
     try:
-        model = get_model()
-        if model is not None:
-            return jsonify({"status": "healthy", "model_loaded": True}), 200
+        return "texts" in inspect.signature(model.apply_tts).parameters
+    except (TypeError, ValueError):
+        return False
+
+def synthesize_batch(jobs):
+    """
+    Обработчик планировщика: синтезирует пачку текстов и пишет WAV-файлы.
+    Если модель умеет батчи, вся пачка уходит в один вызов apply_tts.
+    """
+    model = get_model()
+    if model is None:
+        raise RuntimeError("TTS model not loaded")
+
+    texts = [job.text for job in jobs]
+    print(f"Generating audio for {len(texts)} text(s)")
+
+    started = time.monotonic()
+    for job in jobs:
+        metrics.QUEUE_WAIT.observe(started - job.enqueued_at)
+    metrics.BATCH_SIZE.observe(len(jobs))
+
+    with torch.no_grad():
+        if len(texts) > 1 and _supports_batch(model):
+            audios = model.apply_tts(texts=texts, speaker=_speaker, sample_rate=_sample_rate)
         else:
-            return jsonify({"status": "unhealthy", "model_loaded": False}), 500
+            audios = [
+                model.apply_tts(text=text, speaker=_speaker, sample_rate=_sample_rate)
+                for text in texts
+            ]
+    metrics.SYNTHESIS.observe(time.monotonic() - started)
+
+    # Сохраняем аудио в кэш, рядом — временную шкалу для lip-sync
+    paths = []
+    for job, audio in zip(jobs, audios):
+        path = audio_cache.write(job.payload, lambda tmp, a=audio: sf.write(tmp, a, _sample_rate))
+        print(f"Audio saved to: {path}")
+        paths.append(path)
+        if TTS_LIPSYNC_FRAME_MS > 0:
+            timeline = lipsync.compute_timeline(audio.numpy(), _sample_rate, TTS_LIPSYNC_FRAME_MS)
+            audio_cache.write(
+                lipsync.lipsync_name(job.key),
+                lambda tmp, t=timeline: lipsync.write_timeline(tmp, t)
+            )
+
+    return paths
+
+scheduler = SynthesisScheduler(
+    synthesize_batch,
+    workers=TTS_WORKERS,
+    queue_size=TTS_QUEUE_SIZE,
+    batch_window=TTS_BATCH_WINDOW_MS / 1000,
+    batch_max_size=TTS_BATCH_MAX_SIZE,
+    batch_max_chars=TTS_BATCH_MAX_CHARS,
+    batching=False
+)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Индекс кэша и пул инференса — сразу, модель — в фоне (liveness отвечает с первой секунды)"""
+    audio_cache.load_index()
+    scheduler.start()
+    threading.Thread(target=load_and_warm_up, name="tts-model-loader", daemon=True).start()
+    yield
+
+app = FastAPI(title="Digital Avatar TTS", lifespan=lifespan)
+app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])
+
+# Метрики Prometheus: задержки запросов, очередь, инференс, кэш (GET /metrics)
+metrics.init_app(app, lambda: scheduler.queue_depth)
+
+def _error(message: str, status_code: int, headers: Optional[dict] = None) -> JSONResponse:
+    return JSONResponse({"error": message}, status_code=status_code, headers=headers)
+
+def _readiness():
+    ready = _state["status"] == "ready"
+    body = dict(_state, model_loaded=_model is not None, queue_depth=scheduler.queue_depth)
+    return body, 200 if ready else 503
+
+@app.get("/health/live")
+async def health_live():
+    # Процесс жив и обслуживает запросы (модель может ещё загружаться)
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+async def health_ready():
+    # Готов к синтезу: модель загружена и прогрета
+    body, status_code = _readiness()
+    return JSONResponse(body, status_code=status_code)
+
+@app.get("/health")
+async def health():
+    # Совместимость с бэкендом: 200 только когда сервис готов к синтезу
+    body, status_code = _readiness()
+    body["status"] = "healthy" if status_code == 200 else body["status"]
+    return JSONResponse(body, status_code=status_code)
+
+def ensure_variant(key: str, fmt: str, sample_rate: int) -> str:
+    """
+    Возвращает имя файла нужного формата, перекодируя исходный WAV
+    при первом обращении. Варианты кэшируются рядом с исходником.
+    """
+    name = audio_formats.variant_name(key, fmt, sample_rate, _sample_rate)
+    if audio_cache.get(name) is None:
+        source_path = audio_cache.path(f"{key}.wav")
+        with metrics.ENCODE.time():
+            audio_cache.write(name, lambda tmp: audio_formats.encode(source_path, tmp, fmt, sample_rate))
+    return name
+
+def ensure_lipsync(key: str):
+    """Временная шкала из кэша; для старых записей считается по WAV один раз"""
+    if TTS_LIPSYNC_FRAME_MS <= 0:
+        return None
+    name = lipsync.lipsync_name(key)
+    path = audio_cache.get(name)
+    if path is None:
+        source_path = audio_cache.path(f"{key}.wav")
+        timeline = lipsync.timeline_from_file(source_path, TTS_LIPSYNC_FRAME_MS)
+        path = audio_cache.write(name, lambda tmp: lipsync.write_timeline(tmp, timeline))
+        return timeline
+    return lipsync.read_timeline(path)
+
+def _sentence_key(sentence: str) -> str:
+    return hashlib.sha256(f"silero|{_speaker}|{sentence}".encode("utf-8")).hexdigest()
+
+def _clip_key(keys) -> str:
+    """Ключ клипа: у одного предложения совпадает с ключом фрагмента"""
+    if len(keys) == 1:
+        return keys[0]
+    joined = "|".join(keys)
+    return hashlib.sha256(f"clip|{TTS_SENTENCE_PAUSE_MS}|{joined}".encode("utf-8")).hexdigest()
+
+def concatenate_segments(clip_key: str, keys) -> str:
+    """Склеивает WAV предложений в один клип с короткими паузами между ними"""
+    pause = np.zeros(int(_sample_rate * TTS_SENTENCE_PAUSE_MS / 1000), dtype=np.float32)
+    parts = []
+    for index, key in enumerate(keys):
+        data, _ = sf.read(audio_cache.path(f"{key}.wav"), dtype="float32")
+        if index:
+            parts.append(pause)
+        parts.append(data)
+    audio = np.concatenate(parts)
+    return audio_cache.write(f"{clip_key}.wav", lambda tmp: sf.write(tmp, audio, _sample_rate))
+
+async def _synthesize_missing(sentences, keys) -> Optional[JSONResponse]:
+    """
+    Ставит в очередь предложения, которых нет в кэше, и ждёт их все.
+    Одинаковые предложения из разных ответов синтезируются один раз.
+    """
+    futures = []
+    for sentence, key in zip(sentences, keys):
+        cached = audio_cache.get(f"{key}.wav") is not None
+        metrics.CACHE_LOOKUPS.labels("hit" if cached else "miss").inc()
+        if cached:
+            continue
+        if _model is None:
+            return _error("TTS model is loading", 503, {"Retry-After": "5"})
+        try:
+            futures.append(scheduler.submit(key, sentence, payload=f"{key}.wav"))
+        except QueueFullError as e:
+            # Перегрузка: быстрый отказ вместо бесконечной очереди
+            return _error(str(e), 429, {"Retry-After": "1"})
+
+    if not futures:
+        return None
+
+    # Синтез идёт в пуле планировщика; event loop свободен для попаданий
+    # в кэш и /audio. shield: одинаковые запросы делят одну задачу, и отказ
+    # одного клиента не должен её отменять
+    waiting = asyncio.gather(*(asyncio.wrap_future(future) for future in futures))
+    try:
+        await asyncio.wait_for(asyncio.shield(waiting), TTS_REQUEST_TIMEOUT)
+    except asyncio.TimeoutError:
+        # Задания не отменяются и продолжают работу: повтор попадёт в кэш
+        # или присоединится к ним. Это перегрузка, а не отказ сервиса (не 5xx,
+        # иначе бэкенд разомкнёт размыкатель)
+        return _error("TTS generation timed out", 429, {"Retry-After": "1"})
     except Exception as e:
-        return jsonify({"status": "error", "error": str(e)}), 500
+        print(f"TTS generation error: {e}")
+        return _error(f"TTS generation failed: {str(e)}", 500)
+    return None
 
-@app.route("/tts", methods=["POST"])
-def tts():
-    data = request.get_json(force=True)
-    text = data.get("text", "").strip()
+@app.post("/tts")
+async def tts(request: Request):
+    try:
+        data = await request.json()
+    except ValueError:
+        return _error("invalid JSON body", 400)
+    if not isinstance(data, dict):
+        return _error("JSON object expected", 400)
+    text = str(data.get("text") or "").strip()
     if not text:
-        return jsonify({"error": "text is required"}), 400
+        return _error("text is required", 400)
+
+    # Формат и частота результата (по умолчанию — исходный WAV 48 кГц)
+    fmt = str(data.get("format") or "wav").lower()
+    try:
+        sample_rate = int(data.get("sample_rate") or _sample_rate)
+    except (TypeError, ValueError):
+        return _error("sample_rate must be an integer", 400)
+    error = audio_formats.validate(fmt, sample_rate)
+    if error:
+        return _error(error, 400)
+
+    # Нормализованный текст режется на предложения, и аудио кэшируется
+    # по предложениям: «Привет!» в начале разных ответов синтезируется один раз
+    sentences = normalizer.split_sentences(normalizer.normalize_text(text))
+    if not sentences:
+        return _error("text has nothing to pronounce", 400)
+    keys = [_sentence_key(sentence) for sentence in sentences]
+    key = _clip_key(keys)
 
-    key = hashlib.sha256(f"silero|{_speaker}|{text}".encode("utf-8")).hexdigest()
-    wav_name = f"{key}.wav"
-    wav_path = os.path.join(CACHE_DIR, wav_name)
+    # Фрагменты и клип закреплены до конца сборки (включая шкалу lip-sync,
+    # которая читает WAV клипа): иначе их могли бы вытеснить между синтезом
+    # и чтением
+    pinned = [f"{segment_key}.wav" for segment_key in keys] + [f"{key}.wav", lipsync.lipsync_name(key)]
+    with audio_cache.pinned(pinned):
+        if len(keys) == 1 or audio_cache.get(f"{key}.wav") is None:
+            error_response = await _synthesize_missing(sentences, keys)
+            if error_response is not None:
+                return error_response
+            if len(keys) > 1:
+                try:
+                    await run_in_threadpool(concatenate_segments, key, keys)
+                except Exception as e:
+                    print(f"Audio concatenation error: {e}")
+                    return _error(f"Audio concatenation failed: {str(e)}", 500)
+        else:
+            metrics.CACHE_LOOKUPS.labels("hit").inc()
 
-    if not os.path.exists(wav_path):
         try:
-            model = get_model()
-            if model is None:
-                return jsonify({"error": "TTS model not loaded"}), 500
-                
-            print(f"Generating audio for text: {text}")
-            audio = model.apply_tts(
-                text=text,
-                speaker=_speaker,
-                sample_rate=_sample_rate
-            )
-            
-            # Сохраняем аудио в файл
-            sf.write(wav_path, audio, _sample_rate)
-            print(f"Audio saved to: {wav_path}")
-            
+            audio_name = await run_in_threadpool(ensure_variant, key, fmt, sample_rate)
         except Exception as e:
-            print(f"TTS generation error: {e}")
-            return jsonify({"error": f"TTS generation failed: {str(e)}"}), 500
+            print(f"Audio encoding error: {e}")
+            return _error(f"Audio encoding failed: {str(e)}", 500)
 
-    return jsonify({"audio_url": f"/audio/{wav_name}"}), 200
+        # Шкала не обязательна для воспроизведения: ошибка не ломает ответ
+        try:
+            timeline = await run_in_threadpool(ensure_lipsync, key)
+        except Exception as e:
+            print(f"Lipsync timeline error: {e}")
+            timeline = None
+
+    result = {"audio_url": f"/audio/{audio_name}", "lipsync": timeline}
+    if len(keys) > 1:
+        # Фрагменты по предложениям: клиент может начать воспроизведение
+        # с первого, не дожидаясь скачивания всего клипа
+        result["segments"] = [
+            {
+                "text": sentence,
+                "audio_url": f"/audio/{audio_formats.variant_name(segment_key, fmt, sample_rate, _sample_rate)}"
+            }
+            for sentence, segment_key in zip(sentences, keys)
+        ]
+    return result
+
+def _parse_range(range_header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Разбирает одиночный диапазон 'bytes=start-end' (включительно)"""
+    units, _, spec = range_header.partition("=")
+    if units.strip() != "bytes" or "," in spec:
+        return None
+    start_text, _, end_text = spec.strip().partition("-")
+    try:
+        if start_text:
+            start = int(start_text)
+            end = int(end_text) if end_text else size - 1
+        else:
+            start = max(0, size - int(end_text))
+            end = size - 1
+    except ValueError:
+        return None
+    end = min(end, size - 1)
+    if start > end or start >= size:
+        return None
+    return start, end
+
+async def _iter_file(path: str, start: int, length: int):
+    async with await anyio.open_file(path, "rb") as f:
+        await f.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = await f.read(min(_AUDIO_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+def _file_response(path: str, mimetype: Optional[str], request: Request) -> Response:
+    """Отдаёт файл с поддержкой условных запросов (304) и Range (206)"""
+    stat = os.stat(path)
+    etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+    headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(stat.st_mtime, usegmt=True),
+        "Accept-Ranges": "bytes"
+    }
+
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (if_range is None or if_range == etag):
+        byte_range = _parse_range(range_header, stat.st_size)
+        if byte_range is None:
+            return Response(status_code=416, headers={"Content-Range": f"bytes */{stat.st_size}"})
+        start, end = byte_range
+        length = end - start + 1
+        headers["Content-Range"] = f"bytes {start}-{end}/{stat.st_size}"
+        headers["Content-Length"] = str(length)
+        return StreamingResponse(_iter_file(path, start, length), status_code=206, media_type=mimetype, headers=headers)
+
+    return FileResponse(path, media_type=mimetype, headers=headers, stat_result=stat)
+
+@app.get("/audio/{filename:path}")
+async def audio(filename: str, request: Request):
+    # Отдаём только то, что есть в индексе кэша (заодно обновляем LRU);
+    # имя из индекса не может указывать за пределы каталога кэша
+    if not audio_cache.touch(filename):
+        # Вариант другого формата перекодируется по требованию из исходного WAV
+        variant = audio_formats.parse_variant_name(filename)
+        if variant is None or not audio_cache.touch(f"{variant[0]}.wav"):
+            return _error("audio not found", 404)
+        key, sample_rate, fmt = variant
+        if audio_formats.validate(fmt, sample_rate):
+            return _error("unsupported audio variant", 400)
+        try:
+            await run_in_threadpool(ensure_variant, key, fmt, sample_rate)
+        except Exception as e:
+            print(f"Audio encoding error: {e}")
+            return _error(f"Audio encoding failed: {str(e)}", 500)
+
+    mimetype = audio_formats.FORMATS.get(filename.rsplit(".", 1)[-1], (None, None, None))[2]
+    try:
+        return _file_response(audio_cache.path(filename), mimetype, request)
+    except FileNotFoundError:
+        # Файл вытеснен из кэша между проверкой и отдачей
+        return _error("audio not found", 404)
 
-@app.route("/audio/<path:filename>")
-def audio(filename):
-    return send_from_directory(CACHE_DIR, filename, as_attachment=False)
+@app.get("/cache/stats")
+async def cache_stats():
+    return audio_cache.stats()
 
 if __name__ == "__main__":
-    app.run(host=os.getenv("HOST", "0.0.0.0"), port=int(os.getenv("PORT", "5002")))
\ No newline at end of file
+    import uvicorn
+    uvicorn.run(app, host=os.getenv("HOST", "0.0.0.0"), port=int(os.getenv("PORT", "5002")))
\ No newline at end of file
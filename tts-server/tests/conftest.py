@@ -0,0 +1,6 @@
+# digital_avatar/tts-server/tests/conftest.py
+import os
+import sys
+
+# Модули сервера импортируются по имени, как при запуске из каталога tts-server
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
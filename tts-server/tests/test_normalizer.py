@@ -0,0 +1,25 @@
+# digital_avatar/tts-server/tests/test_normalizer.py
+from normalizer import normalize_text, split_sentences
+
+def _sentences(text):
+    return split_sentences(normalize_text(text))
+
+def test_year_abbreviation_does_not_split_sentence():
+    assert _sentences("в 2024 г. было холодно") == ["в две тысячи двадцать четыре год было холодно."]
+    assert _sentences("С 2020 по 2022 гг. цены росли.") == [
+        "С две тысячи двадцать по две тысячи двадцать два годы цены росли."
+    ]
+
+def test_year_abbreviation_can_end_sentence():
+    assert _sentences("Это было в 1990 г. Потом всё изменилось.") == [
+        "Это было в одна тысяча девятьсот девяносто год.",
+        "Потом всё изменилось."
+    ]
+
+def test_common_abbreviations_keep_sentence_whole():
+    assert _sentences("Ручки, карандаши и т. п. лежат тут.") == ["Ручки, карандаши и тому подобное лежат тут."]
+    assert _sentences("Яблоки, груши и т.д. Потом ещё.") == ["Яблоки, груши и так далее.", "Потом ещё."]
+
+def test_time_is_not_read_as_units():
+    assert normalize_text("Встреча в 10:05 м") == "Встреча в десять ноль пять м."
+    assert normalize_text("Счёт 2:1") == "Счёт два — один."
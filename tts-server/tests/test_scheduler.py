@@ -0,0 +1,42 @@
+# digital_avatar/tts-server/tests/test_scheduler.py
+import time
+import threading
+
+from scheduler import SynthesisScheduler
+
+def _recording_handler(delay: float):
+    calls = []
+    lock = threading.Lock()
+
+    def handler(jobs):
+        with lock:
+            calls.append((threading.current_thread().name, [job.key for job in jobs]))
+        time.sleep(delay)
+        return [job.key for job in jobs]
+
+    return handler, calls
+
+def test_short_jobs_run_in_parallel_without_batching():
+    workers, delay = 4, 0.3
+    handler, calls = _recording_handler(delay)
+    scheduler = SynthesisScheduler(handler, workers=workers, batch_window=0.05, batching=False)
+    futures = [scheduler.submit(f"k{i}", "коротко") for i in range(workers)]
+
+    started = time.monotonic()
+    scheduler.start()
+    assert [future.result(timeout=5) for future in futures] == [f"k{i}" for i in range(workers)]
+    elapsed = time.monotonic() - started
+
+    # Каждое задание — отдельный вызов на своём воркере, все одновременно
+    assert all(len(keys) == 1 for _, keys in calls)
+    assert len({thread for thread, _ in calls}) == workers
+    assert elapsed < delay * 2
+
+def test_short_jobs_are_batched_when_supported():
+    handler, calls = _recording_handler(0.01)
+    scheduler = SynthesisScheduler(handler, workers=1, batch_window=0.05, batching=True)
+    futures = [scheduler.submit(f"k{i}", "коротко") for i in range(3)]
+    scheduler.start()
+    for future in futures:
+        future.result(timeout=5)
+    assert calls[0][1] == ["k0", "k1", "k2"]